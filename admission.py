@@ -0,0 +1,143 @@
+import threading
+import time
+
+# Controle de admissão: em pico de acesso (ex: divulgação da lista no grupo)
+# o checkout não pode esperar na mesma fila que as visitas à loja.
+#
+# Cada processo mede a própria carga com três sinais, todos baratos:
+#
+# 1. Requisições em andamento / threads do worker.
+# 2. Ocupação do pool de conexões do banco: o checkout só espera por conexão
+#    quando o pool está cheio.
+# 3. Latência recente do checkout (média móvel exponencial) comparada com a
+#    meta: sobe antes dos outros dois quando o banco está lento. Só as rotas
+#    de LATENCY_SIGNAL alimentam a média; sem checkout ela cai pela metade a
+#    cada LATENCY_HALF_LIFE segundos.
+#
+# A pressão é o maior dos três (0 = ocioso, 1 = no limite). Cada prioridade
+# só entra abaixo do seu teto; acima dele a requisição é recusada na hora,
+# sem ocupar banco nem thread, e quem a recusou decide a resposta (página em
+# cache da loja, 503 com Retry-After).
+
+CRITICAL, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = {CRITICAL: 'critical', NORMAL: 'normal', LOW: 'low'}
+
+# Endpoint -> prioridade; o que não estiver aqui é NORMAL
+PRIORITIES = {
+    # Checkout e o que ele consulta durante a compra; sondagens também,
+    # senão o balanceador tiraria o worker de circulação justo no pico
+    'save_order': CRITICAL,
+    'api_stock': CRITICAL,
+    'api_delivery_slots': CRITICAL,
+    # Categorias da loja carregadas na rolagem: a página da loja servida do
+    # cache na sobrecarga depende delas (e quase sempre saem do cache)
+    'category_fragment': CRITICAL,
+    'health_check': CRITICAL,
+    'readiness_check': CRITICAL,
+    'metrics_endpoint': CRITICAL,
+    # Telas pesadas do admin, que podem esperar o pico passar
+    'admin_reports': LOW,
+    'admin_orders_print': LOW,
+    'admin_routes': LOW,
+    'admin_customers': LOW,
+    'admin_customer_detail': LOW,
+    'admin_job_download': LOW,
+}
+
+# Rotas cuja latência mede a pressão. Sondagens e fragmentos em cache também
+# são CRITICAL, mas respondem em microssegundos e esconderiam a lentidão
+LATENCY_SIGNAL = {'save_order'}
+
+# Conexões longas com limite próprio (feed ao vivo): não entram na contagem
+EXEMPT = {'admin_events'}
+
+# Pressão máxima em que cada prioridade ainda é atendida
+THRESHOLDS = {CRITICAL: float('inf'), NORMAL: 0.75, LOW: 0.5}
+
+
+def priority_for(endpoint):
+    return PRIORITIES.get(endpoint, NORMAL)
+
+
+LATENCY_HALF_LIFE = 10.0
+
+
+class AdmissionController:
+    def __init__(self, capacity, latency_target, thresholds=THRESHOLDS, smoothing=0.2, half_life=LATENCY_HALF_LIFE):
+        self.capacity = max(1, capacity)
+        self.latency_target = latency_target
+        self.thresholds = thresholds
+        self.smoothing = smoothing
+        self.half_life = half_life
+        self.in_flight = 0
+        self._latency = 0.0
+        self._latency_at = time.perf_counter()
+        self.shed = {priority: 0 for priority in thresholds}
+        self._lock = threading.Lock()
+
+    @property
+    def latency(self):
+        # Média do checkout, esvaziando com o tempo desde a última amostra
+        age = time.perf_counter() - self._latency_at
+        return self._latency * 0.5 ** (age / self.half_life)
+
+    def pressure(self, pool_saturation=None):
+        signals = [self.in_flight / self.capacity, self.latency / self.latency_target]
+        if pool_saturation is not None:
+            signals.append(pool_saturation)
+        return max(signals)
+
+    def admit(self, priority, pool_saturation=None):
+        # Devolve o instante de entrada (para release) ou None se recusou
+        with self._lock:
+            if self.pressure(pool_saturation) >= self.thresholds[priority]:
+                self.shed[priority] += 1
+                return None
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def release(self, started_at, measure_latency=False):
+        now = time.perf_counter()
+        with self._lock:
+            self.in_flight -= 1
+            if measure_latency:
+                latency = self.latency
+                self._latency = latency + self.smoothing * (now - started_at - latency)
+                self._latency_at = now
+
+    def stats(self, pool_saturation=None):
+        return {
+            'in_flight': self.in_flight,
+            'capacity': self.capacity,
+            'checkout_latency_ms': round(self.latency * 1000, 1),
+            'pressure': round(self.pressure(pool_saturation), 3),
+            'shed': {PRIORITY_NAMES[priority]: count for priority, count in self.shed.items()},
+        }
+
+
+class ClientRateLimiter:
+    # Token bucket por cliente (IP): até `rate` requisições por `per` segundos,
+    # sem esperar — quem passa do limite é recusado na hora
+    def __init__(self, rate, per=60.0, max_clients=10000):
+        self.rate = rate
+        self.per = per
+        self.capacity = max(1.0, float(rate))
+        self.max_clients = max_clients
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.max_clients:
+                # Descarta quem já recuperou o balde inteiro: não muda nenhuma decisão
+                full_after = self.capacity * self.per / self.rate
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate / self.per)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+    def retry_after(self):
+        return max(1, int(self.per / self.rate))
@@ -1,8 +1,46 @@
-from flask import Flask, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, Response, request, redirect, url_for, flash, session, jsonify, g, has_request_context, abort, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, insert
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import contains_eager, joinedload, subqueryload
+from markupsafe import escape
+import click
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import contextvars
+import csv
+import functools
+import io
+import json
 import os
+import random
+import re
+import select
+import sqlite3
+import threading
+import time
+import traceback
+import unicodedata
+import uuid
+from types import SimpleNamespace
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from metrics import Metrics
+import admission
+import forecasting
+import images
+import order_payload
+import live_feed
+import notifications
+import routing
+import structured_logging
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'em-casa-hortifruti-railway-secret-key-2024')
@@ -16,8 +54,89 @@ if database_url:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hortifruti.db'
 
+# Réplica somente leitura (opcional) para relatórios e telas de consulta do admin
+replica_url = os.environ.get('DATABASE_REPLICA_URL')
+if replica_url:
+    if replica_url.startswith('postgres://'):
+        replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+    replica_options = {'url': replica_url}
+    if replica_url.startswith('postgresql'):
+        # Garantia extra: nenhuma escrita passa pela réplica por engano
+        replica_options['connect_args'] = {'options': '-c default_transaction_read_only=on'}
+    app.config['SQLALCHEMY_BINDS'] = {'replica': replica_options}
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_CHECK_SECONDS = float(os.environ.get('REPLICA_CHECK_SECONDS', '5'))
+
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Teto de qualquer corpo de requisição (o maior é o upload da foto do produto);
+# o checkout tem um limite próprio bem menor, MAX_ORDER_BYTES
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', str(12 * 1024 * 1024)))
+
+# Detector de N+1: ligado por padrão fora do Railway (desenvolvimento)
+app.config['DETECT_N_PLUS_ONE'] = os.environ.get(
+    'DETECT_N_PLUS_ONE', '0' if os.environ.get('RAILWAY_ENVIRONMENT') else '1'
+) == '1'
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '3'))
+
+# Atrás do proxy do Railway o IP do cliente vem no X-Forwarded-For; sem isso
+# request.remote_addr seria o do proxy e o limite por IP valeria para todos
+PROXY_COUNT = int(os.environ.get('PROXY_COUNT', '1' if os.environ.get('RAILWAY_ENVIRONMENT') else '0'))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT, x_proto=PROXY_COUNT)
+
+# Log estruturado (structured_logging.py): JSON no Railway, texto no desenvolvimento
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json' if os.environ.get('RAILWAY_ENVIRONMENT') else 'text')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SLOW_MS = float(os.environ.get('LOG_SLOW_MS', '1000'))
+# Fração das requisições registradas por rota (endpoint=fração); erros e
+# requisições lentas são sempre registrados
+LOG_SAMPLE_RATES = {
+    'api_stock': 0.05,
+    'api_delivery_slots': 0.05,
+    'product_image': 0.0,
+    'static': 0.0,
+    'health_check': 0.0,
+    'readiness_check': 0.0,
+    'metrics_endpoint': 0.0,
+}
+for rule in filter(None, os.environ.get('LOG_SAMPLE_RATES', '').split(',')):
+    endpoint, _, rate = rule.partition('=')
+    LOG_SAMPLE_RATES[endpoint.strip()] = float(rate)
+
+def log_context():
+    # Anexado a toda linha de log emitida durante uma requisição
+    if not has_request_context():
+        return None
+    return {
+        'request_id': g.get('request_id'),
+        'method': request.method,
+        'route': request.url_rule.rule if request.url_rule else request.path,
+    }
+
+structured_logging.configure(app.logger, level=LOG_LEVEL, fmt=LOG_FORMAT, context=log_context)
+_read_replica = contextvars.ContextVar('read_replica', default=False)
+
+class RoutingSession(FlaskSession):
+    # Dentro de use_read_replica(), leituras vão para a réplica (se estiver
+    # configurada e em dia); flush, INSERT/UPDATE/DELETE sempre vão ao primário
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _read_replica.get() and not self._flushing and not isinstance(clause, UpdateBase):
+            engine = replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    # SQLite em modo WAL: leituras não bloqueiam escritas (ex: uma tarefa em
+    # segundo plano gravando o progresso enquanto lê os pedidos)
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
 
 # Modelos do banco de dados
 class Admin(db.Model):
@@ -39,7 +158,9 @@ class Product(db.Model):
     unit = db.Column(db.String(50), nullable=False)
     is_organic = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
+    image_key = db.Column(db.String(32))  # miniaturas prontas em MEDIA_DIR/products (images.py)
+    image_widths = db.Column(db.String(50))  # ex: "160,320,640"
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class WeeklyList(db.Model):
@@ -48,6 +169,12 @@ class WeeklyList(db.Model):
     week_end = db.Column(db.Date, nullable=False)
     is_active = db.Column(db.Boolean, default=False)
     is_closed = db.Column(db.Boolean, default=False)
+    # Abertura e encerramento programados, no horário da loja (sem fuso)
+    opens_at = db.Column(db.DateTime)
+    closes_at = db.Column(db.DateTime)
+    opened_at = db.Column(db.DateTime)  # quando a lista passou a ser a ativa
+    closed_at = db.Column(db.DateTime)  # totais gravados em WeeklyListSummary
+    archived_at = db.Column(db.DateTime)  # pedidos movidos para as tabelas de arquivo
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     products = db.relationship('WeeklyProduct', backref='weekly_list', lazy=True)
 
@@ -55,7 +182,39 @@ class WeeklyProduct(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    stock = db.Column(db.Float)  # quantidade ainda disponível; None = sem limite
+    # Cópia do produto no dia em que a lista foi criada: editar o catálogo
+    # não muda o que a loja aberta mostra nem o histórico das semanas
+    name = db.Column(db.String(200))
+    unit = db.Column(db.String(50))
+    price = db.Column(db.Float)
+    is_organic = db.Column(db.Boolean)
     product = db.relationship('Product', backref='weekly_products')
+    # Checkout (reserve_stock), estoque e produtos da loja buscam por lista + produto
+    __table_args__ = (db.Index('ix_weekly_product_list_product', 'weekly_list_id', 'product_id', unique=True),)
+
+class DeliverySlot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), nullable=False, index=True)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    ends_at = db.Column(db.DateTime, nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    claimed = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    delivery_fee = db.Column(db.Float, nullable=False, default=10.0)
+    
+    @property
+    def label(self):
+        return format_slot_label(self.starts_at, self.ends_at)
+
+class Customer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), unique=True, nullable=False)  # normalizado: DDD + número
+    name = db.Column(db.String(200), nullable=False)
+    delivery_address = db.Column(db.String(500))
+    order_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_spent = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    last_order_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -64,23 +223,127 @@ class Order(db.Model):
     delivery_address = db.Column(db.String(500))
     delivery_fee = db.Column(db.Float, default=0)
     total_amount = db.Column(db.Float, nullable=False)
-    weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), nullable=False)
+    weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), nullable=False, index=True)
+    delivery_slot_id = db.Column(db.Integer, db.ForeignKey('delivery_slot.id'), index=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     items = db.relationship('OrderItem', backref='order', lazy=True)
+    delivery_slot = db.relationship('DeliverySlot')
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_name = db.Column(db.String(200))  # como estava na lista da semana
+    unit = db.Column(db.String(50))
+    is_organic = db.Column(db.Boolean)
     quantity = db.Column(db.Float, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     product = db.relationship('Product', backref='order_items')
 
+# Arquivo: pedidos de listas antigas saem de order/order_item (que ficam
+# pequenas) e vêm para cá com os mesmos ids, junto com totais por lista
+class ArchivedOrder(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_name = db.Column(db.String(200), nullable=False)
+    customer_phone = db.Column(db.String(20))
+    delivery_address = db.Column(db.String(500))
+    delivery_fee = db.Column(db.Float, default=0)
+    total_amount = db.Column(db.Float, nullable=False)
+    weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), nullable=False, index=True)
+    delivery_slot_id = db.Column(db.Integer, db.ForeignKey('delivery_slot.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), index=True)
+    created_at = db.Column(db.DateTime)
+    items = db.relationship('ArchivedOrderItem', backref='order', lazy=True)
+    delivery_slot = db.relationship('DeliverySlot')
+
+class ArchivedOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_name = db.Column(db.String(200))
+    unit = db.Column(db.String(50))
+    is_organic = db.Column(db.Boolean)
+    quantity = db.Column(db.Float, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)
+    total_price = db.Column(db.Float, nullable=False)
+    product = db.relationship('Product')
+
+class WeeklyListSummary(db.Model):
+    # Totais finais da semana (com WeeklyProductSales), gravados quando a lista
+    # é encerrada ou arquivada; semana com resumo não é mais somada pelos pedidos
+    weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), primary_key=True, autoincrement=False)
+    order_count = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+    delivery_fees = db.Column(db.Float, nullable=False)
+    frozen_at = db.Column('archived_at', db.DateTime, nullable=False)  # nome antigo da coluna no banco
+
+class WeeklyProductSales(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    weekly_list_id = db.Column(db.Integer, db.ForeignKey('weekly_list.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_name = db.Column(db.String(200))
+    unit = db.Column(db.String(50))
+    quantity = db.Column(db.Float, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+    product = db.relationship('Product')
+
+class Notification(db.Model):
+    # Caixa de saída: gravada na transação do pedido, enviada em segundo plano
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer)
+    channel = db.Column(db.String(20), nullable=False)  # whatsapp, email
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', server_default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_notification_due', 'status', 'next_attempt_at'),)
+
+class Job(db.Model):
+    # Tarefa em segundo plano (relatórios, exportações, manutenção)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued', server_default='queued')  # queued, running, succeeded, failed, cancelled
+    progress = db.Column(db.Float, nullable=False, default=0, server_default='0')  # 0 a 1
+    message = db.Column(db.String(200))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    result = db.Column(db.Text)  # JSON com o resumo
+    output = db.Column(db.Text)  # arquivo gerado (ex: CSV)
+    output_name = db.Column(db.String(200))
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_job_status', 'status', 'id'),)
+
+class GeoLocation(db.Model):
+    # Tabela local de geocodificação (CEP ou bairro -> coordenadas)
+    id = db.Column(db.Integer, primary_key=True)
+    cep = db.Column(db.String(8), unique=True)  # só dígitos
+    neighborhood = db.Column(db.String(100))
+    city = db.Column(db.String(100))
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+
 # Funções auxiliares
 def init_db():
     try:
         db.create_all()
+        upgrade_schema()
+        ensure_indexes()
+        backfill_snapshots()
+        backfill_opened_at()
+        backfill_list_totals()
+        setup_product_search()
         
         # Criar admin padrão se não existir
         if not Admin.query.first():
@@ -137,15 +400,1462 @@ def init_db():
                     db.session.add(product)
         
         db.session.commit()
-        print("✅ Banco de dados inicializado com sucesso!")
+        app.logger.info('Banco de dados inicializado')
         
-    except Exception as e:
-        print(f"❌ Erro ao inicializar banco: {e}")
+    except Exception:
+        app.logger.exception('Erro ao inicializar o banco de dados')
         db.session.rollback()
 
+def upgrade_schema():
+    # create_all() não adiciona colunas novas em tabelas que já existem
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                default = ''
+                if column.server_default is not None:
+                    default = f" DEFAULT {column.server_default.arg}"
+                conn.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{default}'))
+                app.logger.info('Coluna %s.%s adicionada', table.name, column.name)
+
+def backfill_opened_at():
+    # Listas criadas antes da abertura programada entraram no ar ao serem criadas
+    with db.engine.begin() as conn:
+        conn.execute(db.update(WeeklyList).where(
+            WeeklyList.opened_at.is_(None), WeeklyList.opens_at.is_(None)
+        ).values(opened_at=db.func.coalesce(WeeklyList.created_at, WeeklyList.week_start)))
+
+def backfill_list_totals():
+    # Listas encerradas antes dos resumos no encerramento
+    missing = db.session.scalars(db.select(WeeklyList.id).where(
+        WeeklyList.closed_at.is_not(None), WeeklyList.archived_at.is_(None),
+        WeeklyList.id.notin_(frozen_list_ids())
+    )).all()
+    for weekly_list_id in missing:
+        snapshot_list_totals(weekly_list_id)
+    db.session.commit()
+
+def backfill_snapshots():
+    # Listas e itens gravados antes das cópias do produto: preenche com o
+    # catálogo atual (o melhor que dá para saber agora), uma vez só
+    def from_product(column):
+        return lambda product_id: db.select(column).where(Product.id == product_id).scalar_subquery()
+    name, unit, price, is_organic = (from_product(c) for c in (Product.name, Product.unit, Product.price, Product.is_organic))
+    with db.engine.begin() as conn:
+        conn.execute(db.update(WeeklyProduct).where(WeeklyProduct.name.is_(None)).values(
+            name=name(WeeklyProduct.product_id), unit=unit(WeeklyProduct.product_id),
+            price=price(WeeklyProduct.product_id), is_organic=is_organic(WeeklyProduct.product_id)
+        ))
+        for model in (OrderItem, ArchivedOrderItem):
+            conn.execute(db.update(model).where(model.product_name.is_(None)).values(
+                product_name=name(model.product_id), unit=unit(model.product_id), is_organic=is_organic(model.product_id)
+            ))
+        conn.execute(db.update(WeeklyProductSales).where(WeeklyProductSales.product_name.is_(None)).values(
+            product_name=name(WeeklyProductSales.product_id), unit=unit(WeeklyProductSales.product_id)
+        ))
+
+def ensure_indexes():
+    # create_all() não cria índices novos em tabelas que já existem
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+PRODUCTS_PER_PAGE = 50
+
+# Busca de produtos: FTS5 no SQLite, trigramas + unaccent no Postgres.
+# Sem suporte no banco, cai para LIKE simples (sem ignorar acentos).
+PRODUCT_SEARCH_BACKEND = 'like'
+
+def setup_product_search():
+    global PRODUCT_SEARCH_BACKEND
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.begin() as conn:
+            if dialect == 'sqlite':
+                existed = conn.execute(db.text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+                )).first()
+                conn.execute(db.text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+                    "name, content='product', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+                ))
+                conn.execute(db.text(
+                    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN "
+                    "INSERT INTO product_search(rowid, name) VALUES (new.id, new.name); END"
+                ))
+                conn.execute(db.text(
+                    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN "
+                    "INSERT INTO product_search(product_search, rowid, name) VALUES ('delete', old.id, old.name); END"
+                ))
+                conn.execute(db.text(
+                    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF name ON product BEGIN "
+                    "INSERT INTO product_search(product_search, rowid, name) VALUES ('delete', old.id, old.name); "
+                    "INSERT INTO product_search(rowid, name) VALUES (new.id, new.name); END"
+                ))
+                if not existed:
+                    conn.execute(db.text("INSERT INTO product_search(product_search) VALUES ('rebuild')"))
+                PRODUCT_SEARCH_BACKEND = 'fts5'
+            elif dialect == 'postgresql':
+                conn.execute(db.text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+                conn.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                # unaccent() não é IMMUTABLE; o wrapper permite usá-la em índice
+                conn.execute(db.text(
+                    "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text "
+                    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS "
+                    "$$ SELECT public.unaccent('public.unaccent', $1) $$"
+                ))
+                conn.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product "
+                    "USING gin (f_unaccent(lower(name)) gin_trgm_ops)"
+                ))
+                PRODUCT_SEARCH_BACKEND = 'trgm'
+    except Exception as e:
+        app.logger.warning('Índice de busca de produtos indisponível, usando LIKE: %s', e)
+        PRODUCT_SEARCH_BACKEND = 'like'
+
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+def product_name_filter(search):
+    terms = re.findall(r'\w+', search.lower())
+    if not terms:
+        return None
+    if PRODUCT_SEARCH_BACKEND == 'fts5':
+        # Cada termo vira um prefixo: "lim tah" encontra "Limão Tahiti"
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return db.text(
+            "product.id IN (SELECT rowid FROM product_search WHERE product_search MATCH :product_search_match)"
+        ).bindparams(product_search_match=match)
+    conditions = []
+    for term in terms:
+        pattern = '%' + term.replace('_', '\\_') + '%'
+        if PRODUCT_SEARCH_BACKEND == 'trgm':
+            conditions.append(db.func.f_unaccent(db.func.lower(Product.name)).like(strip_accents(pattern), escape='\\'))
+        else:
+            conditions.append(Product.name.ilike(pattern, escape='\\'))
+    return db.and_(*conditions)
+
+def search_products(search='', category_id=None, is_organic=None, is_active=None):
+    query = Product.query.join(Category).options(contains_eager(Product.category))
+    name_filter = product_name_filter(search) if search else None
+    if name_filter is not None:
+        query = query.filter(name_filter)
+    if category_id is not None:
+        query = query.filter(Product.category_id == category_id)
+    if is_organic is not None:
+        query = query.filter(Product.is_organic == is_organic)
+    if is_active is not None:
+        query = query.filter(Product.is_active == is_active)
+    return query.order_by(Category.order, Product.name)
+
 def is_admin_logged_in():
     return 'admin_id' in session
 
+def format_brl(value):
+    return f"{value:.2f}".replace('.', ',')
+
+def parse_stock(value):
+    # Campo de estoque vazio = produto sem limite
+    if value is None or not value.strip():
+        return None
+    return max(float(value.replace(',', '.')), 0)
+
+class TTLCache:
+    # Cache em memória (por worker) com expiração curta, para dados que
+    # muitas requisições leem e que podem ficar alguns segundos defasados
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, loader):
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        value = loader()
+        self.set(key, value)
+        return value
+    
+    def peek(self, key):
+        # Valor ainda válido ou None, sem carregar
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+    
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+    
+    def stats(self):
+        now = time.monotonic()
+        entries = list(self._data.values())
+        return {'entries': len(entries), 'fresh': sum(1 for expires, _ in entries if expires > now), 'ttl_seconds': self.ttl}
+
+# Réplica de leitura com verificação de atraso (em cache por alguns segundos)
+replica_cache = TTLCache(REPLICA_CHECK_SECONDS)
+
+def measure_replica_lag():
+    # Pela conexão DBAPI direto: a sondagem não entra na contagem de SQL
+    # da requisição. None = réplica inacessível.
+    engine = db.engines.get('replica')
+    if engine is None:
+        return None
+    try:
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if engine.dialect.name == 'postgresql':
+                cursor.execute(
+                    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+                    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )
+            else:
+                cursor.execute('SELECT 0')
+            lag = float(cursor.fetchone()[0])
+            cursor.close()
+        finally:
+            connection.close()
+        return lag
+    except Exception as e:
+        app.logger.warning('Réplica de leitura indisponível: %s', e)
+        return None
+
+def replica_status():
+    if 'replica' not in db.engines:
+        return {'configured': False}
+    lag = replica_cache.get('lag', measure_replica_lag)
+    healthy = lag is not None and lag <= REPLICA_MAX_LAG_SECONDS
+    return {'configured': True, 'healthy': healthy, 'lag_seconds': lag}
+
+def replica_engine():
+    # Réplica atrasada ou fora do ar: as leituras voltam para o primário
+    if 'replica' not in db.engines or not replica_status()['healthy']:
+        return None
+    return db.engines['replica']
+
+@contextmanager
+def use_read_replica():
+    token = _read_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_replica.reset(token)
+
+def read_replica(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_read_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+# Estoque por produto da lista semanal
+STOCK_CACHE_SECONDS = float(os.environ.get('STOCK_CACHE_SECONDS', '3'))
+stock_cache = TTLCache(STOCK_CACHE_SECONDS)
+
+def get_stock_levels(weekly_list_id):
+    # {product_id: quantidade restante} só dos produtos com estoque limitado
+    def load():
+        rows = db.session.query(WeeklyProduct.product_id, WeeklyProduct.stock).filter(
+            WeeklyProduct.weekly_list_id == weekly_list_id,
+            WeeklyProduct.stock.isnot(None)
+        ).all()
+        return {product_id: max(stock, 0) for product_id, stock in rows}
+    return stock_cache.get(weekly_list_id, load)
+
+# Produtos da lista semanal como estavam na criação da lista (não mudam
+# depois disso, então o cache pode durar bem mais que o do estoque)
+LIST_PRODUCTS_CACHE_SECONDS = float(os.environ.get('LIST_PRODUCTS_CACHE_SECONDS', '300'))
+list_products_cache = TTLCache(LIST_PRODUCTS_CACHE_SECONDS)
+
+def get_list_products(weekly_list_id):
+    # {product_id: {'name', 'unit', 'price', 'is_organic'}}
+    def load():
+        rows = db.session.query(
+            WeeklyProduct.product_id, WeeklyProduct.name, WeeklyProduct.unit, WeeklyProduct.price, WeeklyProduct.is_organic
+        ).filter(WeeklyProduct.weekly_list_id == weekly_list_id).all()
+        return {
+            product_id: {'name': name, 'unit': unit, 'price': price, 'is_organic': bool(is_organic)}
+            for product_id, name, unit, price, is_organic in rows
+        }
+    return list_products_cache.get(weekly_list_id, load)
+
+# Horários de entrega com capacidade limitada
+SLOT_CACHE_SECONDS = float(os.environ.get('SLOT_CACHE_SECONDS', '5'))
+slot_cache = TTLCache(SLOT_CACHE_SECONDS)
+WEEKDAYS = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+
+def format_slot_label(starts_at, ends_at):
+    return f"{WEEKDAYS[starts_at.weekday()]} {starts_at.strftime('%d/%m')} {starts_at.strftime('%H:%M')}–{ends_at.strftime('%H:%M')}"
+
+def get_delivery_slots(weekly_list_id):
+    def load():
+        slots = DeliverySlot.query.filter_by(weekly_list_id=weekly_list_id).order_by(DeliverySlot.starts_at).all()
+        return [
+            {
+                'id': slot.id,
+                'label': slot.label,
+                'starts_at': slot.starts_at.isoformat(),
+                'delivery_fee': slot.delivery_fee,
+                'remaining': max(slot.capacity - slot.claimed, 0),
+            }
+            for slot in slots
+        ]
+    return slot_cache.get(weekly_list_id, load)
+
+def claim_delivery_slot(weekly_list_id, slot_id):
+    # Ocupa uma vaga só se ainda houver capacidade (UPDATE condicional, sem
+    # ler antes); devolve a taxa do horário ou None se estiver lotado
+    row = db.session.execute(
+        db.update(DeliverySlot)
+        .where(
+            DeliverySlot.id == slot_id,
+            DeliverySlot.weekly_list_id == weekly_list_id,
+            DeliverySlot.claimed < DeliverySlot.capacity
+        )
+        .values(claimed=DeliverySlot.claimed + 1)
+        .returning(DeliverySlot.delivery_fee)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return row.delivery_fee if row else None
+
+# Roteirização das entregas
+CEP_PATTERN = re.compile(r'(\d{5})-?(\d{3})')
+
+def extract_cep(address):
+    match = CEP_PATTERN.search(address or '')
+    return match.group(1) + match.group(2) if match else None
+
+def get_depot():
+    # Ponto de partida dos entregadores (DEPOT_LAT/DEPOT_LNG); sem ele as
+    # rotas começam na parada mais conveniente
+    lat, lng = os.environ.get('DEPOT_LAT'), os.environ.get('DEPOT_LNG')
+    return (float(lat), float(lng)) if lat and lng else None
+
+def build_delivery_stops(orders):
+    locations = GeoLocation.query.all()
+    by_cep = {loc.cep: loc for loc in locations if loc.cep}
+    by_neighborhood = [
+        (strip_accents(loc.neighborhood).lower(), loc) for loc in locations if loc.neighborhood
+    ]
+    # Nomes mais longos primeiro ("Cruz das Almas" antes de "Almas")
+    by_neighborhood.sort(key=lambda item: -len(item[0]))
+    
+    stops = []
+    for order in orders:
+        cep = extract_cep(order.delivery_address)
+        location = by_cep.get(cep)
+        if location is None and order.delivery_address:
+            address = strip_accents(order.delivery_address).lower()
+            location = next((loc for name, loc in by_neighborhood if name in address), None)
+        group = cep or (strip_accents(location.neighborhood).lower() if location and location.neighborhood else '')
+        stops.append(routing.Stop(
+            key=order.id,
+            lat=location.lat if location else None,
+            lng=location.lng if location else None,
+            group=group
+        ))
+    return stops
+
+# Clientes (deduplicados pelo telefone normalizado)
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('55') and len(digits) in (12, 13):
+        digits = digits[2:]
+    if digits.startswith('0') and len(digits) in (11, 12):
+        digits = digits[1:]
+    return digits if len(digits) in (10, 11) else None
+
+def upsert_customer(phone, name, address, order_total, ordered_at):
+    # INSERT ... ON CONFLICT num único comando: dois checkouts simultâneos do
+    # mesmo telefone nunca criam clientes duplicados. Devolve (id, endereço
+    # cadastrado): cliente conhecido pode deixar o endereço em branco
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert_insert
+    statement = upsert_insert(Customer).values(
+        phone=phone,
+        name=name,
+        delivery_address=address or None,
+        order_count=1,
+        total_spent=order_total,
+        last_order_at=ordered_at,
+        created_at=ordered_at
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[Customer.phone],
+        set_={
+            'name': statement.excluded.name,
+            'delivery_address': db.func.coalesce(statement.excluded.delivery_address, Customer.delivery_address),
+            'order_count': Customer.order_count + 1,
+            'total_spent': Customer.total_spent + order_total,
+            'last_order_at': statement.excluded.last_order_at,
+        }
+    ).returning(Customer.id, Customer.delivery_address)
+    return db.session.execute(statement).one()
+
+def backfill_customers(batch_size=5000):
+    # Liga pedidos antigos (sem customer_id, quentes ou arquivados) a clientes,
+    # criando os que faltam, e recalcula os totais de cada cliente
+    latest = {}
+    pending = {ArchivedOrder: [], Order: []}  # do mais antigo para o mais recente
+    for model in pending:
+        rows = db.session.query(
+            model.id, model.customer_phone, model.customer_name, model.delivery_address, model.created_at
+        ).filter(model.customer_id.is_(None)).order_by(model.created_at, model.id).yield_per(batch_size)
+        for order_id, phone, name, address, created_at in rows:
+            phone = normalize_phone(phone)
+            if not phone:
+                continue
+            pending[model].append((order_id, phone))
+            info = latest.setdefault(phone, {'name': name, 'delivery_address': None, 'created_at': created_at})
+            info['name'] = name
+            if address:
+                info['delivery_address'] = address
+    
+    existing = dict(db.session.query(Customer.phone, Customer.id).filter(Customer.phone.in_(list(latest))).all()) if latest else {}
+    new_customers = [
+        {'phone': phone, 'name': info['name'], 'delivery_address': info['delivery_address'], 'created_at': info['created_at']}
+        for phone, info in latest.items() if phone not in existing
+    ]
+    for start in range(0, len(new_customers), batch_size):
+        db.session.execute(insert(Customer), new_customers[start:start + batch_size])
+    customer_ids = dict(db.session.query(Customer.phone, Customer.id).all())
+    
+    for model, orders in pending.items():
+        for start in range(0, len(orders), batch_size):
+            db.session.execute(db.update(model), [
+                {'id': order_id, 'customer_id': customer_ids[phone]} for order_id, phone in orders[start:start + batch_size]
+            ])
+    
+    def from_all_orders(aggregate, column):
+        return sum(
+            db.select(db.func.coalesce(aggregate(getattr(model, column)), 0)).where(model.customer_id == Customer.id).scalar_subquery()
+            for model in (Order, ArchivedOrder)
+        )
+    last_order_at = [
+        db.select(db.func.max(model.created_at)).where(model.customer_id == Customer.id).scalar_subquery()
+        for model in (Order, ArchivedOrder)
+    ]
+    db.session.execute(db.update(Customer).values(
+        order_count=from_all_orders(db.func.count, 'id'),
+        total_spent=from_all_orders(db.func.sum, 'total_amount'),
+        last_order_at=db.func.coalesce(*last_order_at)
+    ).execution_options(synchronize_session=False))
+    db.session.commit()
+    return {'customers_created': len(new_customers), 'orders_linked': sum(len(orders) for orders in pending.values())}
+
+@app.cli.command('backfill-customers')
+def backfill_customers_command():
+    """Liga os pedidos antigos aos clientes (pelo telefone)."""
+    result = backfill_customers()
+    print(f"✅ {result['customers_created']} clientes criados, {result['orders_linked']} pedidos vinculados")
+
+# Notificações de pedido (caixa de saída + worker em segundo plano)
+NOTIFY_SHOP_PHONE = os.environ.get('NOTIFY_SHOP_PHONE', '5582996603943')
+NOTIFY_SHOP_EMAIL = os.environ.get('NOTIFY_SHOP_EMAIL')
+NOTIFICATION_WORKER = os.environ.get('NOTIFICATION_WORKER', '1') == '1'
+NOTIFICATION_RATE_PER_MINUTE = float(os.environ.get('NOTIFICATION_RATE_PER_MINUTE', '30'))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', '20'))
+NOTIFICATION_POLL_SECONDS = float(os.environ.get('NOTIFICATION_POLL_SECONDS', '5'))
+NOTIFICATION_LEASE_SECONDS = 120
+outbox_wakeup = threading.Event()
+outbox_stop = threading.Event()
+_outbox_thread = None
+_outbox_lock = threading.Lock()
+
+def order_notifications(order_id, data, phone, total_amount, delivery_fee, slot_label, created_at):
+    name = data['customer_name']
+    delivery = slot_label or 'a combinar'
+    messages = []
+    if phone:
+        messages.append({
+            'channel': 'whatsapp',
+            'recipient': '55' + phone,
+            'subject': f'Pedido #{order_id} recebido',
+            'body': (
+                f"Olá, {name}! Recebemos seu pedido #{order_id} no Em Casa Hortifruti.\n"
+                f"Total: R$ {format_brl(total_amount)} (entrega R$ {format_brl(delivery_fee)})\n"
+                f"Entrega: {delivery}\n"
+                f"Obrigado!"
+            ),
+        })
+    messages.append({
+        'channel': 'email' if NOTIFY_SHOP_EMAIL else 'whatsapp',
+        'recipient': NOTIFY_SHOP_EMAIL or NOTIFY_SHOP_PHONE,
+        'subject': f'Novo pedido #{order_id}',
+        'body': (
+            f"Novo pedido #{order_id} de {name} ({data.get('customer_phone') or 'sem telefone'})\n"
+            f"Total: R$ {format_brl(total_amount)}\n"
+            f"Endereço: {data.get('delivery_address') or 'não informado'}\n"
+            f"Entrega: {delivery}\n"
+            f"Detalhes: /admin/orders/{order_id}"
+        ),
+    })
+    for message in messages:
+        message.update(order_id=order_id, created_at=created_at, next_attempt_at=created_at)
+    return messages
+
+def claim_notifications(limit, channels):
+    # Reserva um lote por um tempo (lease): se o processo morrer no meio do
+    # envio, as mensagens voltam a ficar disponíveis. No Postgres o SKIP LOCKED
+    # deixa vários workers drenarem a fila sem pegar a mesma mensagem. Só os
+    # canais com sender: os outros ficam na fila, sem gastar tentativas.
+    now = datetime.utcnow()
+    due = db.select(Notification.id).where(
+        Notification.status.in_(('pending', 'sending')),
+        Notification.channel.in_(channels),
+        Notification.next_attempt_at <= now
+    ).order_by(Notification.next_attempt_at, Notification.id).limit(limit).with_for_update(skip_locked=True)
+    rows = db.session.execute(
+        db.update(Notification).where(Notification.id.in_(due)).values(
+            status='sending',
+            attempts=Notification.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=NOTIFICATION_LEASE_SECONDS)
+        ).returning(
+            Notification.id, Notification.channel, Notification.recipient,
+            Notification.subject, Notification.body, Notification.attempts
+        ).execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return rows
+
+def drain_outbox(senders, limiter=None, stop_event=None, batch_size=NOTIFICATION_BATCH_SIZE):
+    if not senders:
+        return 0
+    rows = claim_notifications(batch_size, list(senders))
+    for row in rows:
+        result = {'id': row.id, 'status': 'sent', 'sent_at': None, 'last_error': None, 'next_attempt_at': datetime.utcnow()}
+        if row.attempts > notifications.MAX_ATTEMPTS:
+            result.update(status='failed', last_error='Tentativas esgotadas')
+        else:
+            # Sem ficha do limitador (parando): a mensagem volta quando o lease vencer
+            if limiter is not None and not limiter.acquire(stop_event):
+                break
+            message = notifications.Message(row.channel, row.recipient, row.subject, row.body)
+            try:
+                senders[row.channel].send(message)
+                result['sent_at'] = datetime.utcnow()
+            except notifications.PermanentError as e:
+                result.update(status='failed', last_error=str(e)[:500])
+            except Exception as e:
+                result['last_error'] = f'{type(e).__name__}: {e}'[:500]
+                if row.attempts >= notifications.MAX_ATTEMPTS:
+                    result['status'] = 'failed'
+                else:
+                    result['status'] = 'pending'
+                    result['next_attempt_at'] += timedelta(seconds=notifications.backoff_delay(row.attempts))
+        db.session.execute(db.update(Notification), [result])
+        db.session.commit()
+    return len(rows)
+
+def run_outbox_worker():
+    senders = None
+    limiter = notifications.RateLimiter(NOTIFICATION_RATE_PER_MINUTE, per=60)
+    while not outbox_stop.is_set():
+        processed = 0
+        try:
+            if senders is None:
+                # Dentro do try: configuração errada é registrada e tentada de
+                # novo no próximo ciclo, sem matar a thread
+                senders = notifications.build_senders()
+                for channel, variable in notifications.CHANNELS.items():
+                    if channel not in senders:
+                        app.logger.warning(
+                            'Canal de notificação %s sem sender (%s): as mensagens ficam na caixa de saída',
+                            channel, variable
+                        )
+            with app.app_context():
+                processed = drain_outbox(senders, limiter, outbox_stop)
+        except Exception:
+            app.logger.exception('Falha ao processar a caixa de saída de notificações')
+        if processed < NOTIFICATION_BATCH_SIZE:
+            outbox_wakeup.wait(NOTIFICATION_POLL_SECONDS)
+            outbox_wakeup.clear()
+
+def start_outbox_worker():
+    global _outbox_thread
+    if not NOTIFICATION_WORKER or _outbox_thread is not None:
+        return
+    with _outbox_lock:
+        if _outbox_thread is None:
+            _outbox_thread = threading.Thread(target=run_outbox_worker, name='notification-outbox', daemon=True)
+            _outbox_thread.start()
+
+# Feed ao vivo de pedidos (SSE) para o painel
+LIVE_FEED_CHANNEL = 'hortifruti_orders'
+LIVE_FEED_MAX_CLIENTS = int(os.environ.get('LIVE_FEED_MAX_CLIENTS', '4'))  # por processo
+LIVE_FEED_MAX_SECONDS = float(os.environ.get('LIVE_FEED_MAX_SECONDS', '300'))
+LIVE_FEED_HEARTBEAT_SECONDS = 15
+LIVE_FEED_POLL_SECONDS = float(os.environ.get('LIVE_FEED_POLL_SECONDS', '2'))
+live_orders = live_feed.Broadcaster()
+_live_feed_thread = None
+_live_feed_lock = threading.Lock()
+
+def order_event(order_id, customer_name, customer_phone, delivery_address, total_amount, created_at,
+                weekly_list_id, customer_id=None, slot_label=None):
+    return {
+        'id': order_id,
+        'customer_name': customer_name,
+        'customer_phone': customer_phone or '',
+        'delivery_address': delivery_address or '',
+        'total_amount': total_amount,
+        'created_at': created_at.strftime('%d/%m/%Y %H:%M'),
+        'weekly_list_id': weekly_list_id,
+        'customer_id': customer_id,
+        'slot_label': slot_label,
+    }
+
+def recent_order_events(after_id, limit=100):
+    rows = db.session.query(
+        Order.id, Order.customer_name, Order.customer_phone, Order.delivery_address, Order.total_amount,
+        Order.created_at, Order.weekly_list_id, Order.customer_id, DeliverySlot.starts_at, DeliverySlot.ends_at
+    ).outerjoin(DeliverySlot).filter(Order.id > after_id).order_by(Order.id).limit(limit).all()
+    return [
+        order_event(*row[:8], slot_label=format_slot_label(row.starts_at, row.ends_at) if row.starts_at else None)
+        for row in rows
+    ]
+
+def notify_new_order(event):
+    # Postgres: NOTIFY dentro da transação do pedido, entregue a todos os
+    # processos só depois do COMMIT. Outros bancos: a consulta periódica
+    # de run_live_feed() encontra o pedido.
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.select(db.func.pg_notify(LIVE_FEED_CHANNEL, json.dumps(event, ensure_ascii=False))))
+
+def listen_postgres():
+    connection = db.engine.raw_connection()
+    try:
+        driver_connection = connection.driver_connection
+        driver_connection.autocommit = True
+        cursor = driver_connection.cursor()
+        cursor.execute(f'LISTEN {LIVE_FEED_CHANNEL}')
+        while True:
+            if select.select([driver_connection], [], [], LIVE_FEED_HEARTBEAT_SECONDS) != ([], [], []):
+                driver_connection.poll()
+                while driver_connection.notifies:
+                    notify = driver_connection.notifies.pop(0)
+                    live_orders.publish(json.loads(notify.payload))
+    finally:
+        connection.invalidate()
+
+def poll_new_orders():
+    # Só consulta enquanto houver alguém conectado neste processo: uma consulta
+    # pela chave primária a cada LIVE_FEED_POLL_SECONDS, não uma por visitante
+    last_id = None
+    while True:
+        if not live_orders.count:
+            last_id = None
+            live_orders.changed.wait()
+            live_orders.changed.clear()
+            continue
+        with app.app_context():
+            if last_id is None:
+                last_id = db.session.query(db.func.max(Order.id)).scalar() or 0
+            for event in recent_order_events(last_id):
+                live_orders.publish(event)
+                last_id = event['id']
+            db.session.remove()
+        time.sleep(LIVE_FEED_POLL_SECONDS)
+
+def run_live_feed():
+    while True:
+        try:
+            with app.app_context():
+                if db.engine.dialect.name == 'postgresql':
+                    listen_postgres()
+                else:
+                    poll_new_orders()
+        except Exception:
+            app.logger.exception('Feed de pedidos ao vivo caiu; reconectando')
+            time.sleep(5)
+
+def start_live_feed():
+    global _live_feed_thread
+    if _live_feed_thread is not None:
+        return
+    with _live_feed_lock:
+        if _live_feed_thread is None:
+            _live_feed_thread = threading.Thread(target=run_live_feed, name='live-feed', daemon=True)
+            _live_feed_thread.start()
+
+# Abertura e encerramento programados das listas semanais
+SHOP_TIMEZONE = os.environ.get('SHOP_TIMEZONE', 'America/Maceio')
+LIST_SCHEDULER = os.environ.get('LIST_SCHEDULER', '1') == '1'
+LIST_SCHEDULER_SECONDS = float(os.environ.get('LIST_SCHEDULER_SECONDS', '30'))
+list_scheduler_wakeup = threading.Event()
+_list_scheduler_thread = None
+_list_scheduler_lock = threading.Lock()
+
+try:
+    _shop_zone = ZoneInfo(SHOP_TIMEZONE)
+except ZoneInfoNotFoundError:
+    _shop_zone = timezone(timedelta(hours=-3))
+
+def shop_now():
+    # Horários digitados no painel são do horário da loja, como os de entrega
+    return datetime.now(_shop_zone).replace(tzinfo=None)
+
+def order_window(weekly_list, now=None):
+    # 'scheduled', 'open' ou 'closed', só com os campos já carregados da lista:
+    # vale desde o horário exato, sem esperar o agendador e sem outra consulta
+    now = now or shop_now()
+    if weekly_list.is_closed or (weekly_list.closes_at and now >= weekly_list.closes_at):
+        return 'closed'
+    if weekly_list.opens_at and now < weekly_list.opens_at:
+        return 'scheduled'
+    return 'open'
+
+def drop_list_totals(weekly_list_id):
+    # Lista reaberta: volta a ser somada pelos pedidos
+    db.session.execute(db.delete(WeeklyProductSales).where(WeeklyProductSales.weekly_list_id == weekly_list_id))
+    db.session.execute(db.delete(WeeklyListSummary).where(WeeklyListSummary.weekly_list_id == weekly_list_id))
+
+def snapshot_list_totals(weekly_list_id):
+    # Totais finais da semana (WeeklyListSummary e WeeklyProductSales), direto
+    # das tabelas quentes; refeitos se a lista foi reaberta e encerrada de novo
+    list_orders = db.select(Order.id).where(Order.weekly_list_id == weekly_list_id)
+    drop_list_totals(weekly_list_id)
+    db.session.execute(insert(WeeklyListSummary).from_select(
+        [WeeklyListSummary.weekly_list_id, WeeklyListSummary.order_count, WeeklyListSummary.revenue,
+         WeeklyListSummary.delivery_fees, WeeklyListSummary.frozen_at],
+        db.select(
+            db.literal(weekly_list_id),
+            db.func.count(Order.id),
+            db.func.coalesce(db.func.sum(Order.total_amount), 0),
+            db.func.coalesce(db.func.sum(Order.delivery_fee), 0),
+            db.literal(datetime.utcnow())
+        ).where(Order.weekly_list_id == weekly_list_id)
+    ))
+    db.session.execute(insert(WeeklyProductSales).from_select(
+        ['weekly_list_id', 'product_id', 'product_name', 'unit', 'quantity', 'revenue'],
+        db.select(
+            db.literal(weekly_list_id),
+            OrderItem.product_id,
+            OrderItem.product_name,
+            OrderItem.unit,
+            db.func.sum(OrderItem.quantity),
+            db.func.sum(OrderItem.total_price)
+        ).where(OrderItem.order_id.in_(list_orders)).group_by(OrderItem.product_id, OrderItem.product_name, OrderItem.unit)
+    ))
+
+def frozen_list_ids():
+    # Semanas com totais gravados: relatórios e previsão leem o resumo, não os pedidos
+    return db.select(WeeklyListSummary.weekly_list_id)
+
+def close_replaced_lists(now, keep_id=None):
+    # A lista que sai do ar é encerrada na mesma transação, com os totais da
+    # semana: senão ela continuaria aceitando pedidos por link antigo e ficaria
+    # fora do histórico sem totais
+    others = [WeeklyList.is_active.is_(True)]
+    if keep_id is not None:
+        others.append(WeeklyList.id != keep_id)
+    replaced = db.session.execute(
+        db.update(WeeklyList).where(*others, WeeklyList.is_closed.isnot(True))
+        .values(is_active=False, is_closed=True, closed_at=now).returning(WeeklyList.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    for (list_id,) in replaced:
+        snapshot_list_totals(list_id)
+    # As já encerradas só saem do ar (os totais foram gravados no encerramento)
+    db.session.execute(
+        db.update(WeeklyList).where(*others).values(is_active=False)
+        .execution_options(synchronize_session=False)
+    )
+    return [list_id for (list_id,) in replaced]
+
+def run_list_schedule(now=None):
+    # Cada mudança é um UPDATE condicional: com vários workers rodando o
+    # agendador, só quem de fato mudou a linha faz o resto (uma vez só)
+    now = now or shop_now()
+    opened, closed = [], []
+    
+    due = db.session.query(WeeklyList.id).filter(
+        WeeklyList.opened_at.is_(None), WeeklyList.opens_at <= now, WeeklyList.is_closed.isnot(True)
+    ).order_by(WeeklyList.opens_at).all()
+    for (list_id,) in due:
+        flipped = db.session.execute(
+            db.update(WeeklyList).where(WeeklyList.id == list_id, WeeklyList.opened_at.is_(None))
+            .values(is_active=True, opened_at=now).returning(WeeklyList.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if flipped:
+            closed.extend(close_replaced_lists(now, keep_id=list_id))
+            opened.append(list_id)
+        db.session.commit()
+    
+    rows = db.session.execute(
+        db.update(WeeklyList).where(
+            WeeklyList.closes_at <= now, WeeklyList.is_closed.isnot(True),
+            db.or_(WeeklyList.opened_at.isnot(None), WeeklyList.opens_at.is_(None))
+        ).values(is_closed=True, closed_at=now).returning(WeeklyList.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    for (list_id,) in rows:
+        snapshot_list_totals(list_id)
+        closed.append(list_id)
+    db.session.commit()
+    
+    if opened or closed:
+        dashboard_cache.invalidate()
+        app.logger.info('Listas abertas: %s, encerradas: %s', opened, closed)
+    return {'opened': opened, 'closed': closed}
+
+def run_list_scheduler():
+    while True:
+        try:
+            with app.app_context():
+                run_list_schedule()
+        except Exception:
+            app.logger.exception('Falha ao abrir/encerrar listas programadas')
+        list_scheduler_wakeup.wait(LIST_SCHEDULER_SECONDS)
+        list_scheduler_wakeup.clear()
+
+def start_list_scheduler():
+    global _list_scheduler_thread
+    if not LIST_SCHEDULER or _list_scheduler_thread is not None:
+        return
+    with _list_scheduler_lock:
+        if _list_scheduler_thread is None:
+            _list_scheduler_thread = threading.Thread(target=run_list_scheduler, name='list-scheduler', daemon=True)
+            _list_scheduler_thread.start()
+
+@app.cli.command('run-list-schedule')
+def run_list_schedule_command():
+    """Abre e encerra agora as listas com horário vencido."""
+    result = run_list_schedule()
+    print(f"✅ {len(result['opened'])} listas abertas, {len(result['closed'])} encerradas")
+
+def parse_schedule(value):
+    # <input type="datetime-local">: 2024-05-06T18:00
+    if not value or not value.strip():
+        return None
+    return datetime.strptime(value.strip(), '%Y-%m-%dT%H:%M')
+
+def format_schedule_input(value):
+    return value.strftime('%Y-%m-%dT%H:%M') if value else ''
+
+# Arquivamento de listas antigas
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '84'))
+
+def order_models(weekly_list):
+    # Onde estão os pedidos da lista: tabelas quentes ou arquivo
+    if weekly_list is not None and weekly_list.archived_at:
+        return ArchivedOrder, ArchivedOrderItem
+    return Order, OrderItem
+
+def archive_weekly_list(weekly_list):
+    archived_at = datetime.utcnow()
+    list_id = weekly_list.id
+    list_order_ids = db.select(Order.id).where(Order.weekly_list_id == list_id)
+    order_columns = [
+        'id', 'customer_name', 'customer_phone', 'delivery_address', 'delivery_fee', 'total_amount',
+        'weekly_list_id', 'delivery_slot_id', 'customer_id', 'created_at'
+    ]
+    item_columns = ['id', 'order_id', 'product_id', 'product_name', 'unit', 'is_organic', 'quantity', 'unit_price', 'total_price']
+    
+    # Totais primeiro: os do encerramento, ou calculados agora (lista que saiu
+    # do ar sem ser encerrada)
+    if db.session.get(WeeklyListSummary, list_id) is None:
+        snapshot_list_totals(list_id)
+    
+    # Copia e apaga na mesma transação: ou a lista inteira muda de lugar, ou nada
+    db.session.execute(insert(ArchivedOrder).from_select(
+        order_columns, db.select(*[getattr(Order, name) for name in order_columns]).where(Order.weekly_list_id == list_id)
+    ))
+    db.session.execute(insert(ArchivedOrderItem).from_select(
+        item_columns, db.select(*[getattr(OrderItem, name) for name in item_columns]).where(OrderItem.order_id.in_(list_order_ids))
+    ))
+    db.session.execute(db.delete(OrderItem).where(OrderItem.order_id.in_(list_order_ids)))
+    db.session.execute(db.delete(Order).where(Order.weekly_list_id == list_id))
+    weekly_list.archived_at = archived_at
+    db.session.commit()
+
+def archive_weekly_lists(older_than_days=ARCHIVE_AFTER_DAYS, progress=None):
+    cutoff = datetime.utcnow().date() - timedelta(days=older_than_days)
+    # A lista do pedido mais recente nunca é arquivada: no SQLite, com a
+    # tabela order sem o maior id, um pedido novo reutilizaria ids do arquivo
+    newest_order_list_id = db.session.query(Order.weekly_list_id).order_by(Order.id.desc()).limit(1).scalar()
+    weekly_lists = WeeklyList.query.filter(
+        WeeklyList.week_end < cutoff,
+        WeeklyList.is_active.isnot(True),
+        WeeklyList.archived_at.is_(None)
+    ).order_by(WeeklyList.week_start).all()
+    
+    archived = []
+    for done, weekly_list in enumerate(weekly_lists):
+        if progress:
+            progress(done / len(weekly_lists), f"Arquivando {weekly_list.week_start.strftime('%d/%m/%Y')}")
+        if weekly_list.id == newest_order_list_id:
+            continue
+        archive_weekly_list(weekly_list)
+        archived.append(weekly_list.id)
+    return archived
+
+@app.cli.command('archive-lists')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True, help='Arquiva listas encerradas há mais de N dias')
+def archive_lists_command(days):
+    """Move os pedidos de listas antigas para as tabelas de arquivo."""
+    archived = archive_weekly_lists(days)
+    print(f"✅ {len(archived)} listas arquivadas")
+
+# Tarefas em segundo plano: tabela job + pool de threads, sem broker externo.
+# Um despachante por processo reserva as tarefas da fila (SKIP LOCKED no
+# Postgres) e as executa no pool; a tarefa informa o progresso e verifica o
+# pedido de cancelamento por JobContext.progress(). O sinal de vida
+# (heartbeat_at) é gravado por uma thread à parte enquanto a tarefa roda, então
+# mesmo uma etapa longa sem progresso não é tomada por tarefa abandonada.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_RUNNER = os.environ.get('JOB_RUNNER', '1') == '1'
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '2'))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', '300'))
+JOB_HEARTBEAT_SECONDS = JOB_STALE_SECONDS / 5
+JOB_WORKER_ID = f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+JOB_KINDS = {}
+job_wakeup = threading.Event()
+job_stop = threading.Event()
+_job_thread = None
+_job_lock = threading.Lock()
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    PROGRESS_INTERVAL = 0.5
+    
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.output = None
+        self.output_name = None
+        self._reported_at = 0.0
+    
+    def progress(self, fraction, message=None, force=False):
+        # Grava por uma conexão própria (não mistura com a transação da tarefa)
+        # e no máximo a cada PROGRESS_INTERVAL segundos
+        now = time.monotonic()
+        if not force and now - self._reported_at < self.PROGRESS_INTERVAL:
+            return
+        self._reported_at = now
+        values = {'progress': max(0.0, min(1.0, fraction)), 'heartbeat_at': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:200]
+        with db.engine.begin() as conn:
+            cancel = conn.execute(
+                db.update(Job).where(Job.id == self.job_id).values(**values).returning(Job.cancel_requested)
+            ).scalar()
+        if cancel:
+            raise JobCancelled()
+    
+    def save_output(self, name, content):
+        self.output_name = name
+        self.output = content
+
+def background_job(kind, title, params=None):
+    # Registra a função como tarefa; `params` mapeia nome -> tipo do parâmetro
+    def register(func):
+        JOB_KINDS[kind] = {'func': func, 'title': title, 'params': params or {}}
+        return func
+    return register
+
+def enqueue_job(kind, **params):
+    job = Job(kind=kind, params=json.dumps(params))
+    db.session.add(job)
+    db.session.flush()
+    job_id = job.id
+    db.session.commit()
+    job_wakeup.set()
+    return job_id
+
+def claim_jobs(limit):
+    now = datetime.utcnow()
+    queued = db.select(Job.id).where(Job.status == 'queued').order_by(Job.id).limit(limit).with_for_update(skip_locked=True)
+    rows = db.session.execute(
+        db.update(Job).where(Job.id.in_(queued), Job.status == 'queued').values(
+            status='running', started_at=now, heartbeat_at=now, worker=JOB_WORKER_ID
+        ).returning(Job.id, Job.kind, Job.params).execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return rows
+
+def fail_stale_jobs():
+    # Tarefa "rodando" sem sinal de vida: o processo que a executava morreu
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    db.session.execute(db.update(Job).where(Job.status == 'running', Job.heartbeat_at < stale_before).values(
+        status='failed', error='Interrompida (processo reiniciado)', finished_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False))
+    db.session.commit()
+
+@contextmanager
+def job_heartbeat(job_id):
+    # Sinal de vida periódico numa conexão própria, enquanto o bloco roda
+    stop = threading.Event()
+    
+    def beat():
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    conn.execute(db.update(Job).where(Job.id == job_id, Job.status == 'running').values(
+                        heartbeat_at=datetime.utcnow()
+                    ))
+            except Exception:
+                app.logger.exception('Falha ao gravar o sinal de vida da tarefa %s', job_id)
+    
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def run_job(job_id, kind, params):
+    with app.app_context(), job_heartbeat(job_id):
+        context = JobContext(job_id)
+        values = {}
+        try:
+            definition = JOB_KINDS.get(kind)
+            if definition is None:
+                raise ValueError(f'Tarefa desconhecida: {kind}')
+            result = definition['func'](context, **json.loads(params or '{}'))
+            values = {
+                'status': 'succeeded', 'progress': 1.0, 'message': 'Concluída',
+                'result': json.dumps(result or {}, ensure_ascii=False, default=str),
+                'output': context.output, 'output_name': context.output_name,
+            }
+        except JobCancelled:
+            values = {'status': 'cancelled', 'message': 'Cancelada'}
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Tarefa %s (%s) falhou', job_id, kind)
+            values = {'status': 'failed', 'message': 'Falhou', 'error': f'{type(e).__name__}: {e}\n\n{traceback.format_exc()}'[:5000]}
+        finally:
+            db.session.remove()
+        values['finished_at'] = datetime.utcnow()
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Job).where(Job.id == job_id).values(**values))
+
+def run_pending_jobs():
+    # Executa a fila inteira na thread atual (testes e linha de comando)
+    executed = 0
+    while True:
+        rows = claim_jobs(1)
+        if not rows:
+            return executed
+        run_job(*rows[0])
+        executed += 1
+
+def run_job_dispatcher():
+    slots = threading.BoundedSemaphore(JOB_WORKERS)
+    
+    def execute(row):
+        try:
+            run_job(*row)
+        finally:
+            slots.release()
+            job_wakeup.set()
+    
+    with ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job') as executor:
+        with app.app_context():
+            try:
+                fail_stale_jobs()
+            except Exception:
+                app.logger.exception('Falha ao limpar tarefas interrompidas')
+        while not job_stop.is_set():
+            try:
+                free = 0
+                while slots.acquire(blocking=False):
+                    free += 1
+                rows = []
+                if free:
+                    with app.app_context():
+                        rows = claim_jobs(free)
+                for _ in range(free - len(rows)):
+                    slots.release()
+                for row in rows:
+                    executor.submit(execute, tuple(row))
+            except Exception:
+                app.logger.exception('Falha ao despachar tarefas')
+            job_wakeup.wait(JOB_POLL_SECONDS)
+            job_wakeup.clear()
+
+def start_job_runner():
+    global _job_thread
+    if not JOB_RUNNER or _job_thread is not None:
+        return
+    with _job_lock:
+        if _job_thread is None:
+            _job_thread = threading.Thread(target=run_job_dispatcher, name='job-dispatcher', daemon=True)
+            _job_thread.start()
+
+@app.cli.command('run-jobs')
+def run_jobs_command():
+    """Executa agora as tarefas que estão na fila."""
+    print(f"✅ {run_pending_jobs()} tarefas executadas")
+
+def csv_text(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+@background_job('orders_export', 'Exportar pedidos da semana (CSV)', {'weekly_list_id': int})
+@read_replica
+def export_orders_job(job, weekly_list_id):
+    weekly_list = db.session.get(WeeklyList, weekly_list_id)
+    if weekly_list is None:
+        raise ValueError('Lista não encontrada')
+    OrderModel, ItemModel = order_models(weekly_list)
+    total = db.session.query(db.func.count(ItemModel.id)).join(OrderModel).filter(OrderModel.weekly_list_id == weekly_list_id).scalar()
+    rows = db.session.query(
+        OrderModel.id, OrderModel.created_at, OrderModel.customer_name, OrderModel.customer_phone,
+        OrderModel.delivery_address, ItemModel.product_name, ItemModel.quantity, ItemModel.unit,
+        ItemModel.unit_price, ItemModel.total_price
+    ).join(ItemModel, ItemModel.order_id == OrderModel.id).filter(
+        OrderModel.weekly_list_id == weekly_list_id
+    ).order_by(OrderModel.id, ItemModel.id).yield_per(2000)
+    
+    lines = []
+    for row in rows:
+        lines.append([
+            row[0], row[1].strftime('%d/%m/%Y %H:%M') if row[1] else '', row[2], row[3] or '', row[4] or '',
+            row[5], format_brl(row[6]), row[7], format_brl(row[8]), format_brl(row[9])
+        ])
+        if len(lines) % 1000 == 0:
+            job.progress(len(lines) / max(total, 1), f'{len(lines)} de {total} itens')
+    
+    job.save_output(f"pedidos-{weekly_list.week_start.isoformat()}.csv", csv_text(
+        ['Pedido', 'Data', 'Cliente', 'Telefone', 'Endereço', 'Produto', 'Quantidade', 'Unidade', 'Preço Unit.', 'Total'],
+        lines
+    ))
+    return {'itens': len(lines), 'lista': weekly_list_id}
+
+@background_job('sales_report', 'Relatório de vendas por semana (CSV)', {'weeks': int})
+@read_replica
+def sales_report_job(job, weeks=12):
+    weekly_lists = WeeklyList.query.order_by(WeeklyList.week_start.desc()).limit(max(1, weeks)).all()
+    lines = []
+    for done, weekly_list in enumerate(weekly_lists):
+        job.progress(done / len(weekly_lists), f"Semana de {weekly_list.week_start.strftime('%d/%m/%Y')}")
+        if weekly_list.archived_at or weekly_list.closed_at:
+            sales = db.session.query(
+                WeeklyProductSales.product_name, WeeklyProductSales.unit, WeeklyProductSales.quantity, WeeklyProductSales.revenue
+            ).filter(WeeklyProductSales.weekly_list_id == weekly_list.id)
+        else:
+            sales = db.session.query(
+                OrderItem.product_name, OrderItem.unit, db.func.sum(OrderItem.quantity), db.func.sum(OrderItem.total_price)
+            ).join(Order).filter(Order.weekly_list_id == weekly_list.id).group_by(
+                OrderItem.product_id, OrderItem.product_name, OrderItem.unit
+            )
+        for name, unit, quantity, revenue in sales:
+            lines.append([weekly_list.week_start.strftime('%d/%m/%Y'), name, format_brl(quantity), unit, format_brl(revenue)])
+    
+    job.save_output('vendas-por-semana.csv', csv_text(['Semana', 'Produto', 'Quantidade', 'Unidade', 'Receita'], lines))
+    return {'semanas': len(weekly_lists), 'linhas': len(lines)}
+
+@background_job('archive_lists', 'Arquivar listas antigas', {'days': int})
+def archive_lists_job(job, days=ARCHIVE_AFTER_DAYS):
+    archived = archive_weekly_lists(days, progress=lambda fraction, message: job.progress(fraction, message, force=True))
+    return {'listas_arquivadas': len(archived)}
+
+@background_job('backfill_customers', 'Vincular pedidos antigos a clientes')
+def backfill_customers_job(job):
+    job.progress(0, 'Vinculando pedidos', force=True)
+    return backfill_customers()
+
+# Fotos dos produtos: o upload só grava o original; as miniaturas saem numa
+# tarefa em segundo plano e a foto aparece na loja quando ficam prontas
+MEDIA_DIR = os.environ.get('MEDIA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media'))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+@background_job('product_images', 'Gerar miniaturas da foto do produto', {'product_id': int, 'key': str})
+def product_images_job(job, product_id, key):
+    job.progress(0, 'Gerando miniaturas', force=True)
+    widths = images.make_thumbnails(MEDIA_DIR, key)
+    category_id = db.session.execute(db.update(Product).where(Product.id == product_id).values(
+        image_key=key, image_widths=','.join(str(width) for width in widths)
+    ).returning(Product.category_id)).scalar()
+    db.session.commit()
+    invalidate_storefront(category_id)
+    return {'produto': product_id, 'larguras': widths}
+
+def read_uploaded_image():
+    # Bytes da foto enviada no formulário (None sem arquivo); images.InvalidImage se não servir
+    upload = request.files.get('image')
+    if upload is None or not upload.filename:
+        return None
+    data = upload.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise images.InvalidImage(f'A foto passa de {MAX_IMAGE_BYTES // (1024 * 1024)} MB')
+    images.check_image(data)
+    return data
+
+def queue_product_image(product_id, data):
+    key = images.save_original(MEDIA_DIR, data)
+    return enqueue_job('product_images', product_id=product_id, key=key)
+
+def product_picture(product, size=88, eager=False):
+    # <picture> com WebP e JPEG em várias larguras: o navegador baixa só a que
+    # precisa para `size` px na densidade da tela, e só quando chega perto dela
+    if not product.image_key:
+        return ""
+    widths = [int(width) for width in product.image_widths.split(',')]
+    media_url = lambda name: url_for('product_image', filename=name)
+    fallback = next((width for width in widths if width >= size * 2), widths[-1])
+    sizes = f'{size}px'
+    return f"""
+                    <picture>
+                        <source type="image/webp" srcset="{images.srcset(media_url, product.image_key, widths, 'webp')}" sizes="{sizes}">
+                        <img class="product-image" src="{media_url(images.thumbnail_name(product.image_key, fallback, 'jpg'))}"
+                             srcset="{images.srcset(media_url, product.image_key, widths, 'jpg')}" sizes="{sizes}"
+                             width="{size}" height="{size}" alt="{escape(product.name)}" loading="{'eager' if eager else 'lazy'}" decoding="async">
+                    </picture>"""
+
+@app.route('/media/products/<path:filename>')
+def product_image(filename):
+    # Nomes levam o hash do conteúdo: nunca mudam, então o cache é de um ano
+    response = send_from_directory(os.path.join(MEDIA_DIR, 'products'), filename, max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def reserve_stock(weekly_list_id, quantities):
+    # Baixa o estoque de todos os itens limitados num único UPDATE atômico.
+    # Cada linha fica travada até o fim da transação, então checkouts
+    # concorrentes só esperam uns pelos outros quando disputam o mesmo produto.
+    # Retorna os produtos sem estoque suficiente (o chamador faz rollback).
+    if not quantities:
+        return []
+    quantity_case = db.case(quantities, value=WeeklyProduct.product_id, else_=0)
+    rows = db.session.execute(
+        db.update(WeeklyProduct)
+        .where(
+            WeeklyProduct.weekly_list_id == weekly_list_id,
+            WeeklyProduct.product_id.in_(list(quantities)),
+            WeeklyProduct.stock.isnot(None)
+        )
+        .values(stock=WeeklyProduct.stock - quantity_case)
+        .returning(WeeklyProduct.product_id, WeeklyProduct.stock)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return [product_id for product_id, stock in rows if stock < 0]
+
+# Instrumentação: latência, tamanho da resposta e SQL por requisição
+metrics = Metrics()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started_at = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, '_query_started_at', None)
+    if started_at is None or not has_request_context() or 'sql_count' not in g:
+        return
+    g.sql_count += 1
+    g.sql_time += time.perf_counter() - started_at
+    
+    statements = g.get('sql_statements')
+    if statements is not None:
+        if statement in statements:
+            statements[statement][0] += 1
+        else:
+            statements[statement] = [1, _app_call_site()]
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _app_call_site():
+    # Primeiro frame do código da aplicação (fora do SQLAlchemy/Flask) que disparou a consulta
+    for frame in reversed(traceback.extract_stack()):
+        if frame.name in ('_after_cursor_execute', '_app_call_site'):
+            continue
+        if frame.filename.startswith(APP_DIR) and 'site-packages' not in frame.filename:
+            return f"{os.path.relpath(frame.filename, APP_DIR)}:{frame.lineno} em {frame.name}()"
+    return 'origem desconhecida'
+
+@app.before_request
+def start_background_workers():
+    # Só processos que atendem requisições drenam a caixa de saída, executam
+    # tarefas e abrem/encerram listas (comandos `flask ...` e scripts que
+    # importam o app não)
+    start_outbox_worker()
+    start_job_runner()
+    start_list_scheduler()
+
+@app.before_request
+def start_request_metrics():
+    g.request_started_at = time.perf_counter()
+    # Id vindo do proxy (se tiver formato aceitável) ou gerado aqui; volta no X-Request-ID
+    incoming = request.headers.get('X-Request-ID', '')
+    g.request_id = incoming if REQUEST_ID_PATTERN.fullmatch(incoming) else uuid.uuid4().hex
+    g.sql_count = 0
+    g.sql_time = 0.0
+    if app.config['DETECT_N_PLUS_ONE']:
+        g.sql_statements = {}
+
+# Controle de admissão (admission.py): sob sobrecarga o checkout passa na
+# frente; a loja sai da última página gerada e o resto recebe 503
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', '1') == '1'
+ADMISSION_CAPACITY = int(os.environ.get('ADMISSION_CAPACITY', os.environ.get('GUNICORN_THREADS', '8')))
+ADMISSION_LATENCY_TARGET_MS = float(os.environ.get('ADMISSION_LATENCY_TARGET_MS', '1000'))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '10'))
+STOREFRONT_STALE_SECONDS = float(os.environ.get('STOREFRONT_STALE_SECONDS', '300'))
+admission_controller = admission.AdmissionController(ADMISSION_CAPACITY, ADMISSION_LATENCY_TARGET_MS / 1000)
+# Última página da loja gerada neste worker, servida quando a loja é recusada
+storefront_snapshot = TTLCache(STOREFRONT_STALE_SECONDS)
+
+# Registrado depois de start_request_metrics: recusas também entram nas métricas
+@app.before_request
+def admit_request():
+    if not ADMISSION_CONTROL or request.endpoint is None or request.endpoint in admission.EXEMPT:
+        return None
+    priority = admission.priority_for(request.endpoint)
+    started_at = admission_controller.admit(priority, pool_status().get('saturation'))
+    if started_at is not None:
+        g.admission = (started_at, request.endpoint in admission.LATENCY_SIGNAL)
+        return None
+    metrics.observe_shed(request.url_rule.rule, admission.PRIORITY_NAMES[priority])
+    if request.endpoint == 'index':
+        return overloaded_storefront()
+    return overloaded_response()
+
+@app.teardown_request
+def release_admission(exc):
+    admitted = g.pop('admission', None)
+    if admitted is not None:
+        admission_controller.release(*admitted)
+
+def overloaded_response():
+    if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'success': False, 'overloaded': True, 'message': 'Muitos acessos agora. Tente de novo em instantes.'})
+    else:
+        response = Response(f"""
+        <html>
+        <head><title>Muitos acessos</title><meta name="viewport" content="width=device-width, initial-scale=1">{get_base_style()}</head>
+        <body>
+            <div class="container">
+                <div class="alert alert-error">⏳ Muitos acessos agora. Tente de novo em alguns segundos.</div>
+            </div>
+        </body>
+        </html>
+        """, mimetype='text/html')
+    response.status_code = 503
+    response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def overloaded_storefront():
+    # Página já pronta, sem banco: estoque e horários se atualizam pelas APIs
+    # (prioritárias) e o checkout confere tudo de novo ao salvar
+    page = storefront_snapshot.peek('page')
+    if page is None:
+        return overloaded_response()
+    response = Response(page, mimetype='text/html')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Storefront-Stale'] = '1'
+    return response
+
+@app.after_request
+def report_n_plus_one(response):
+    statements = g.get('sql_statements')
+    if statements:
+        threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        for statement, (count, call_site) in statements.items():
+            if count >= threshold:
+                app.logger.warning(
+                    'Possível N+1 em %s %s: consulta repetida %d vezes em %s\n%s',
+                    request.method, request.path, count, call_site, statement
+                )
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(
+            route=route,
+            method=request.method,
+            status=response.status_code,
+            duration=time.perf_counter() - started_at,
+            size=response.content_length or 0,
+            sql_count=g.sql_count,
+            sql_time=g.sql_time,
+        )
+    return response
+
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{8,64}')
+
+@app.after_request
+def log_request(response):
+    started_at = g.get('request_started_at')
+    if started_at is None:
+        return response
+    response.headers['X-Request-ID'] = g.request_id
+    latency_ms = (time.perf_counter() - started_at) * 1000
+    sample_rate = LOG_SAMPLE_RATES.get(request.endpoint, 1.0)
+    if response.status_code >= 500 or latency_ms >= LOG_SLOW_MS or random.random() < sample_rate:
+        app.logger.info('%s %s %s', request.method, request.path, response.status_code, extra={'fields': {
+            'status': response.status_code,
+            'latency_ms': round(latency_ms, 1),
+            'sql_count': g.sql_count,
+            'sql_ms': round(g.sql_time * 1000, 1),
+            'sample_rate': sample_rate,
+        }})
+    return response
+
+@app.errorhandler(Exception)
+def handle_unexpected_error(e):
+    # 404, 405 etc. seguem normais; o resto vai para o log com traceback e o
+    # usuário recebe só uma página genérica com o código da requisição
+    if isinstance(e, HTTPException):
+        return e
+    db.session.rollback()
+    app.logger.exception('Erro não tratado')
+    if request.path.startswith('/api/'):
+        return jsonify({'success': False, 'message': unexpected_error_message()}), 500
+    return error_page(unexpected_error_message(), '/', 500)
+
+def unexpected_error_message(action=None):
+    what = f'Não foi possível {action}.' if action else 'Ocorreu um erro inesperado.'
+    return f'{what} Tente de novo; se o erro continuar, informe o código {g.get("request_id", "-")}.'
+
+def failure_response(action, back):
+    # Para os `except Exception` das views: desfaz a transação e registra o erro
+    db.session.rollback()
+    app.logger.exception('Falha ao %s', action)
+    return error_page(unexpected_error_message(action), back, 500)
+
+def error_page(message, back, status=400):
+    return f"""
+    <html>
+    <head><title>Erro</title><meta name="viewport" content="width=device-width, initial-scale=1">{get_base_style()}</head>
+    <body>
+        <div class="container">
+            <div class="alert alert-error">❌ {message}</div>
+            <a href="{back}" class="btn">← Voltar</a>
+        </div>
+    </body>
+    </html>
+    """, status
+
 # Templates HTML embutidos
 def get_base_style():
     return """
@@ -185,6 +1895,10 @@ def get_base_style():
         .product-grid { display: grid; grid-template-columns: 1fr; gap: 15px; }
         @media (min-width: 768px) { .product-grid { grid-template-columns: repeat(2, 1fr); } }
         @media (min-width: 1024px) { .product-grid { grid-template-columns: repeat(3, 1fr); } }
+        /* Espaço reservado da categoria ainda não carregada (~altura dos cartões) */
+        .category-loading { min-height: calc(var(--products, 1) * 190px); text-align: center; }
+        @media (min-width: 768px) { .category-loading { min-height: calc(var(--products, 1) * 95px); } }
+        @media (min-width: 1024px) { .category-loading { min-height: calc(var(--products, 1) * 64px); } }
         
         .product-card { 
             border: 2px solid #e9ecef; 
@@ -199,7 +1913,11 @@ def get_base_style():
         .product-name { font-size: 1.1em; font-weight: 600; margin: 0 0 8px 0; color: #2d5016; }
         .product-price { font-size: 1.3em; font-weight: 700; color: #28a745; margin: 0 0 5px 0; }
         .product-unit { color: #666; font-size: 0.9em; margin: 0 0 15px 0; }
+        .product-image { float: right; width: 88px; height: 88px; object-fit: cover; border-radius: 8px; margin: 0 0 10px 10px; background: #f1f3f5; }
         .organic-badge { background: #28a745; color: white; padding: 4px 8px; border-radius: 20px; font-size: 0.8em; font-weight: 500; }
+        .stock-info { color: #b35c00; font-size: 0.85em; font-weight: 600; margin-top: 8px; }
+        .product-card.sold-out { opacity: 0.55; }
+        .product-card.sold-out .stock-info { color: #dc3545; }
         
         /* Controles de quantidade - MOBILE OTIMIZADO */
         .quantity-controls { 
@@ -296,82 +2014,210 @@ def get_base_style():
     </style>
     """
 
-# Rotas principais
-@app.route('/')
-def index():
-    try:
-        # Buscar lista ativa da semana
-        active_list = WeeklyList.query.filter_by(is_active=True, is_closed=False).first()
-        
-        if not active_list:
-            return f"""
-            <html>
-            <head>
-                <title>Em Casa - Hortifruti</title>
-                <meta name="viewport" content="width=device-width, initial-scale=1">
-                {get_base_style()}
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>🍃 Em Casa - Hortifruti Delivery</h1>
-                        <p>Lista da semana não disponível no momento.</p>
-                        <p>Entre em contato pelo WhatsApp: <strong>+55 (82) 99660-3943</strong></p>
-                        <a href="/admin/login" class="btn">Área Administrativa</a>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-        
-        # Buscar produtos da semana - CONSULTA CORRIGIDA
-        weekly_products = db.session.query(WeeklyProduct).filter_by(weekly_list_id=active_list.id).all()
-        
-        # Agrupar produtos por categoria
+def get_admin_nav():
+    return """
+    <div class="nav">
+        <a href="/admin">Dashboard</a>
+        <a href="/admin/orders">Pedidos</a>
+        <a href="/admin/customers">Clientes</a>
+        <a href="/admin/products">Produtos</a>
+        <a href="/admin/categories">Categorias</a>
+        <a href="/admin/create-list">Nova Lista</a>
+        <a href="/admin/schedule">Agenda</a>
+        <a href="/admin/stock">Estoque</a>
+        <a href="/admin/slots">Entregas</a>
+        <a href="/admin/routes">Rotas</a>
+        <a href="/admin/reports">Relatórios</a>
+        <a href="/admin/jobs">Tarefas</a>
+        <a href="/admin/logout">Sair</a>
+    </div>
+    """
+
+# Fotos carregadas junto com a página (as de cima); as demais esperam a rolagem
+EAGER_PICTURES = 3
+
+# Vitrine em fragmentos: a ordem das categorias da lista (consulta agrupada,
+# barata) e o HTML de cada categoria ficam em caches separados, então editar
+# uma categoria ou um produto refaz só o fragmento daquela categoria. O
+# estoque não entra no HTML: a página aplica stockLevels/api/stock por cima.
+STOREFRONT_CACHE_SECONDS = float(os.environ.get('STOREFRONT_CACHE_SECONDS', '60'))
+STOREFRONT_INLINE_CATEGORIES = int(os.environ.get('STOREFRONT_INLINE_CATEGORIES', '2'))
+storefront_layout_cache = TTLCache(STOREFRONT_CACHE_SECONDS)
+category_fragment_cache = TTLCache(STOREFRONT_CACHE_SECONDS)  # category_id -> (weekly_list_id, html)
+
+def get_storefront_layout(weekly_list_id):
+    # [{'id', 'emoji', 'name', 'count'}] na ordem da loja; vazio se a lista não estiver ativa
+    def load():
+        rows = db.session.query(
+            Category.id, Category.emoji, Category.name, db.func.count(WeeklyProduct.product_id)
+        ).select_from(WeeklyProduct).join(Product).join(Category).join(WeeklyList).filter(
+            WeeklyProduct.weekly_list_id == weekly_list_id,
+            WeeklyList.is_active == True,
+            Product.is_active == True
+        ).group_by(Category.id, Category.emoji, Category.name, Category.order).order_by(Category.order, Category.id).all()
+        return [{'id': id, 'emoji': emoji, 'name': name, 'count': count} for id, emoji, name, count in rows]
+    return storefront_layout_cache.get(weekly_list_id, load)
+
+def get_category_fragments(weekly_list_id, category_ids, eager_category=None):
+    # {category_id: html}; as que faltam no cache saem de uma única consulta
+    fragments = {}
+    missing = []
+    for category_id in category_ids:
+        cached = category_fragment_cache.peek(category_id)
+        if cached is not None and cached[0] == weekly_list_id:
+            fragments[category_id] = cached[1]
+        else:
+            missing.append(category_id)
+    if missing:
+        # Nome, preço e unidade da própria lista (a cópia feita na criação) e a categoria atual
+        weekly_products = WeeklyProduct.query.join(Product).join(Category).options(
+            contains_eager(WeeklyProduct.product).contains_eager(Product.category)
+        ).filter(
+            WeeklyProduct.weekly_list_id == weekly_list_id,
+            Product.is_active == True,
+            Product.category_id.in_(missing)
+        ).order_by(Category.order, WeeklyProduct.name).all()
         products_by_category = {}
-        for wp in weekly_products:
-            product = wp.product
-            if product.is_active:
-                category = product.category
-                if category not in products_by_category:
-                    products_by_category[category] = []
-                products_by_category[category].append(product)
-        
-        # Ordenar categorias
-        sorted_categories = sorted(products_by_category.keys(), key=lambda x: x.order)
-        
-        products_html = ""
-        for category in sorted_categories:
-            products = sorted(products_by_category[category], key=lambda x: x.name)
-            
-            products_html += f"""
-            <div class="category-section">
+        for product in weekly_products:
+            products_by_category.setdefault(product.product.category, []).append(product)
+        for category, products in products_by_category.items():
+            eager = EAGER_PICTURES if category.id == eager_category else 0
+            fragments[category.id] = render_category_section(category, products, eager)
+        for category_id in missing:
+            fragments.setdefault(category_id, None)
+            category_fragment_cache.set(category_id, (weekly_list_id, fragments[category_id]))
+    return fragments
+
+def invalidate_storefront(*category_ids):
+    # Depois de editar categorias/produtos no admin (só neste worker; nos
+    # outros o cache expira em STOREFRONT_CACHE_SECONDS)
+    storefront_layout_cache.invalidate()
+    for category_id in category_ids:
+        category_fragment_cache.invalidate(category_id)
+
+def render_category_section(category, products, eager_pictures=0):
+    html = f"""
+            <div class="category-section" id="category_{category.id}">
                 <div class="category-header">
                     <h3>{category.emoji} {category.name}</h3>
                 </div>
                 <div class="product-grid">
             """
-            
-            for product in products:
-                organic_badge = '<span class="organic-badge">🌱 AGROECOLÓGICO</span>' if product.is_organic else ""
-                products_html += f"""
-                <div class="product-card">
+    pictures_shown = 0
+    for product in products:
+        organic_badge = '<span class="organic-badge">🌱 AGROECOLÓGICO</span>' if product.is_organic else ""
+        # Só as primeiras fotos entram no carregamento inicial
+        picture = product_picture(product.product, eager=pictures_shown < eager_pictures)
+        if picture:
+            pictures_shown += 1
+        html += f"""
+                <div class="product-card" id="card_{product.product_id}">
+                    {picture}
                     <div class="product-name">{product.name}</div>
                     <div class="product-price">R$ {product.price:.2f}</div>
                     <div class="product-unit">por {product.unit}</div>
                     {organic_badge}
+                    <div class="stock-info" id="stock_{product.product_id}"></div>
                     
                     <div class="quantity-controls">
-                        <button class="qty-btn" onclick="decreaseQty({product.id})" id="minus_{product.id}">−</button>
-                        <div class="qty-display" id="qty_display_{product.id}">0</div>
-                        <button class="qty-btn" onclick="increaseQty({product.id}, '{product.name}', {product.price}, '{product.unit}')">+</button>
+                        <button class="qty-btn" onclick="decreaseQty({product.product_id})" id="minus_{product.product_id}" disabled>−</button>
+                        <div class="qty-display" id="qty_display_{product.product_id}">0</div>
+                        <button class="qty-btn" onclick="increaseQty({product.product_id}, '{product.name}', {product.price}, '{product.unit}')" id="plus_{product.product_id}">+</button>
                     </div>
                 </div>
                 """
-            
-            products_html += '</div></div>'
+    return html + '</div></div>'
+
+@app.route('/fragments/category/<int:category_id>')
+def category_fragment(category_id):
+    weekly_list_id = request.args.get('list', type=int)
+    layout = get_storefront_layout(weekly_list_id) if weekly_list_id else []
+    if not any(category['id'] == category_id for category in layout):
+        abort(404)
+    html = get_category_fragments(weekly_list_id, [category_id])[category_id]
+    response = Response(html or '', mimetype='text/html')
+    # A URL leva o id da lista: lista nova, URL nova
+    response.headers['Cache-Control'] = f'public, max-age={int(STOREFRONT_CACHE_SECONDS)}'
+    return response
+
+# Rotas principais
+@app.route('/')
+def index():
+    try:
+        # Buscar lista ativa da semana (encerrada ou não: order_window decide)
+        active_list = WeeklyList.query.filter_by(is_active=True).first()
         
-        return f"""
+        window = order_window(active_list) if active_list else 'closed'
+        if window != 'open':
+            message = "Lista da semana não disponível no momento."
+            if window == 'scheduled':
+                message = f"Os pedidos da próxima lista abrem em {active_list.opens_at.strftime('%d/%m às %H:%M')}."
+            elif active_list:
+                message = "Os pedidos desta semana já foram encerrados."
+            return f"""
+            <html>
+            <head>
+                <title>Em Casa - Hortifruti</title>
+                <meta name="viewport" content="width=device-width, initial-scale=1">
+                {get_base_style()}
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <h1>🍃 Em Casa - Hortifruti Delivery</h1>
+                        <p>{message}</p>
+                        <p>Entre em contato pelo WhatsApp: <strong>+55 (82) 99660-3943</strong></p>
+                        <a href="/admin/login" class="btn">Área Administrativa</a>
+                    </div>
+                </div>
+            </body>
+            </html>
+            """
+        
+        # Só as primeiras categorias vêm na página; as demais são fragmentos
+        # (/fragments/category/<id>) carregados conforme o cliente rola
+        layout = get_storefront_layout(active_list.id)
+        inline = [category['id'] for category in layout[:STOREFRONT_INLINE_CATEGORIES]]
+        fragments = get_category_fragments(active_list.id, inline, eager_category=inline[0] if inline else None)
+        stock_levels = get_stock_levels(active_list.id)
+        
+        # Horários de entrega (cache compartilhado com /api/delivery-slots)
+        slots_html = ""
+        delivery_slots = get_delivery_slots(active_list.id)
+        if delivery_slots:
+            slot_options = '<option value="">Escolha um horário</option>'
+            for slot in delivery_slots:
+                full = slot['remaining'] <= 0
+                availability = ' - LOTADO' if full else f" - {slot['remaining']} vagas"
+                slot_options += (
+                    f'<option value="{slot["id"]}" data-fee="{slot["delivery_fee"]}" data-label="{slot["label"]}" {"disabled" if full else ""}>'
+                    f'{slot["label"]} (Taxa: R$ {format_brl(slot["delivery_fee"])}){availability}</option>'
+                )
+            slots_html = f"""
+                        <div class="form-group">
+                            <label><strong>Horário de entrega:</strong> *</label>
+                            <select class="form-control" id="delivery_slot" onchange="updateDeliveryFee()">
+                                {slot_options}
+                            </select>
+                        </div>
+            """
+        
+        products_html = ""
+        for category in layout:
+            if category['id'] in fragments:
+                products_html += fragments[category['id']] or ''
+                continue
+            products_html += f"""
+            <div class="category-section" id="category_{category['id']}"
+                 data-fragment="{url_for('category_fragment', category_id=category['id'], list=active_list.id)}">
+                <div class="category-header">
+                    <h3>{category['emoji']} {category['name']}</h3>
+                </div>
+                <div class="product-grid category-loading" style="--products: {category['count']}"></div>
+            </div>
+            """
+        
+        page = f"""
         <html>
         <head>
             <title>Em Casa - Hortifruti</title>
@@ -383,6 +2229,7 @@ def index():
                 <div class="header">
                     <h1>🍃 Em Casa - Hortifruti Delivery</h1>
                     <p><strong>Lista da semana:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}</p>
+                    {f"<p>⏰ Pedidos até {active_list.closes_at.strftime('%d/%m às %H:%M')}</p>" if active_list.closes_at else ''}
                     <p>📱 WhatsApp: <strong>(82) 99660-3943</strong></p>
                 </div>
                 
@@ -411,7 +2258,7 @@ def index():
                         </div>
                         <div class="form-group">
                             <label><strong>Telefone:</strong></label>
-                            <input type="tel" class="form-control" id="customer_phone" placeholder="(82) 99999-9999 (opcional)">
+                            <input type="tel" class="form-control" id="customer_phone" placeholder="(82) 99999-9999 (opcional)" onchange="lookupCustomer()">
                         </div>
                         <div class="form-group">
                             <label><strong>Endereço de entrega:</strong></label>
@@ -420,10 +2267,11 @@ def index():
                         <div class="form-group">
                             <label><strong>Local de entrega:</strong></label>
                             <select class="form-control" id="delivery_location" onchange="updateDeliveryFee()">
-                                <option value="maceio">Maceió (Taxa: R$ 10,00)</option>
-                                <option value="paripueira">Paripueira (Taxa: R$ 10,00)</option>
+                                <option value="maceio">Maceió (Taxa: R$ {format_brl(DEFAULT_DELIVERY_FEE)})</option>
+                                <option value="paripueira">Paripueira (Taxa: R$ {format_brl(DEFAULT_DELIVERY_FEE)})</option>
                             </select>
                         </div>
+                        {slots_html}
                         
                         <div style="text-align: center; margin-top: 25px;">
                             <button type="button" class="btn" onclick="sendToWhatsApp()" style="font-size: 16px; padding: 15px 30px;">
@@ -436,9 +2284,53 @@ def index():
             
             <script>
                 let cart = {{}};
-                let deliveryFee = 10.00;
+                let deliveryFee = {DEFAULT_DELIVERY_FEE};
+                let savedAddress = false;
+                let stockLevels = {json.dumps(stock_levels)};
+                
+                // Categorias carregadas sob demanda, um pouco antes de aparecerem na tela
+                function loadCategory(section) {{
+                    if (section.dataset.loading) return;
+                    section.dataset.loading = '1';
+                    fetch(section.dataset.fragment)
+                        .then(response => {{
+                            if (!response.ok) throw new Error(response.status);
+                            return response.text();
+                        }})
+                        .then(html => {{
+                            const template = document.createElement('template');
+                            template.innerHTML = html.trim();
+                            section.replaceWith(template.content);
+                            applyStock(stockLevels);
+                        }})
+                        .catch(() => {{
+                            delete section.dataset.loading;
+                            const grid = section.querySelector('.category-loading');
+                            grid.innerHTML = '<button type="button" class="btn">Carregar produtos</button>';
+                            grid.querySelector('button').onclick = () => loadCategory(section);
+                        }});
+                }}
+                
+                function observeCategories() {{
+                    const pending = document.querySelectorAll('[data-fragment]');
+                    if (!('IntersectionObserver' in window)) {{
+                        pending.forEach(loadCategory);
+                        return;
+                    }}
+                    const observer = new IntersectionObserver(entries => entries.forEach(entry => {{
+                        if (!entry.isIntersecting) return;
+                        observer.unobserve(entry.target);
+                        loadCategory(entry.target);
+                    }}), {{ rootMargin: '800px 0px' }});
+                    pending.forEach(section => observer.observe(section));
+                }}
                 
                 function increaseQty(productId, productName, price, unit) {{
+                    const current = cart[productId] ? cart[productId].quantity : 0;
+                    if (productId in stockLevels && current + 1 > stockLevels[productId]) {{
+                        alert('Quantidade disponível deste produto: ' + stockLevels[productId]);
+                        return;
+                    }}
                     if (!cart[productId]) {{
                         cart[productId] = {{
                             name: productName,
@@ -497,8 +2389,38 @@ def index():
                 }}
                 
                 function updateDeliveryFee() {{
-                    deliveryFee = 10.00;
+                    const slotSelect = document.getElementById('delivery_slot');
+                    const option = slotSelect ? slotSelect.options[slotSelect.selectedIndex] : null;
+                    deliveryFee = option && option.dataset.fee ? parseFloat(option.dataset.fee) : {DEFAULT_DELIVERY_FEE};
                     updateCartSummary();
+                    if (document.getElementById('checkout').style.display === 'block') {{
+                        showCheckout();
+                    }}
+                }}
+                
+                // Vagas por horário (servidas de cache pelo servidor)
+                function refreshSlots() {{
+                    const slotSelect = document.getElementById('delivery_slot');
+                    if (!slotSelect) return;
+                    fetch('/api/delivery-slots')
+                        .then(response => response.json())
+                        .then(data => {{
+                            const selected = slotSelect.value;
+                            slotSelect.innerHTML = '<option value="">Escolha um horário</option>';
+                            data.slots.forEach(slot => {{
+                                const option = document.createElement('option');
+                                option.value = slot.id;
+                                option.dataset.fee = slot.delivery_fee;
+                                option.dataset.label = slot.label;
+                                option.disabled = slot.remaining <= 0;
+                                option.textContent = slot.label + ' (Taxa: R$ ' + slot.delivery_fee.toFixed(2).replace('.', ',') + ')' +
+                                    (slot.remaining <= 0 ? ' - LOTADO' : ' - ' + slot.remaining + ' vagas');
+                                slotSelect.appendChild(option);
+                            }});
+                            const stillAvailable = data.slots.some(slot => String(slot.id) === selected && slot.remaining > 0);
+                            slotSelect.value = stillAvailable ? selected : '';
+                        }})
+                        .catch(() => {{}});
                 }}
                 
                 function showCheckout() {{
@@ -536,6 +2458,9 @@ def index():
                     `;
                     
                     document.getElementById('checkout-items').innerHTML = checkoutItems;
+                    if (document.getElementById('checkout').style.display !== 'block') {{
+                        refreshSlots();
+                    }}
                     document.getElementById('checkout').style.display = 'block';
                     document.getElementById('checkout').scrollIntoView({{ behavior: 'smooth' }});
                 }}
@@ -550,10 +2475,19 @@ def index():
                         return;
                     }}
                     
+                    const slotSelect = document.getElementById('delivery_slot');
+                    const slotOption = slotSelect ? slotSelect.options[slotSelect.selectedIndex] : null;
+                    if (slotSelect && !slotSelect.value) {{
+                        alert('Por favor, escolha um horário de entrega!');
+                        return;
+                    }}
+                    
                     let message = `🍃 *PEDIDO EM CASA HORTIFRUTI* 🍃\\n\\n`;
                     message += `👤 *Cliente:* ${{name}}\\n`;
                     if (phone) message += `📞 *Telefone:* ${{phone}}\\n`;
                     if (address) message += `📍 *Endereço:* ${{address}}\\n`;
+                    else if (savedAddress) message += `📍 *Endereço:* o cadastrado\\n`;
+                    if (slotOption && slotOption.value) message += `🕒 *Entrega:* ${{slotOption.dataset.label}}\\n`;
                     message += `\\n🛒 *PRODUTOS:*\\n`;
                     
                     let subtotal = 0;
@@ -578,75 +2512,326 @@ def index():
                         delivery_address: address,
                         delivery_fee: deliveryFee,
                         total_amount: total,
+                        delivery_slot_id: slotSelect ? parseInt(slotSelect.value) : null,
                         items: cart
                     }};
                     
+                    // A janela é aberta já no clique (senão o navegador bloqueia)
+                    // e só vai para o WhatsApp depois que o pedido foi reservado
+                    const whatsappWindow = window.open('', '_blank');
+                    
                     fetch('/api/save-order', {{
                         method: 'POST',
                         headers: {{ 'Content-Type': 'application/json' }},
                         body: JSON.stringify(orderData)
+                    }})
+                    .then(response => response.json())
+                    .then(result => {{
+                        if (!result.success) {{
+                            if (whatsappWindow) whatsappWindow.close();
+                            if (result.sold_out) {{
+                                refreshStock();
+                            }}
+                            if (result.slot_full) {{
+                                refreshSlots();
+                            }}
+                            if (result.prices_changed) {{
+                                for (const productId in result.prices_changed) {{
+                                    if (cart[productId]) cart[productId].price = result.prices_changed[productId];
+                                }}
+                                updateCartSummary();
+                                showCheckout();
+                            }}
+                            alert(result.message || 'Não foi possível salvar o pedido. Tente novamente.');
+                            return;
+                        }}
+                        
+                        // Enviar para WhatsApp
+                        const whatsappNumber = '5582996603943';
+                        const whatsappUrl = `https://wa.me/${{whatsappNumber}}?text=${{encodeURIComponent(message)}}`;
+                        if (whatsappWindow) {{
+                            whatsappWindow.location = whatsappUrl;
+                        }} else {{
+                            window.location.href = whatsappUrl;
+                        }}
+                    }})
+                    .catch(() => {{
+                        if (whatsappWindow) whatsappWindow.close();
+                        alert('Falha de conexão ao salvar o pedido. Tente novamente.');
                     }});
-                    
-                    // Enviar para WhatsApp
-                    const whatsappNumber = '5582996603943';
-                    const whatsappUrl = `https://wa.me/${{whatsappNumber}}?text=${{encodeURIComponent(message)}}`;
-                    window.open(whatsappUrl, '_blank');
                 }}
                 
-                // Inicializar displays
-                document.addEventListener('DOMContentLoaded', function() {{
-                    const minusButtons = document.querySelectorAll('[id^="minus_"]');
-                    minusButtons.forEach(btn => btn.disabled = true);
-                }});
+                // Cliente que já comprou: preenche nome e endereço pelo telefone
+                function lookupCustomer() {{
+                    const phone = document.getElementById('customer_phone').value.trim();
+                    if (phone.replace(/\\D/g, '').length < 10) return;
+                    fetch('/api/customers/lookup?phone=' + encodeURIComponent(phone))
+                        .then(response => response.json())
+                        .then(customer => {{
+                            savedAddress = Boolean(customer.has_address);
+                            document.getElementById('delivery_address').placeholder = savedAddress
+                                ? 'Deixe em branco para receber no endereço já cadastrado'
+                                : 'Rua, número, bairro... (opcional para clientes conhecidos)';
+                        }})
+                        .catch(() => {{}});
+                }}
+                
+                // Estoque ao vivo (servido de cache pelo servidor)
+                function applyStock(levels) {{
+                    stockLevels = levels;
+                    for (const productId in levels) {{
+                        const remaining = levels[productId];
+                        const card = document.getElementById('card_' + productId);
+                        if (!card) continue;
+                        card.classList.toggle('sold-out', remaining <= 0);
+                        document.getElementById('stock_' + productId).textContent = remaining <= 0 ? 'Esgotado' : 'Restam ' + remaining;
+                        document.getElementById('plus_' + productId).disabled = remaining <= 0;
+                        if (cart[productId] && cart[productId].quantity > remaining) {{
+                            cart[productId].quantity = remaining;
+                            if (remaining <= 0) delete cart[productId];
+                            updateDisplay(productId);
+                            updateCartSummary();
+                        }}
+                    }}
+                }}
+                
+                function refreshStock() {{
+                    fetch('/api/stock')
+                        .then(response => response.json())
+                        .then(data => applyStock(data.stock))
+                        .catch(() => {{}});
+                }}
+                
+                if (Object.keys(stockLevels).length > 0) {{
+                    setInterval(refreshStock, 20000);
+                }}
+                
+                // Os cartões vêm do cache sem o estoque, que muda a cada pedido
+                applyStock(stockLevels);
+                observeCategories();
             </script>
         </body>
         </html>
         """
+        # Cópia para servir sem banco quando o worker estiver sobrecarregado
+        storefront_snapshot.set('page', page)
+        return page
         
-    except Exception as e:
-        print(f"❌ Erro na página inicial: {e}")
-        return f"<h1>Erro: {e}</h1><p><a href='/admin/login'>Área Administrativa</a></p>"
+    except Exception:
+        return failure_response('carregar a loja', '/')
+
+# Taxa de entrega quando a lista não tem horários cadastrados
+DEFAULT_DELIVERY_FEE = float(os.environ.get('DEFAULT_DELIVERY_FEE', '10'))
+
+# Um carrinho real tem algumas dezenas de itens e poucos KB de JSON
+MAX_ORDER_BYTES = int(os.environ.get('MAX_ORDER_BYTES', str(64 * 1024)))
+MAX_ORDER_ITEMS = int(os.environ.get('MAX_ORDER_ITEMS', str(order_payload.MAX_ITEMS)))
+
+def order_too_large():
+    return jsonify({'success': False, 'message': 'Pedido grande demais. Atualize a página e tente novamente.'}), 413
 
 # API para salvar pedidos
 @app.route('/api/save-order', methods=['POST'])
 def save_order():
+    # Corpo limitado e validado antes de qualquer acesso ao banco
+    if not request.is_json:
+        return jsonify({'success': False, 'message': 'O pedido deve ser enviado como JSON.'}), 415
+    if (request.content_length or 0) > MAX_ORDER_BYTES:
+        return order_too_large()
+    body = request.stream.read(MAX_ORDER_BYTES + 1)
+    if len(body) > MAX_ORDER_BYTES:
+        return order_too_large()
     try:
-        data = request.get_json()
-        
-        # Buscar lista ativa
-        active_list = WeeklyList.query.filter_by(is_active=True, is_closed=False).first()
+        data = order_payload.parse_order(body, max_items=MAX_ORDER_ITEMS)
+    except order_payload.InvalidPayload as e:
+        return jsonify({'success': False, 'message': e.message, 'errors': e.errors}), 400
+    
+    try:
+        # Buscar lista ativa (encerrada ou não: order_window decide)
+        active_list = WeeklyList.query.filter_by(is_active=True).first()
         if not active_list:
             return jsonify({'success': False, 'message': 'Nenhuma lista ativa encontrada'})
+        window = order_window(active_list)
+        if window != 'open':
+            message = 'Os pedidos desta semana já foram encerrados.'
+            if window == 'scheduled':
+                message = f"Os pedidos abrem em {active_list.opens_at.strftime('%d/%m às %H:%M')}."
+            return jsonify({'success': False, 'list_closed': True, 'message': message}), 409
+        
+        # Só produtos da lista da semana; nome e unidade vêm da cópia da lista
+        list_products = get_list_products(active_list.id)
+        unknown = [product_id for product_id in data['items'] if product_id not in list_products]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'message': 'Há produtos que não estão na lista desta semana. Atualize a página.',
+                'errors': [{'field': f'items.{product_id}', 'message': 'produto fora da lista da semana'} for product_id in unknown]
+            }), 400
+        
+        # Preços, taxa e total valem o que a lista e o horário dizem; carrinho
+        # divergente (página antiga ou corpo montado à mão) volta para o navegador
+        delivery_slots = get_delivery_slots(active_list.id)
+        slot_id = data['delivery_slot_id']
+        if delivery_slots and not slot_id:
+            return jsonify({'success': False, 'message': 'Escolha um horário de entrega.'}), 400
+        delivery_fee = DEFAULT_DELIVERY_FEE
+        if slot_id:
+            slot = next((slot for slot in delivery_slots if slot['id'] == slot_id), None)
+            if slot is None:
+                slot_cache.invalidate(active_list.id)
+                return jsonify({
+                    'success': False,
+                    'slot_full': True,
+                    'errors': [{'field': 'delivery_slot_id', 'message': 'horário fora da lista da semana'}],
+                    'message': 'Este horário de entrega não está mais disponível. Escolha outro horário.'
+                }), 409
+            delivery_fee = slot['delivery_fee']
+        total_amount, prices_changed, errors = order_payload.check_prices(
+            data, {product_id: list_products[product_id]['price'] for product_id in data['items']}, delivery_fee
+        )
+        if errors:
+            return jsonify({
+                'success': False,
+                'prices_changed': prices_changed,
+                'errors': errors,
+                'message': 'Preços ou taxa de entrega não conferem com a lista da semana. Confira o carrinho e envie de novo.'
+            }), 409
+        
+        # Reservar estoque antes de gravar qualquer coisa
+        quantities = {product_id: item_data['quantity'] for product_id, item_data in data['items'].items()}
+        sold_out = reserve_stock(active_list.id, quantities)
+        if sold_out:
+            db.session.rollback()
+            stock_cache.invalidate(active_list.id)
+            names = [list_products[product_id]['name'] for product_id in sold_out]
+            return jsonify({
+                'success': False,
+                'sold_out': sold_out,
+                'message': f"Estoque insuficiente: {', '.join(names)}. Ajuste as quantidades e tente novamente."
+            }), 409
+        
+        # Ocupar vaga no horário de entrega escolhido
+        if slot_id:
+            if claim_delivery_slot(active_list.id, slot_id) is None:
+                db.session.rollback()
+                slot_cache.invalidate(active_list.id)
+                return jsonify({
+                    'success': False,
+                    'slot_full': True,
+                    'message': 'Este horário de entrega acabou de lotar. Escolha outro horário.'
+                }), 409
+        
+        # Cadastro do cliente (criado ou atualizado pelo telefone)
+        ordered_at = datetime.utcnow()
+        phone = normalize_phone(data.get('customer_phone'))
+        customer_id = None
+        if phone:
+            customer_id, saved_address = upsert_customer(
+                phone, data['customer_name'], data.get('delivery_address', ''), total_amount, ordered_at
+            )
+            # Endereço em branco: cliente conhecido recebe no endereço cadastrado,
+            # que nunca volta para o navegador
+            if not data.get('delivery_address') and saved_address:
+                data['delivery_address'] = saved_address
         
         # Criar pedido
         order = Order(
             customer_name=data['customer_name'],
             customer_phone=data.get('customer_phone', ''),
             delivery_address=data.get('delivery_address', ''),
-            delivery_fee=data['delivery_fee'],
-            total_amount=data['total_amount'],
-            weekly_list_id=active_list.id
+            delivery_fee=delivery_fee,
+            total_amount=total_amount,
+            weekly_list_id=active_list.id,
+            delivery_slot_id=slot_id,
+            customer_id=customer_id,
+            created_at=ordered_at
         )
         db.session.add(order)
         db.session.flush()
         
-        # Criar itens do pedido
-        for product_id, item_data in data['items'].items():
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=int(product_id),
-                quantity=item_data['quantity'],
-                unit_price=item_data['price'],
-                total_price=item_data['quantity'] * item_data['price']
-            )
-            db.session.add(order_item)
+        # Criar itens do pedido (um único INSERT em lote)
+        order_items = [
+            {
+                'order_id': order.id,
+                'product_id': product_id,
+                'product_name': list_products[product_id]['name'],
+                'unit': list_products[product_id]['unit'],
+                'is_organic': list_products[product_id]['is_organic'],
+                'quantity': item_data['quantity'],
+                'unit_price': list_products[product_id]['price'],
+                'total_price': item_data['quantity'] * list_products[product_id]['price']
+            }
+            for product_id, item_data in data['items'].items()
+        ]
+        if order_items:
+            db.session.execute(insert(OrderItem), order_items)
         
+        # Confirmações na caixa de saída, na mesma transação do pedido
+        slot_label = None
+        if slot_id:
+            slot_label = slot['label']
+        db.session.execute(insert(Notification), order_notifications(
+            order.id, data, phone, total_amount, delivery_fee, slot_label, ordered_at
+        ))
+        notify_new_order(order_event(
+            order.id, data['customer_name'], data.get('customer_phone'), data.get('delivery_address'),
+            total_amount, ordered_at, active_list.id, customer_id, slot_label
+        ))
+        
+        order_id = order.id
+        weekly_list_id = active_list.id
         db.session.commit()
-        return jsonify({'success': True, 'order_id': order.id})
+        outbox_wakeup.set()
+        stock_cache.invalidate(weekly_list_id)
+        if slot_id:
+            slot_cache.invalidate(weekly_list_id)
+        return jsonify({'success': True, 'order_id': order_id})
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        return jsonify({'success': False, 'message': str(e)})
+        app.logger.exception('Falha ao salvar pedido')
+        return jsonify({
+            'success': False,
+            'message': unexpected_error_message('salvar o pedido')
+        }), 500
+
+# Estoque restante da lista ativa (cache de poucos segundos, sem consulta por produto)
+@app.route('/api/stock')
+def api_stock():
+    active_list = WeeklyList.query.filter_by(is_active=True, is_closed=False).first()
+    stock = get_stock_levels(active_list.id) if active_list else {}
+    response = jsonify({'stock': stock})
+    response.headers['Cache-Control'] = f'public, max-age={int(STOCK_CACHE_SECONDS)}'
+    return response
+
+# Horários de entrega com vagas restantes (cache de poucos segundos)
+@app.route('/api/delivery-slots')
+def api_delivery_slots():
+    active_list = WeeklyList.query.filter_by(is_active=True, is_closed=False).first()
+    slots = get_delivery_slots(active_list.id) if active_list else []
+    response = jsonify({'slots': slots})
+    response.headers['Cache-Control'] = f'public, max-age={int(SLOT_CACHE_SECONDS)}'
+    return response
+
+# Checkout: o telefone já tem endereço cadastrado? Rota pública, então só
+# responde sim/não — nome e endereço de ninguém saem daqui — e com limite por IP
+# para não servir de varredura de telefones
+CUSTOMER_LOOKUP_PER_MINUTE = int(os.environ.get('CUSTOMER_LOOKUP_PER_MINUTE', '10'))
+customer_lookup_limiter = admission.ClientRateLimiter(CUSTOMER_LOOKUP_PER_MINUTE, per=60)
+
+@app.route('/api/customers/lookup')
+def api_customer_lookup():
+    if not customer_lookup_limiter.allow(request.remote_addr):
+        response = jsonify({'found': False, 'message': 'Muitas consultas. Tente novamente em instantes.'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(customer_lookup_limiter.retry_after())
+        return response
+    phone = normalize_phone(request.args.get('phone'))
+    customer = Customer.query.filter_by(phone=phone).first() if phone else None
+    result = {'found': customer is not None, 'has_address': bool(customer and customer.delivery_address)}
+    response = jsonify(result)
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
 
 # Rotas administrativas
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -695,40 +2880,199 @@ def admin_logout():
     session.pop('admin_id', None)
     return redirect('/')
 
+DASHBOARD_CACHE_SECONDS = float(os.environ.get('DASHBOARD_CACHE_SECONDS', '5'))
+dashboard_cache = TTLCache(DASHBOARD_CACHE_SECONDS)
+
+def load_dashboard_stats():
+    # Uma única consulta: contadores como subconsultas escalares e os 5
+    # pedidos mais recentes da lista ativa (uma linha por pedido, ou uma
+    # linha só com os contadores quando não há pedidos/lista)
+    active = db.select(
+        WeeklyList.id, WeeklyList.week_start, WeeklyList.week_end, WeeklyList.is_closed,
+        WeeklyList.opens_at, WeeklyList.closes_at
+    ).where(WeeklyList.is_active.is_(True)).limit(1).subquery('active')
+    active_id = db.select(WeeklyList.id).where(WeeklyList.is_active.is_(True)).limit(1).scalar_subquery()
+    recent = db.select(
+        Order.id, Order.customer_name, Order.total_amount, Order.created_at, Order.weekly_list_id
+    ).where(Order.weekly_list_id == active_id).order_by(Order.created_at.desc()).limit(5).subquery('recent')
+    one_row = db.select(db.literal(1).label('one')).subquery('one_row')
+    
+    rows = db.session.execute(
+        db.select(
+            db.select(db.func.count(Product.id)).where(Product.is_active.is_(True)).scalar_subquery().label('total_products'),
+            db.select(db.func.count(Category.id)).scalar_subquery().label('total_categories'),
+            db.select(db.func.count(Order.id)).where(Order.weekly_list_id == active_id).scalar_subquery().label('total_orders_week'),
+            active.c.id.label('list_id'), active.c.week_start, active.c.week_end, active.c.is_closed,
+            active.c.opens_at, active.c.closes_at,
+            recent.c.id.label('order_id'), recent.c.customer_name, recent.c.total_amount, recent.c.created_at
+        ).select_from(
+            one_row.outerjoin(active, db.true()).outerjoin(recent, recent.c.weekly_list_id == active.c.id)
+        ).order_by(recent.c.created_at.desc())
+    ).all()
+    
+    first = rows[0]
+    active_list = None
+    if first.list_id is not None:
+        active_list = {
+            'id': first.list_id, 'week_start': first.week_start, 'week_end': first.week_end,
+            'is_closed': first.is_closed, 'opens_at': first.opens_at, 'closes_at': first.closes_at
+        }
+    return {
+        'total_products': first.total_products,
+        'total_categories': first.total_categories,
+        'total_orders_week': first.total_orders_week if active_list else 0,
+        'active_list': active_list,
+        'recent_orders': [
+            {'id': row.order_id, 'customer_name': row.customer_name, 'total_amount': row.total_amount, 'created_at': row.created_at}
+            for row in rows if row.order_id is not None
+        ],
+    }
+
+def live_orders_script(weekly_list_id, table_id, counter_id, max_rows=None, with_checkbox=False):
+    # Pedidos novos chegam pelo /admin/events (SSE) e entram no topo da tabela,
+    # sem recarregar a página. Os dados vêm do cliente: montados com textContent.
+    return f"""
+    <script>
+        (function() {{
+            const listId = {weekly_list_id};
+            const table = document.getElementById('{table_id}');
+            const counter = document.getElementById('{counter_id}');
+            const maxRows = {max_rows or 0};
+            const withCheckbox = {'true' if with_checkbox else 'false'};
+            
+            function cell(row, text, strong) {{
+                const td = document.createElement('td');
+                const el = strong ? document.createElement('strong') : td;
+                el.textContent = text;
+                if (strong) td.appendChild(el);
+                row.appendChild(td);
+                return td;
+            }}
+            
+            function addOrder(order) {{
+                if (order.weekly_list_id !== listId || document.getElementById('live-order-' + order.id)) return;
+                const placeholder = table.querySelector('td[colspan]:only-child');
+                if (placeholder) placeholder.parentNode.remove();
+                
+                const row = document.createElement('tr');
+                row.id = 'live-order-' + order.id;
+                row.style.background = '#fff3cd';
+                if (withCheckbox) {{
+                    const box = document.createElement('input');
+                    box.type = 'checkbox'; box.name = 'ids'; box.value = order.id; box.setAttribute('form', 'print-form');
+                    row.appendChild(document.createElement('td')).appendChild(box);
+                }}
+                const customer = cell(row, '🆕 ' + order.customer_name, true);
+                if (withCheckbox) {{
+                    customer.appendChild(document.createElement('br'));
+                    customer.appendChild(document.createElement('small')).textContent = order.customer_phone ? '📞 ' + order.customer_phone : '';
+                    customer.appendChild(document.createElement('br'));
+                    customer.appendChild(document.createElement('small')).textContent = (order.slot_label ? '🕒 ' + order.slot_label + ' · ' : '') + '📍 ' + (order.delivery_address || 'Endereço não informado');
+                }}
+                cell(row, 'R$ ' + order.total_amount.toFixed(2));
+                cell(row, order.created_at);
+                const link = document.createElement('a');
+                link.href = '/admin/orders/' + order.id; link.className = 'btn btn-sm'; link.textContent = '👁️ Ver Detalhes';
+                row.appendChild(document.createElement('td')).appendChild(link);
+                
+                table.insertBefore(row, table.firstChild);
+                if (maxRows) while (table.rows.length > maxRows) table.deleteRow(-1);
+                counter.textContent = parseInt(counter.textContent, 10) + 1;
+            }}
+            
+            function connect() {{
+                const source = new EventSource('/admin/events');
+                source.addEventListener('order', event => addOrder(JSON.parse(event.data)));
+                // Servidor cheio ou fora do ar: o navegador desiste; tenta de novo depois
+                source.onerror = () => {{
+                    if (source.readyState === EventSource.CLOSED) setTimeout(connect, 30000);
+                }};
+            }}
+            if (window.EventSource) connect();
+        }})();
+    </script>
+    """
+
+@app.route('/admin/events')
+def admin_events():
+    if not is_admin_logged_in():
+        return '', 401
+    if live_orders.count >= LIVE_FEED_MAX_CLIENTS:
+        # Cada conexão ocupa uma thread do gunicorn: as demais ficam para o checkout
+        return 'Muitas conexões ao vivo', 503, {'Retry-After': '30'}
+    start_live_feed()
+    
+    # Inscreve antes de buscar o que foi perdido: um pedido salvo entre a
+    # consulta e a inscrição não some; o que chegar pelos dois lados vai uma vez
+    subscription = live_orders.subscribe()
+    try:
+        # Reconexão do navegador: reenvia o que chegou enquanto estava desconectado
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        missed = recent_order_events(last_event_id) if last_event_id else []
+    except Exception:
+        live_orders.unsubscribe(subscription)
+        raise
+    last_sent_id = missed[-1]['id'] if missed else (last_event_id or 0)
+    
+    def stream():
+        yield 'retry: 5000\n\n'
+        for event in missed:
+            yield live_feed.format_sse('order', event, event['id'])
+        # Conexões têm vida curta: o navegador reconecta sozinho (e a
+        # sessão do admin é verificada de novo)
+        deadline = time.monotonic() + LIVE_FEED_MAX_SECONDS
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=LIVE_FEED_HEARTBEAT_SECONDS)
+            if event is None:
+                yield ': ping\n\n'
+            elif event['id'] > last_sent_id:
+                yield live_feed.format_sse('order', event, event['id'])
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Chamado quando a conexão fecha, mesmo que o stream nunca tenha começado
+    response.call_on_close(lambda: live_orders.unsubscribe(subscription))
+    return response
+
 @app.route('/admin')
+@read_replica
 def admin_dashboard():
     if not is_admin_logged_in():
         return redirect('/admin/login')
     
     try:
-        # Estatísticas gerais
-        total_products = Product.query.filter_by(is_active=True).count()
-        total_categories = Category.query.count()
-        active_list = WeeklyList.query.filter_by(is_active=True).first()
-        
-        recent_orders = []
-        total_orders_week = 0
-        if active_list:
-            recent_orders = Order.query.filter_by(weekly_list_id=active_list.id).order_by(Order.created_at.desc()).limit(5).all()
-            total_orders_week = Order.query.filter_by(weekly_list_id=active_list.id).count()
+        # Estatísticas gerais (uma consulta, em cache por alguns segundos)
+        stats = dashboard_cache.get('stats', load_dashboard_stats)
+        total_products = stats['total_products']
+        total_categories = stats['total_categories']
+        active_list = stats['active_list']
+        recent_orders = stats['recent_orders']
+        total_orders_week = stats['total_orders_week']
         
         # Status da lista
         list_status = "Nenhuma lista ativa"
         if active_list:
-            if active_list.is_closed:
-                list_status = f"Lista encerrada ({active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m')})"
+            window = order_window(SimpleNamespace(**active_list))
+            if window == 'closed':
+                list_status = f"Lista encerrada ({active_list['week_start'].strftime('%d/%m')} a {active_list['week_end'].strftime('%d/%m')})"
+            elif window == 'scheduled':
+                list_status = f"Lista abre em {active_list['opens_at'].strftime('%d/%m às %H:%M')} ({active_list['week_start'].strftime('%d/%m')} a {active_list['week_end'].strftime('%d/%m')})"
             else:
-                list_status = f"Lista ativa ({active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m')})"
+                list_status = f"Lista ativa ({active_list['week_start'].strftime('%d/%m')} a {active_list['week_end'].strftime('%d/%m')})"
+                if active_list['closes_at']:
+                    list_status += f" — pedidos até {active_list['closes_at'].strftime('%d/%m às %H:%M')}"
         
         # Pedidos recentes HTML
         orders_html = ""
         for order in recent_orders:
             orders_html += f"""
             <tr>
-                <td><a href="/admin/orders/{order.id}" style="color: #28a745; text-decoration: none;">{order.customer_name}</a></td>
-                <td>R$ {order.total_amount:.2f}</td>
-                <td>{order.created_at.strftime('%d/%m %H:%M')}</td>
-                <td><a href="/admin/orders/{order.id}" class="btn btn-sm">Ver Detalhes</a></td>
+                <td><a href="/admin/orders/{order['id']}" style="color: #28a745; text-decoration: none;">{order['customer_name']}</a></td>
+                <td>R$ {order['total_amount']:.2f}</td>
+                <td>{order['created_at'].strftime('%d/%m %H:%M')}</td>
+                <td><a href="/admin/orders/{order['id']}" class="btn btn-sm">Ver Detalhes</a></td>
             </tr>
             """
         
@@ -739,15 +3083,7 @@ def admin_dashboard():
         <html>
         <head><title>Painel Admin</title>{get_base_style()}</head>
         <body>
-            <div class="nav">
-                <a href="/admin">Dashboard</a>
-                <a href="/admin/orders">Pedidos</a>
-                <a href="/admin/products">Produtos</a>
-                <a href="/admin/categories">Categorias</a>
-                <a href="/admin/create-list">Nova Lista</a>
-                <a href="/admin/reports">Relatórios</a>
-                <a href="/admin/logout">Sair</a>
-            </div>
+            {get_admin_nav()}
             <div class="container">
                 <div class="header">
                     <h1>📊 Painel Administrativo</h1>
@@ -768,7 +3104,7 @@ def admin_dashboard():
                     </div>
                     <div class="product-card">
                         <h3>🛒 Pedidos da Semana</h3>
-                        <p><strong>{total_orders_week}</strong> pedidos</p>
+                        <p><strong id="orders-week">{total_orders_week}</strong> pedidos</p>
                     </div>
                 </div>
                 
@@ -777,7 +3113,7 @@ def admin_dashboard():
                     <thead>
                         <tr><th>Cliente</th><th>Total</th><th>Data</th><th>Ações</th></tr>
                     </thead>
-                    <tbody>
+                    <tbody id="recent-orders">
                         {orders_html}
                     </tbody>
                 </table>
@@ -790,12 +3126,13 @@ def admin_dashboard():
                     <a href="/" class="btn">🌐 Ver Site</a>
                 </div>
             </div>
+            {live_orders_script(active_list['id'], 'recent-orders', 'orders-week', 5, False) if active_list else ''}
         </body>
         </html>
         """
         
-    except Exception as e:
-        return f"<h1>Erro: {e}</h1>"
+    except Exception:
+        return failure_response('carregar o painel', '/admin')
 
 # NOVAS ROTAS PARA GESTÃO DE CATEGORIAS
 
@@ -806,9 +3143,14 @@ def admin_categories():
     
     categories = Category.query.order_by(Category.order).all()
     
+    # Contagem de produtos de todas as categorias em uma consulta
+    product_counts = dict(
+        db.session.query(Product.category_id, db.func.count(Product.id)).group_by(Product.category_id).all()
+    )
+    
     categories_html = ""
     for category in categories:
-        product_count = Product.query.filter_by(category_id=category.id).count()
+        product_count = product_counts.get(category.id, 0)
         categories_html += f"""
         <tr>
             <td>{category.order}</td>
@@ -826,15 +3168,7 @@ def admin_categories():
     <html>
     <head><title>Categorias</title>{get_base_style()}</head>
     <body>
-        <div class="nav">
-            <a href="/admin">Dashboard</a>
-            <a href="/admin/orders">Pedidos</a>
-            <a href="/admin/products">Produtos</a>
-            <a href="/admin/categories">Categorias</a>
-            <a href="/admin/create-list">Nova Lista</a>
-            <a href="/admin/reports">Relatórios</a>
-            <a href="/admin/logout">Sair</a>
-        </div>
+        {get_admin_nav()}
         <div class="container">
             <h1>🏷️ Gestão de Categorias</h1>
             
@@ -893,8 +3227,8 @@ def admin_add_category():
         db.session.add(category)
         db.session.commit()
         return redirect('/admin/categories')
-    except Exception as e:
-        return f"<h1>Erro ao adicionar categoria: {e}</h1>"
+    except Exception:
+        return failure_response('adicionar a categoria', '/admin/categories')
 
 @app.route('/admin/categories/<int:category_id>/edit', methods=['GET', 'POST'])
 def admin_edit_category(category_id):
@@ -910,9 +3244,10 @@ def admin_edit_category(category_id):
             category.order = int(request.form['order'])
             
             db.session.commit()
+            invalidate_storefront(category_id)
             return redirect('/admin/categories')
-        except Exception as e:
-            return f"<h1>Erro ao editar categoria: {e}</h1>"
+        except Exception:
+            return failure_response('editar a categoria', '/admin/categories')
     
     return f"""
     <html>
@@ -970,33 +3305,54 @@ def admin_delete_category(category_id):
         
         db.session.delete(category)
         db.session.commit()
+        invalidate_storefront(category_id)
         return redirect('/admin/categories')
-    except Exception as e:
-        return f"<h1>Erro ao deletar categoria: {e}</h1>"
+    except Exception:
+        return failure_response('excluir a categoria', '/admin/categories')
 
 # Continuar com as outras rotas existentes...
+def selected_weekly_list():
+    list_id = request.args.get('list', type=int)
+    if list_id:
+        return db.session.get(WeeklyList, list_id)
+    return WeeklyList.query.filter_by(is_active=True).first()
+
+def weekly_list_picker(action, selected):
+    weekly_lists = db.session.query(
+        WeeklyList.id, WeeklyList.week_start, WeeklyList.week_end, WeeklyList.archived_at
+    ).order_by(WeeklyList.week_start.desc()).all()
+    options = ''.join(
+        f'<option value="{wl.id}" {"selected" if selected and wl.id == selected.id else ""}>'
+        f'{wl.week_start.strftime("%d/%m/%Y")} a {wl.week_end.strftime("%d/%m/%Y")}{" (arquivada)" if wl.archived_at else ""}</option>'
+        for wl in weekly_lists
+    )
+    return f"""
+    <form method="GET" action="{action}" style="display: flex; gap: 10px; margin-bottom: 20px;">
+        <select name="list" class="form-control">{options}</select>
+        <button type="submit" class="btn">Ver semana</button>
+    </form>
+    """
+
+def customer_link(order):
+    if order.customer_id:
+        return f'<a href="/admin/customers/{order.customer_id}">{escape(order.customer_name)}</a>'
+    return escape(order.customer_name)
+
 @app.route('/admin/orders')
+@read_replica
 def admin_orders():
     if not is_admin_logged_in():
         return redirect('/admin/login')
     
-    # Buscar pedidos da lista ativa
-    active_list = WeeklyList.query.filter_by(is_active=True).first()
+    # Pedidos da lista escolhida (padrão: lista ativa), quentes ou arquivados
+    active_list = selected_weekly_list()
     
     if not active_list:
         return f"""
         <html>
         <head><title>Pedidos</title>{get_base_style()}</head>
         <body>
-            <div class="nav">
-                <a href="/admin">Dashboard</a>
-                <a href="/admin/orders">Pedidos</a>
-                <a href="/admin/products">Produtos</a>
-                <a href="/admin/categories">Categorias</a>
-                <a href="/admin/create-list">Nova Lista</a>
-                <a href="/admin/reports">Relatórios</a>
-                <a href="/admin/logout">Sair</a>
-            </div>
+            {get_admin_nav()}
             <div class="container">
                 <h1>📋 Pedidos</h1>
                 <p>Nenhuma lista ativa. Crie uma lista semanal primeiro.</p>
@@ -1006,17 +3362,41 @@ def admin_orders():
         </html>
         """
     
-    orders = Order.query.filter_by(weekly_list_id=active_list.id).order_by(Order.created_at.desc()).all()
+    # Pedidos agrupados por horário de entrega (sem horário ficam por último)
+    OrderModel, _ = order_models(active_list)
+    orders = OrderModel.query.outerjoin(DeliverySlot).options(
+        contains_eager(OrderModel.delivery_slot)
+    ).filter(OrderModel.weekly_list_id == active_list.id).order_by(
+        db.case((DeliverySlot.id.is_(None), 1), else_=0),
+        DeliverySlot.starts_at,
+        OrderModel.created_at.desc()
+    ).all()
+    
+    orders_per_slot = {}
+    for order in orders:
+        orders_per_slot[order.delivery_slot_id] = orders_per_slot.get(order.delivery_slot_id, 0) + 1
+    group_by_slot = any(slot_id is not None for slot_id in orders_per_slot)
     
     orders_html = ""
+    current_slot = -1
     for order in orders:
-        phone = f"📞 {order.customer_phone}" if order.customer_phone else ""
-        address = f"📍 {order.delivery_address[:50]}..." if order.delivery_address else "📍 Endereço não informado"
+        if group_by_slot and order.delivery_slot_id != current_slot:
+            current_slot = order.delivery_slot_id
+            slot = order.delivery_slot
+            if slot:
+                heading = f"🕒 {slot.label} — {orders_per_slot[current_slot]} de {slot.capacity} vagas"
+            else:
+                heading = f"Sem horário definido — {orders_per_slot[current_slot]} pedidos"
+            orders_html += f'<tr><th colspan="5" style="background: #e9f7ef;">{heading}</th></tr>'
+        
+        phone = f"📞 {escape(order.customer_phone)}" if order.customer_phone else ""
+        address = f"📍 {escape(order.delivery_address[:50])}..." if order.delivery_address else "📍 Endereço não informado"
         
         orders_html += f"""
         <tr>
+            <td><input type="checkbox" name="ids" value="{order.id}" form="print-form"></td>
             <td>
-                <strong>{order.customer_name}</strong><br>
+                <strong>{customer_link(order)}</strong><br>
                 <small>{phone}</small><br>
                 <small>{address}</small>
             </td>
@@ -1029,35 +3409,151 @@ def admin_orders():
         """
     
     if not orders_html:
-        orders_html = "<tr><td colspan='4'>Nenhum pedido ainda</td></tr>"
+        orders_html = "<tr><td colspan='5'>Nenhum pedido ainda</td></tr>"
     
     return f"""
     <html>
     <head><title>Pedidos</title>{get_base_style()}</head>
     <body>
-        <div class="nav">
-            <a href="/admin">Dashboard</a>
-            <a href="/admin/orders">Pedidos</a>
-            <a href="/admin/products">Produtos</a>
-            <a href="/admin/categories">Categorias</a>
-            <a href="/admin/create-list">Nova Lista</a>
-            <a href="/admin/reports">Relatórios</a>
-            <a href="/admin/logout">Sair</a>
-        </div>
+        {get_admin_nav()}
         <div class="container">
             <h1>📋 Pedidos da Semana</h1>
-            <p><strong>Período:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}</p>
+            <p><strong>Período:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}{' (arquivada)' if active_list.archived_at else ''}</p>
+            {weekly_list_picker('/admin/orders', active_list)}
+            
+            <form id="print-form" method="GET" action="/admin/orders/print" style="margin-bottom: 20px;">
+                <button type="submit" class="btn">🖨️ Imprimir Selecionados</button>
+                <a href="/admin/orders/print?list={active_list.id}" class="btn btn-warning">🖨️ Imprimir Todos</a>
+            </form>
             
             <table>
                 <thead>
-                    <tr><th>Cliente</th><th>Total</th><th>Data/Hora</th><th>Ações</th></tr>
+                    <tr><th><input type="checkbox" onclick="document.querySelectorAll('input[name=ids]').forEach(box => box.checked = this.checked)"></th><th>Cliente</th><th>Total</th><th>Data/Hora</th><th>Ações</th></tr>
                 </thead>
-                <tbody>
+                <tbody id="orders-body">
                     {orders_html}
                 </tbody>
             </table>
             
-            <p><em>Total: {len(orders)} pedidos</em></p>
+            <p><em>Total: <span id="orders-total">{len(orders)}</span> pedidos</em></p>
+        </div>
+        {live_orders_script(active_list.id, 'orders-body', 'orders-total', None, True) if active_list.is_active else ''}
+    </body>
+    </html>
+    """
+
+def load_orders_with_items(weekly_list=None, order_ids=None):
+    # Pedidos e itens em consultas fixas (pedidos + itens por tabela), seja
+    # qual for a quantidade de pedidos. Os itens já trazem nome e unidade do
+    # produto, sem passar pelo catálogo. Vêm por subqueryload: o selectinload
+    # quebra em lotes de 500 pedidos.
+    if weekly_list is not None:
+        sources = [order_models(weekly_list)]
+    else:
+        sources = [(Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)]
+    
+    orders = []
+    missing = set(order_ids or [])
+    for OrderModel, ItemModel in sources:
+        query = OrderModel.query.options(
+            subqueryload(OrderModel.items),
+            joinedload(OrderModel.delivery_slot)
+        )
+        if weekly_list is not None:
+            query = query.filter(OrderModel.weekly_list_id == weekly_list.id)
+        else:
+            if not missing:
+                break
+            query = query.filter(OrderModel.id.in_(missing))
+        found = query.all()
+        orders.extend(found)
+        missing.difference_update(order.id for order in found)
+    
+    # Mesma ordem da tela de pedidos: por horário de entrega, depois por chegada
+    orders.sort(key=lambda order: (
+        order.delivery_slot is None,
+        order.delivery_slot.starts_at if order.delivery_slot else datetime.min,
+        order.created_at or datetime.min
+    ))
+    return orders
+
+@app.route('/admin/orders/print')
+@read_replica
+def admin_orders_print():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    order_ids = request.args.getlist('ids', type=int)
+    weekly_list = None
+    if not order_ids:
+        weekly_list = selected_weekly_list()
+        if not weekly_list:
+            return redirect('/admin/orders')
+    orders = load_orders_with_items(weekly_list, order_ids)
+    
+    sheets_html = ""
+    for order in orders:
+        items_html = ""
+        for item in order.items:
+            items_html += f"""
+            <tr>
+                <td>☐</td>
+                <td>{escape(item.product_name)}</td>
+                <td>{item.quantity} {escape(item.unit)}</td>
+                <td>R$ {item.unit_price:.2f}</td>
+                <td>R$ {item.total_price:.2f}</td>
+            </tr>
+            """
+        slot = order.delivery_slot.label if order.delivery_slot else 'Sem horário definido'
+        sheets_html += f"""
+        <div class="order-sheet">
+            <h2>Pedido #{order.id} — {escape(order.customer_name)}</h2>
+            <p>📞 {escape(order.customer_phone or 'Não informado')} · 🕒 {slot} · {order.created_at.strftime('%d/%m/%Y %H:%M')}</p>
+            <p>📍 {escape(order.delivery_address or 'Endereço não informado')}</p>
+            <table>
+                <thead>
+                    <tr><th></th><th>Produto</th><th>Quantidade</th><th>Preço Unit.</th><th>Total</th></tr>
+                </thead>
+                <tbody>
+                    {items_html}
+                </tbody>
+            </table>
+            <p style="text-align: right;">
+                Subtotal: R$ {order.total_amount - (order.delivery_fee or 0):.2f} ·
+                Entrega: R$ {order.delivery_fee or 0:.2f} ·
+                <strong>Total: R$ {order.total_amount:.2f}</strong>
+            </p>
+        </div>
+        """
+    
+    if not sheets_html:
+        sheets_html = "<p>Nenhum pedido selecionado.</p>"
+    
+    title = f"Pedidos de {weekly_list.week_start.strftime('%d/%m')} a {weekly_list.week_end.strftime('%d/%m/%Y')}" if weekly_list else "Pedidos selecionados"
+    
+    return f"""
+    <html>
+    <head>
+        <title>Imprimir Pedidos</title>{get_base_style()}
+        <style>
+            .order-sheet {{ margin-top: 30px; }}
+            @media print {{
+                .nav, .no-print {{ display: none; }}
+                .container {{ box-shadow: none; max-width: none; }}
+                .order-sheet {{ page-break-after: always; }}
+            }}
+        </style>
+    </head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>🖨️ {title}</h1>
+            <p class="no-print">
+                {len(orders)} pedidos.
+                <button type="button" class="btn" onclick="window.print()">🖨️ Imprimir</button>
+                <a href="/admin/orders" class="btn btn-warning">← Voltar aos Pedidos</a>
+            </p>
+            {sheets_html}
         </div>
     </body>
     </html>
@@ -1068,45 +3564,42 @@ def admin_order_detail(order_id):
     if not is_admin_logged_in():
         return redirect('/admin/login')
     
-    order = Order.query.get_or_404(order_id)
+    # Procura nas tabelas quentes e, se não achar, no arquivo (os ids são os mesmos)
+    orders = load_orders_with_items(order_ids=[order_id])
+    if not orders:
+        abort(404)
+    order = orders[0]
     
     # Itens do pedido
     items_html = ""
     for item in order.items:
         items_html += f"""
         <tr>
-            <td>{item.product.name}</td>
-            <td>{item.quantity} {item.product.unit}</td>
+            <td>{escape(item.product_name)}</td>
+            <td>{item.quantity} {escape(item.unit)}</td>
             <td>R$ {item.unit_price:.2f}</td>
             <td>R$ {item.total_price:.2f}</td>
         </tr>
         """
     
-    phone = order.customer_phone if order.customer_phone else "Não informado"
-    address = order.delivery_address if order.delivery_address else "Não informado"
+    phone = escape(order.customer_phone) if order.customer_phone else "Não informado"
+    address = escape(order.delivery_address) if order.delivery_address else "Não informado"
     
     return f"""
     <html>
     <head><title>Detalhes do Pedido</title>{get_base_style()}</head>
     <body>
-        <div class="nav">
-            <a href="/admin">Dashboard</a>
-            <a href="/admin/orders">Pedidos</a>
-            <a href="/admin/products">Produtos</a>
-            <a href="/admin/categories">Categorias</a>
-            <a href="/admin/create-list">Nova Lista</a>
-            <a href="/admin/reports">Relatórios</a>
-            <a href="/admin/logout">Sair</a>
-        </div>
+        {get_admin_nav()}
         <div class="container">
             <h1>📋 Detalhes do Pedido #{order.id}</h1>
             
             <div class="product-grid" style="margin-bottom: 30px;">
                 <div class="product-card">
                     <h3>👤 Cliente</h3>
-                    <p><strong>{order.customer_name}</strong></p>
+                    <p><strong>{customer_link(order)}</strong></p>
                     <p>📞 {phone}</p>
                     <p>📍 {address}</p>
+                    <p>🕒 {order.delivery_slot.label if order.delivery_slot else 'Sem horário definido'}</p>
                 </div>
                 <div class="product-card">
                     <h3>📅 Informações</h3>
@@ -1150,96 +3643,318 @@ def admin_order_detail(order_id):
     </html>
     """
 
-@app.route('/admin/products')
-def admin_products():
+CUSTOMERS_PER_PAGE = 50
+
+@app.route('/admin/customers')
+@read_replica
+def admin_customers():
     if not is_admin_logged_in():
         return redirect('/admin/login')
     
-    products = Product.query.join(Category).order_by(Category.order, Product.name).all()
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
     
-    products_html = ""
-    for product in products:
-        status = "✅ Ativo" if product.is_active else "❌ Inativo"
-        agroecological = "🌱" if product.is_organic else ""
-        products_html += f"""
+    query = Customer.query
+    if search:
+        phone = normalize_phone(search)
+        if phone:
+            query = query.filter(Customer.phone == phone)
+        else:
+            query = query.filter(Customer.name.ilike(f"%{search}%"))
+    pagination = query.order_by(Customer.last_order_at.desc(), Customer.id.desc()).paginate(
+        page=page, per_page=CUSTOMERS_PER_PAGE, error_out=False
+    )
+    
+    customers_html = ""
+    for customer in pagination.items:
+        last_order = customer.last_order_at.strftime('%d/%m/%Y') if customer.last_order_at else '-'
+        customers_html += f"""
         <tr>
-            <td>{product.category.emoji} {product.category.name}</td>
-            <td>{product.name} {agroecological}</td>
-            <td>R$ {product.price:.2f}</td>
-            <td>{product.unit}</td>
-            <td>{status}</td>
-            <td>
-                <a href="/admin/products/{product.id}/edit" class="btn btn-warning btn-sm">✏️ Editar</a>
-                <a href="/admin/products/{product.id}/delete" class="btn btn-danger btn-sm" onclick="return confirm('Tem certeza?')">🗑️ Deletar</a>
-            </td>
+            <td><strong>{escape(customer.name)}</strong><br><small>📞 {customer.phone}</small></td>
+            <td>{customer.order_count}</td>
+            <td>R$ {format_brl(customer.total_spent)}</td>
+            <td>{last_order}</td>
+            <td><a href="/admin/customers/{customer.id}" class="btn btn-sm">👁️ Histórico</a></td>
         </tr>
         """
     
-    # Opções de categoria para novo produto
-    categories = Category.query.order_by(Category.order).all()
-    category_options = ""
-    for cat in categories:
-        category_options += f'<option value="{cat.id}">{cat.emoji} {cat.name}</option>'
+    if not customers_html:
+        customers_html = "<tr><td colspan='5'>Nenhum cliente encontrado</td></tr>"
+    
+    def page_url(number):
+        args = request.args.to_dict()
+        args['page'] = number
+        return f"/admin/customers?{urlencode(args)}"
+    
+    pages_html = ""
+    if pagination.has_prev:
+        pages_html += f'<a href="{page_url(pagination.prev_num)}" class="btn btn-sm">← Anterior</a>'
+    if pagination.pages > 1:
+        pages_html += f' Página {pagination.page} de {pagination.pages} '
+    if pagination.has_next:
+        pages_html += f'<a href="{page_url(pagination.next_num)}" class="btn btn-sm">Próxima →</a>'
     
     return f"""
     <html>
-    <head><title>Produtos</title>{get_base_style()}</head>
+    <head><title>Clientes</title>{get_base_style()}</head>
     <body>
-        <div class="nav">
-            <a href="/admin">Dashboard</a>
-            <a href="/admin/orders">Pedidos</a>
-            <a href="/admin/products">Produtos</a>
-            <a href="/admin/categories">Categorias</a>
-            <a href="/admin/create-list">Nova Lista</a>
-            <a href="/admin/reports">Relatórios</a>
-            <a href="/admin/logout">Sair</a>
-        </div>
+        {get_admin_nav()}
         <div class="container">
-            <h1>📦 Gestão de Produtos</h1>
+            <h1>👥 Clientes</h1>
             
-            <button onclick="document.getElementById('addModal').style.display='block'" class="btn">➕ Adicionar Produto</button>
+            <form method="GET" action="/admin/customers" style="display: flex; gap: 10px; margin-bottom: 20px;">
+                <input type="search" name="q" class="form-control" placeholder="🔍 Nome ou telefone" value="{escape(search)}">
+                <button type="submit" class="btn">Buscar</button>
+            </form>
             
             <table>
                 <thead>
-                    <tr><th>Categoria</th><th>Produto</th><th>Preço</th><th>Unidade</th><th>Status</th><th>Ações</th></tr>
+                    <tr><th>Cliente</th><th>Pedidos</th><th>Total gasto</th><th>Último pedido</th><th>Ações</th></tr>
                 </thead>
                 <tbody>
-                    {products_html}
+                    {customers_html}
                 </tbody>
             </table>
             
-            <p><em>Total: {len(products)} produtos cadastrados</em></p>
+            <p>{pages_html}</p>
+            <p><em>Total: {pagination.total} clientes</em></p>
         </div>
-        
-        <!-- Modal Adicionar Produto -->
-        <div id="addModal" class="modal">
-            <div class="modal-content">
-                <span class="close" onclick="document.getElementById('addModal').style.display='none'">&times;</span>
-                <h2>➕ Adicionar Produto</h2>
-                <form method="POST" action="/admin/products/add">
-                    <div class="form-group">
-                        <label>Nome do produto:</label>
-                        <input type="text" name="name" class="form-control" required>
-                    </div>
-                    <div class="form-group">
-                        <label>Preço:</label>
-                        <input type="number" name="price" class="form-control" step="0.01" required>
-                    </div>
-                    <div class="form-group">
-                        <label>Unidade:</label>
-                        <input type="text" name="unit" class="form-control" placeholder="kg, un, maço, etc." required>
-                    </div>
-                    <div class="form-group">
-                        <label>Categoria:</label>
-                        <select name="category_id" class="form-control" required>
-                            {category_options}
-                        </select>
-                    </div>
-                    <div class="form-group">
+    </body>
+    </html>
+    """
+
+@app.route('/admin/customers/<int:customer_id>')
+@read_replica
+def admin_customer_detail(customer_id):
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    customer = Customer.query.get_or_404(customer_id)
+    page = request.args.get('page', 1, type=int)
+    # Histórico pelo índice de customer_id (pedidos quentes e arquivados numa
+    # só consulta), sem varrer as tabelas de pedidos
+    history = db.union_all(*[
+        db.select(model.id, model.created_at, model.delivery_address, model.total_amount).where(model.customer_id == customer.id)
+        for model in (Order, ArchivedOrder)
+    ]).subquery()
+    orders = db.session.execute(
+        db.select(history).order_by(history.c.created_at.desc())
+        .limit(CUSTOMERS_PER_PAGE).offset((max(page, 1) - 1) * CUSTOMERS_PER_PAGE)
+    ).all()
+    
+    orders_html = ""
+    for order in orders:
+        orders_html += f"""
+        <tr>
+            <td>#{order.id}</td>
+            <td>{order.created_at.strftime('%d/%m/%Y %H:%M')}</td>
+            <td>{escape(order.delivery_address or '-')}</td>
+            <td>R$ {order.total_amount:.2f}</td>
+            <td><a href="/admin/orders/{order.id}" class="btn btn-sm">👁️ Ver Detalhes</a></td>
+        </tr>
+        """
+    
+    if not orders_html:
+        orders_html = "<tr><td colspan='5'>Nenhum pedido vinculado</td></tr>"
+    
+    # Total de páginas vem do contador do cliente, não de um COUNT(*)
+    pages = max(1, -(-customer.order_count // CUSTOMERS_PER_PAGE))
+    pages_html = ""
+    if page > 1:
+        pages_html += f'<a href="/admin/customers/{customer.id}?page={page - 1}" class="btn btn-sm">← Anterior</a>'
+    if pages > 1:
+        pages_html += f' Página {page} de {pages} '
+    if page < pages:
+        pages_html += f'<a href="/admin/customers/{customer.id}?page={page + 1}" class="btn btn-sm">Próxima →</a>'
+    
+    average = customer.total_spent / customer.order_count if customer.order_count else 0
+    first_seen = customer.created_at.strftime('%d/%m/%Y') if customer.created_at else '-'
+    last_order = customer.last_order_at.strftime('%d/%m/%Y %H:%M') if customer.last_order_at else '-'
+    
+    return f"""
+    <html>
+    <head><title>Cliente</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>👤 {escape(customer.name)}</h1>
+            
+            <div class="product-grid" style="margin-bottom: 30px;">
+                <div class="product-card">
+                    <h3>📇 Contato</h3>
+                    <p>📞 {customer.phone}</p>
+                    <p>📍 {escape(customer.delivery_address or 'Endereço não informado')}</p>
+                    <p><strong>Cliente desde:</strong> {first_seen}</p>
+                </div>
+                <div class="product-card">
+                    <h3>🛒 Compras</h3>
+                    <p><strong>Pedidos:</strong> {customer.order_count}</p>
+                    <p><strong>Total gasto:</strong> R$ {format_brl(customer.total_spent)}</p>
+                    <p><strong>Ticket médio:</strong> R$ {format_brl(average)}</p>
+                    <p><strong>Último pedido:</strong> {last_order}</p>
+                </div>
+            </div>
+            
+            <h3>📋 Histórico de Pedidos</h3>
+            <table>
+                <thead>
+                    <tr><th>Pedido</th><th>Data/Hora</th><th>Endereço</th><th>Total</th><th>Ações</th></tr>
+                </thead>
+                <tbody>
+                    {orders_html}
+                </tbody>
+            </table>
+            
+            <p>{pages_html}</p>
+            
+            <div style="margin-top: 30px;">
+                <a href="/admin/customers" class="btn">← Voltar aos Clientes</a>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/products')
+def admin_products():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    # Busca e filtros (paginados no banco)
+    search = request.args.get('q', '').strip()
+    category_id = request.args.get('category', type=int)
+    organic_filter = request.args.get('organic', '')
+    active_filter = request.args.get('active', '')
+    page = request.args.get('page', 1, type=int)
+    
+    pagination = search_products(
+        search=search,
+        category_id=category_id,
+        is_organic={'1': True, '0': False}.get(organic_filter),
+        is_active={'1': True, '0': False}.get(active_filter)
+    ).paginate(page=page, per_page=PRODUCTS_PER_PAGE, error_out=False)
+    products = pagination.items
+    
+    products_html = ""
+    for product in products:
+        status = "✅ Ativo" if product.is_active else "❌ Inativo"
+        agroecological = "🌱" if product.is_organic else ""
+        products_html += f"""
+        <tr>
+            <td>{product.category.emoji} {product.category.name}</td>
+            <td>{product.name} {agroecological}</td>
+            <td>R$ {product.price:.2f}</td>
+            <td>{product.unit}</td>
+            <td>{status}</td>
+            <td>
+                <a href="/admin/products/{product.id}/edit" class="btn btn-warning btn-sm">✏️ Editar</a>
+                <a href="/admin/products/{product.id}/delete" class="btn btn-danger btn-sm" onclick="return confirm('Tem certeza?')">🗑️ Deletar</a>
+            </td>
+        </tr>
+        """
+    
+    if not products_html:
+        products_html = "<tr><td colspan='6'>Nenhum produto encontrado</td></tr>"
+    
+    # Opções de categoria para novo produto e para o filtro
+    categories = Category.query.order_by(Category.order).all()
+    category_options = ""
+    filter_category_options = '<option value="">Todas as categorias</option>'
+    for cat in categories:
+        category_options += f'<option value="{cat.id}">{cat.emoji} {cat.name}</option>'
+        selected = "selected" if cat.id == category_id else ""
+        filter_category_options += f'<option value="{cat.id}" {selected}>{cat.emoji} {cat.name}</option>'
+    
+    def filter_options(options, current):
+        return ''.join(
+            f'<option value="{value}" {"selected" if value == current else ""}>{label}</option>'
+            for value, label in options
+        )
+    
+    def page_url(number):
+        args = request.args.to_dict()
+        args['page'] = number
+        return f"/admin/products?{urlencode(args)}"
+    
+    pages_html = ""
+    if pagination.has_prev:
+        pages_html += f'<a href="{page_url(pagination.prev_num)}" class="btn btn-sm">← Anterior</a>'
+    if pagination.pages > 1:
+        pages_html += f' Página {pagination.page} de {pagination.pages} '
+    if pagination.has_next:
+        pages_html += f'<a href="{page_url(pagination.next_num)}" class="btn btn-sm">Próxima →</a>'
+    
+    return f"""
+    <html>
+    <head><title>Produtos</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>📦 Gestão de Produtos</h1>
+            
+            <button onclick="document.getElementById('addModal').style.display='block'" class="btn">➕ Adicionar Produto</button>
+            
+            <form method="GET" action="/admin/products" class="product-grid" style="margin-top: 20px;">
+                <input type="search" name="q" class="form-control" placeholder="🔍 Buscar por nome (ex: limao, rucula)" value="{escape(search)}">
+                <select name="category" class="form-control">{filter_category_options}</select>
+                <select name="organic" class="form-control">
+                    {filter_options([('', 'Agroecológico e convencional'), ('1', '🌱 Só agroecológicos'), ('0', 'Só convencionais')], organic_filter)}
+                </select>
+                <select name="active" class="form-control">
+                    {filter_options([('', 'Ativos e inativos'), ('1', '✅ Só ativos'), ('0', '❌ Só inativos')], active_filter)}
+                </select>
+                <div>
+                    <button type="submit" class="btn">Filtrar</button>
+                    <a href="/admin/products" class="btn btn-warning">Limpar</a>
+                </div>
+            </form>
+            
+            <table>
+                <thead>
+                    <tr><th>Categoria</th><th>Produto</th><th>Preço</th><th>Unidade</th><th>Status</th><th>Ações</th></tr>
+                </thead>
+                <tbody>
+                    {products_html}
+                </tbody>
+            </table>
+            
+            <p>{pages_html}</p>
+            <p><em>Total: {pagination.total} produtos encontrados</em></p>
+        </div>
+        
+        <!-- Modal Adicionar Produto -->
+        <div id="addModal" class="modal">
+            <div class="modal-content">
+                <span class="close" onclick="document.getElementById('addModal').style.display='none'">&times;</span>
+                <h2>➕ Adicionar Produto</h2>
+                <form method="POST" action="/admin/products/add" enctype="multipart/form-data">
+                    <div class="form-group">
+                        <label>Nome do produto:</label>
+                        <input type="text" name="name" class="form-control" required>
+                    </div>
+                    <div class="form-group">
+                        <label>Preço:</label>
+                        <input type="number" name="price" class="form-control" step="0.01" required>
+                    </div>
+                    <div class="form-group">
+                        <label>Unidade:</label>
+                        <input type="text" name="unit" class="form-control" placeholder="kg, un, maço, etc." required>
+                    </div>
+                    <div class="form-group">
+                        <label>Categoria:</label>
+                        <select name="category_id" class="form-control" required>
+                            {category_options}
+                        </select>
+                    </div>
+                    <div class="form-group">
                         <label>
                             <input type="checkbox" name="is_organic" value="1"> 🌱 Produto agroecológico
                         </label>
                     </div>
+                    <div class="form-group">
+                        <label>Foto (opcional):</label>
+                        <input type="file" name="image" class="form-control" accept="image/jpeg,image/png,image/webp">
+                    </div>
                     <button type="submit" class="btn">Adicionar</button>
                 </form>
             </div>
@@ -1253,6 +3968,11 @@ def admin_add_product():
     if not is_admin_logged_in():
         return redirect('/admin/login')
     
+    try:
+        image = read_uploaded_image()
+    except images.InvalidImage as e:
+        return error_page(f'Foto não aceita: {e}', '/admin/products')
+    
     try:
         product = Product(
             name=request.form['name'],
@@ -1262,10 +3982,15 @@ def admin_add_product():
             category_id=int(request.form['category_id'])
         )
         db.session.add(product)
-        db.session.commit()
+        if image:
+            # Produto e tarefa das miniaturas entram no mesmo commit
+            db.session.flush()
+            queue_product_image(product.id, image)
+        else:
+            db.session.commit()
         return redirect('/admin/products')
-    except Exception as e:
-        return f"<h1>Erro ao adicionar produto: {e}</h1>"
+    except Exception:
+        return failure_response('adicionar o produto', '/admin/products')
 
 @app.route('/admin/products/<int:product_id>/edit', methods=['GET', 'POST'])
 def admin_edit_product(product_id):
@@ -1276,17 +4001,31 @@ def admin_edit_product(product_id):
     
     if request.method == 'POST':
         try:
+            image = read_uploaded_image()
+        except images.InvalidImage as e:
+            return error_page(f'Foto não aceita: {e}', f'/admin/products/{product_id}/edit')
+        
+        try:
+            previous_category_id = product.category_id
             product.name = request.form['name']
             product.price = float(request.form['price'])
             product.unit = request.form['unit']
             product.is_organic = bool(request.form.get('is_organic'))
             product.category_id = int(request.form['category_id'])
             product.is_active = bool(request.form.get('is_active'))
+            if request.form.get('remove_image'):
+                product.image_key = None
+                product.image_widths = None
             
-            db.session.commit()
+            category_id = product.category_id
+            if image:
+                queue_product_image(product_id, image)
+            else:
+                db.session.commit()
+            invalidate_storefront(previous_category_id, category_id)
             return redirect('/admin/products')
-        except Exception as e:
-            return f"<h1>Erro ao editar produto: {e}</h1>"
+        except Exception:
+            return failure_response('editar o produto', '/admin/products')
     
     # Opções de categoria
     categories = Category.query.order_by(Category.order).all()
@@ -1305,7 +4044,7 @@ def admin_edit_product(product_id):
         <div class="container">
             <h1>✏️ Editar Produto</h1>
             
-            <form method="POST">
+            <form method="POST" enctype="multipart/form-data">
                 <div class="form-group">
                     <label>Nome do produto:</label>
                     <input type="text" name="name" class="form-control" value="{product.name}" required>
@@ -1334,6 +4073,13 @@ def admin_edit_product(product_id):
                         <input type="checkbox" name="is_active" value="1" {active_checked}> ✅ Produto ativo
                     </label>
                 </div>
+                <div class="form-group">
+                    <label>Foto:</label>
+                    {product_picture(product, size=160, eager=True) or '<p><em>Sem foto</em></p>'}
+                    <input type="file" name="image" class="form-control" accept="image/jpeg,image/png,image/webp">
+                    <small>A nova foto aparece na loja em alguns segundos, depois que as miniaturas ficam prontas.</small>
+                    {'<label><input type="checkbox" name="remove_image" value="1"> 🗑️ Remover foto</label>' if product.image_key else ''}
+                </div>
                 <button type="submit" class="btn">💾 Salvar</button>
                 <a href="/admin/products" class="btn btn-danger">❌ Cancelar</a>
             </form>
@@ -1349,11 +4095,51 @@ def admin_delete_product(product_id):
     
     try:
         product = Product.query.get_or_404(product_id)
+        category_id = product.category_id
         db.session.delete(product)
         db.session.commit()
+        invalidate_storefront(category_id)
         return redirect('/admin/products')
-    except Exception as e:
-        return f"<h1>Erro ao deletar produto: {e}</h1>"
+    except Exception:
+        return failure_response('excluir o produto', '/admin/products')
+
+# Previsão de demanda (forecasting.py): recalculada só quando o histórico
+# muda, isto é, quando uma lista é encerrada ou substituída por outra
+FORECAST_CACHE_SECONDS = float(os.environ.get('FORECAST_CACHE_SECONDS', str(24 * 60 * 60)))
+forecast_cache = TTLCache(FORECAST_CACHE_SECONDS)
+
+def history_lists_filter():
+    # Semanas que já terminaram: abriram e depois foram encerradas ou saíram do
+    # ar (lista programada que ainda não abriu não tem vendas a contar)
+    return db.and_(
+        WeeklyList.opened_at.isnot(None),
+        db.or_(WeeklyList.is_closed.is_(True), WeeklyList.is_active.isnot(True))
+    )
+
+def get_demand_forecast(target_week):
+    # {product_id: forecasting.Forecast} para a semana que começa em target_week
+    version = tuple(db.session.query(db.func.count(WeeklyList.id), db.func.max(WeeklyList.id)).filter(
+        history_lists_filter()
+    ).one())
+    
+    def load():
+        with use_read_replica():
+            history_ids = db.select(WeeklyList.id).where(history_lists_filter())
+            lists = db.session.query(WeeklyList.id, WeeklyList.week_start).filter(history_lists_filter()).all()
+            offered = db.session.execute(
+                db.select(WeeklyProduct.weekly_list_id, WeeklyProduct.product_id).where(WeeklyProduct.weekly_list_id.in_(history_ids))
+            ).all()
+            # Semanas sem resumo somadas na hora, as outras pelos totais gravados
+            sales = db.session.execute(db.union_all(
+                db.select(Order.weekly_list_id, OrderItem.product_id, db.func.sum(OrderItem.quantity))
+                .join(Order, Order.id == OrderItem.order_id)
+                .where(Order.weekly_list_id.in_(history_ids), Order.weekly_list_id.notin_(frozen_list_ids()))
+                .group_by(Order.weekly_list_id, OrderItem.product_id),
+                db.select(WeeklyProductSales.weekly_list_id, WeeklyProductSales.product_id, WeeklyProductSales.quantity)
+            )).all()
+        history = forecasting.build_history(lists, offered, sales)
+        return forecasting.forecast_demand(history, target_week)
+    return forecast_cache.get((version, target_week), load)
 
 @app.route('/admin/create-list', methods=['GET', 'POST'])
 def admin_create_weekly_list():
@@ -1362,29 +4148,43 @@ def admin_create_weekly_list():
     
     if request.method == 'POST':
         try:
-            # Desativar lista anterior
-            WeeklyList.query.filter_by(is_active=True).update({'is_active': False})
-            
-            # Criar nova lista
             week_start = datetime.strptime(request.form['week_start'], '%Y-%m-%d').date()
             week_end = datetime.strptime(request.form['week_end'], '%Y-%m-%d').date()
+            opens_at = parse_schedule(request.form.get('opens_at'))
+            closes_at = parse_schedule(request.form.get('closes_at'))
+            
+            # Abertura no futuro: a lista atual continua no ar e o agendador
+            # troca as duas no horário. Senão a nova lista entra agora.
+            now = shop_now()
+            scheduled = opens_at is not None and opens_at > now
+            if not scheduled:
+                close_replaced_lists(now)
             
             weekly_list = WeeklyList(
                 week_start=week_start,
                 week_end=week_end,
-                is_active=True
+                is_active=not scheduled,
+                opens_at=opens_at,
+                closes_at=closes_at,
+                opened_at=None if scheduled else now
             )
             db.session.add(weekly_list)
             db.session.flush()
             
-            # Adicionar produtos selecionados
-            selected_products = request.form.getlist('products')
-            for product_id in selected_products:
-                weekly_product = WeeklyProduct(
-                    weekly_list_id=weekly_list.id,
-                    product_id=int(product_id)
-                )
-                db.session.add(weekly_product)
+            # Adicionar produtos selecionados com a cópia de nome, unidade e
+            # preço de agora (um único INSERT ... SELECT do catálogo)
+            selected_products = [int(product_id) for product_id in request.form.getlist('products')]
+            if selected_products:
+                stocks = {product_id: parse_stock(request.form.get(f'stock_{product_id}')) for product_id in selected_products}
+                stocks = {product_id: stock for product_id, stock in stocks.items() if stock is not None}
+                stock = db.case(stocks, value=Product.id, else_=None) if stocks else db.null()
+                db.session.execute(insert(WeeklyProduct).from_select(
+                    ['weekly_list_id', 'product_id', 'stock', 'name', 'unit', 'price', 'is_organic'],
+                    db.select(
+                        db.literal(weekly_list.id), Product.id, stock,
+                        Product.name, Product.unit, Product.price, Product.is_organic
+                    ).where(Product.id.in_(selected_products))
+                ))
             
             db.session.commit()
             
@@ -1394,7 +4194,7 @@ def admin_create_weekly_list():
             <body>
                 <div class="container">
                     <div class="alert alert-success">
-                        ✅ Lista semanal criada com sucesso!
+                        ✅ Lista semanal criada com sucesso!{f" Os pedidos abrem em {opens_at.strftime('%d/%m às %H:%M')}." if scheduled else ''}
                     </div>
                     <a href="/admin" class="btn">Voltar ao Dashboard</a>
                     <a href="/" class="btn">Ver Site</a>
@@ -1403,39 +4203,50 @@ def admin_create_weekly_list():
             </html>
             """
             
-        except Exception as e:
-            return f"<h1>Erro ao criar lista: {e}</h1>"
+        except Exception:
+            return failure_response('criar a lista', '/admin/create-list')
     
-    # Buscar produtos por categoria
-    categories = Category.query.order_by(Category.order).all()
+    # Buscar produtos ativos agrupados por categoria (uma única consulta)
+    active_products = Product.query.join(Category).options(
+        contains_eager(Product.category)
+    ).filter(Product.is_active == True).order_by(Category.order, Product.name).all()
+    
+    products_by_category = {}
+    for product in active_products:
+        products_by_category.setdefault(product.category, []).append(product)
+    
+    # Sugestão de compra para a próxima semana (segunda-feira que vem)
+    today = datetime.utcnow().date()
+    next_week = today + timedelta(days=7 - today.weekday())
+    forecasts = get_demand_forecast(next_week)
     
     products_html = ""
-    for category in categories:
-        products = Product.query.filter_by(category_id=category.id, is_active=True).order_by(Product.name).all()
-        if products:
-            products_html += f'<h4>{category.emoji} {category.name}</h4>'
-            for product in products:
-                agroecological = "🌱" if product.is_organic else ""
-                products_html += f"""
-                <label style="display: block; margin: 5px 0;">
-                    <input type="checkbox" name="products" value="{product.id}">
-                    {product.name} {agroecological} - R$ {product.price:.2f}/{product.unit}
-                </label>
+    for category, products in products_by_category.items():
+        products_html += f'<h4>{category.emoji} {category.name}</h4>'
+        for product in products:
+            agroecological = "🌱" if product.is_organic else ""
+            forecast = forecasts.get(product.id)
+            suggestion = ""
+            if forecast:
+                suggestion = f"""
+                <small style="color: #666; margin-left: 10px;" title="Média das últimas semanas: {forecast.moving_average:.1f} · tendência: {forecast.trend:+.2f}/semana · sazonalidade: ×{forecast.seasonal:.2f} · {forecast.weeks} semanas de histórico">
+                    📈 previsão {forecast.quantity:.1f} {product.unit} · comprar <strong>{forecast.suggested:g}</strong>
+                </small>
                 """
+            products_html += f"""
+            <label style="display: block; margin: 5px 0;">
+                <input type="checkbox" name="products" value="{product.id}">
+                {product.name} {agroecological} - R$ {product.price:.2f}/{product.unit}
+                <input type="number" name="stock_{product.id}" min="0" step="0.5" placeholder="Estoque (vazio = sem limite)" style="width: 210px; margin-left: 10px;" data-suggested="{f'{forecast.suggested:g}' if forecast else ''}">
+                {suggestion}
+            </label>
+            """
     
     return f"""
     <html>
     <head><title>Nova Lista</title>{get_base_style()}</head>
     <body>
-        <div class="nav">
-            <a href="/admin">Dashboard</a>
-            <a href="/admin/orders">Pedidos</a>
-            <a href="/admin/products">Produtos</a>
-            <a href="/admin/categories">Categorias</a>
-            <a href="/admin/create-list">Nova Lista</a>
-            <a href="/admin/reports">Relatórios</a>
-            <a href="/admin/logout">Sair</a>
-        </div>
+        {get_admin_nav()}
         <div class="container">
             <h1>📋 Nova Lista Semanal</h1>
             
@@ -1448,10 +4259,19 @@ def admin_create_weekly_list():
                     <label>Data de fim:</label>
                     <input type="date" name="week_end" class="form-control" required>
                 </div>
+                <div class="form-group">
+                    <label>Abrir pedidos em (vazio = agora):</label>
+                    <input type="datetime-local" name="opens_at" class="form-control">
+                </div>
+                <div class="form-group">
+                    <label>Encerrar pedidos em (vazio = só manualmente):</label>
+                    <input type="datetime-local" name="closes_at" class="form-control">
+                </div>
                 
                 <h3>Selecionar Produtos:</h3>
                 <button type="button" onclick="selectAll()" class="btn">Selecionar Todos</button>
                 <button type="button" onclick="selectNone()" class="btn">Desmarcar Todos</button>
+                <button type="button" onclick="fillSuggestions()" class="btn">📈 Usar sugestões como estoque</button>
                 
                 <div style="margin: 20px 0;">
                     {products_html}
@@ -1470,34 +4290,780 @@ def admin_create_weekly_list():
                     const checkboxes = document.querySelectorAll('input[name="products"]');
                     checkboxes.forEach(cb => cb.checked = false);
                 }}
+                
+                function fillSuggestions() {{
+                    // Só nos produtos marcados; os demais continuam sem limite
+                    document.querySelectorAll('input[name="products"]:checked').forEach(cb => {{
+                        const stock = document.querySelector('input[name="stock_' + cb.value + '"]');
+                        if (stock.dataset.suggested) stock.value = stock.dataset.suggested;
+                    }});
+                }}
             </script>
         </div>
     </body>
     </html>
     """
 
+@app.route('/admin/schedule', methods=['GET', 'POST'])
+def admin_list_schedule():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    if request.method == 'POST':
+        try:
+            weekly_list = WeeklyList.query.get_or_404(int(request.form['list_id']))
+            now = shop_now()
+            if request.form.get('action') == 'close_now':
+                weekly_list.closes_at = now
+            else:
+                weekly_list.opens_at = parse_schedule(request.form.get('opens_at'))
+                weekly_list.closes_at = parse_schedule(request.form.get('closes_at'))
+                # Novo encerramento no futuro (ou nenhum) reabre a lista
+                if weekly_list.is_closed and (weekly_list.closes_at is None or weekly_list.closes_at > now):
+                    weekly_list.is_closed = False
+                    if weekly_list.closed_at and not weekly_list.archived_at:
+                        drop_list_totals(weekly_list.id)
+                    weekly_list.closed_at = None
+            db.session.commit()
+            # Horários já vencidos valem agora, sem esperar a próxima rodada
+            run_list_schedule(now)
+            return redirect('/admin/schedule')
+        except ValueError:
+            db.session.rollback()
+            return f"""
+            <html>
+            <head><title>Agenda</title>{get_base_style()}</head>
+            <body>
+                {get_admin_nav()}
+                <div class="container">
+                    <div class="alert alert-error">❌ Data ou horário inválido.</div>
+                    <a href="/admin/schedule" class="btn">Voltar</a>
+                </div>
+            </body>
+            </html>
+            """, 400
+    
+    # Lista ativa e listas que ainda vão abrir
+    weekly_lists = WeeklyList.query.filter(db.or_(
+        WeeklyList.is_active.is_(True),
+        db.and_(WeeklyList.opened_at.is_(None), WeeklyList.opens_at.isnot(None), WeeklyList.is_closed.isnot(True))
+    )).order_by(WeeklyList.week_start).all()
+    
+    closed_ids = [weekly_list.id for weekly_list in weekly_lists if weekly_list.closed_at]
+    summaries = {}
+    if closed_ids:
+        summaries = {
+            summary.weekly_list_id: summary
+            for summary in WeeklyListSummary.query.filter(WeeklyListSummary.weekly_list_id.in_(closed_ids))
+        }
+    
+    window_labels = {'scheduled': '⏳ Aguardando abertura', 'open': '✅ Recebendo pedidos', 'closed': '🔒 Encerrada'}
+    now = shop_now()
+    lists_html = ""
+    for weekly_list in weekly_lists:
+        window = order_window(weekly_list, now)
+        closed_info = ""
+        summary = summaries.get(weekly_list.id)
+        if summary:
+            closed_info = f"<br><small>Encerrada em {weekly_list.closed_at.strftime('%d/%m %H:%M')}: {summary.order_count} pedidos, R$ {summary.revenue:.2f}</small>"
+        close_button = ""
+        if window == 'open':
+            close_button = f"""
+            <form method="POST" style="display: inline;" onsubmit="return confirm('Encerrar os pedidos desta lista agora?')">
+                <input type="hidden" name="list_id" value="{weekly_list.id}">
+                <input type="hidden" name="action" value="close_now">
+                <button type="submit" class="btn btn-danger btn-sm">🔒 Encerrar agora</button>
+            </form>
+            """
+        lists_html += f"""
+        <tr>
+            <td>{weekly_list.week_start.strftime('%d/%m')} a {weekly_list.week_end.strftime('%d/%m/%Y')}</td>
+            <td>{window_labels[window]}{closed_info}</td>
+            <td><input type="datetime-local" name="opens_at" form="schedule-{weekly_list.id}" class="form-control" value="{format_schedule_input(weekly_list.opens_at)}"></td>
+            <td><input type="datetime-local" name="closes_at" form="schedule-{weekly_list.id}" class="form-control" value="{format_schedule_input(weekly_list.closes_at)}"></td>
+            <td>
+                <form method="POST" id="schedule-{weekly_list.id}" style="display: inline;">
+                    <input type="hidden" name="list_id" value="{weekly_list.id}">
+                    <input type="hidden" name="action" value="save">
+                    <button type="submit" class="btn btn-sm">💾 Salvar</button>
+                </form>
+                {close_button}
+            </td>
+        </tr>
+        """
+    
+    if not lists_html:
+        lists_html = "<tr><td colspan='5'>Nenhuma lista ativa ou programada</td></tr>"
+    
+    return f"""
+    <html>
+    <head><title>Agenda</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>⏰ Abertura e Encerramento</h1>
+            <p>Horário da loja: <strong>{now.strftime('%d/%m/%Y %H:%M')}</strong>. No horário de encerramento a loja para de aceitar pedidos e os totais da semana ficam gravados.</p>
+            <table>
+                <thead>
+                    <tr><th>Lista</th><th>Situação</th><th>Abre em</th><th>Encerra em</th><th>Ações</th></tr>
+                </thead>
+                <tbody>
+                    {lists_html}
+                </tbody>
+            </table>
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/slots', methods=['GET', 'POST'])
+def admin_slots():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    active_list = WeeklyList.query.filter_by(is_active=True).first()
+    if not active_list:
+        return redirect('/admin/create-list')
+    
+    if request.method == 'POST':
+        try:
+            if request.form.get('action') == 'add':
+                day = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+                starts_at = datetime.combine(day, datetime.strptime(request.form['start'], '%H:%M').time())
+                ends_at = datetime.combine(day, datetime.strptime(request.form['end'], '%H:%M').time())
+                db.session.add(DeliverySlot(
+                    weekly_list_id=active_list.id,
+                    starts_at=starts_at,
+                    ends_at=ends_at,
+                    capacity=int(request.form['capacity']),
+                    delivery_fee=float(request.form['delivery_fee'].replace(',', '.'))
+                ))
+            else:
+                # Capacidade nunca fica abaixo das vagas já ocupadas
+                capacities = {
+                    int(key[len('capacity_'):]): int(value)
+                    for key, value in request.form.items() if key.startswith('capacity_') and value.strip()
+                }
+                for slot in DeliverySlot.query.filter_by(weekly_list_id=active_list.id):
+                    if slot.id in capacities:
+                        slot.capacity = max(slot.claimed, capacities[slot.id])
+            db.session.commit()
+            slot_cache.invalidate(active_list.id)
+            return redirect('/admin/slots')
+        except Exception:
+            return failure_response('salvar os horários', '/admin/slots')
+    
+    slots = DeliverySlot.query.filter_by(weekly_list_id=active_list.id).order_by(DeliverySlot.starts_at).all()
+    
+    slots_html = ""
+    for slot in slots:
+        delete_link = ""
+        if slot.claimed == 0:
+            delete_link = f'<a href="/admin/slots/{slot.id}/delete" class="btn btn-danger btn-sm" onclick="return confirm(\'Remover este horário?\')">🗑️ Remover</a>'
+        slots_html += f"""
+        <tr>
+            <td>{slot.label}</td>
+            <td>{slot.claimed}</td>
+            <td><input type="number" name="capacity_{slot.id}" class="form-control" min="{slot.claimed}" value="{slot.capacity}"></td>
+            <td>R$ {slot.delivery_fee:.2f}</td>
+            <td>{delete_link}</td>
+        </tr>
+        """
+    
+    if not slots_html:
+        slots_html = "<tr><td colspan='5'>Nenhum horário cadastrado. Sem horários, a loja não pede horário de entrega.</td></tr>"
+    
+    return f"""
+    <html>
+    <head><title>Horários de Entrega</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>🕒 Horários de Entrega</h1>
+            <p><strong>Lista:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}</p>
+            
+            <form method="POST">
+                <input type="hidden" name="action" value="capacity">
+                <table>
+                    <thead>
+                        <tr><th>Horário</th><th>Pedidos</th><th>Capacidade</th><th>Taxa</th><th>Ações</th></tr>
+                    </thead>
+                    <tbody>
+                        {slots_html}
+                    </tbody>
+                </table>
+                <button type="submit" class="btn" style="margin-top: 15px;">💾 Salvar Capacidades</button>
+            </form>
+            
+            <h3 style="margin-top: 30px;">➕ Novo Horário</h3>
+            <form method="POST" class="product-grid">
+                <input type="hidden" name="action" value="add">
+                <div class="form-group">
+                    <label>Dia:</label>
+                    <input type="date" name="date" class="form-control" value="{active_list.week_end.isoformat()}" required>
+                </div>
+                <div class="form-group">
+                    <label>Início:</label>
+                    <input type="time" name="start" class="form-control" value="08:00" required>
+                </div>
+                <div class="form-group">
+                    <label>Fim:</label>
+                    <input type="time" name="end" class="form-control" value="11:00" required>
+                </div>
+                <div class="form-group">
+                    <label>Capacidade (pedidos):</label>
+                    <input type="number" name="capacity" class="form-control" min="1" value="15" required>
+                </div>
+                <div class="form-group">
+                    <label>Taxa de entrega (R$):</label>
+                    <input type="number" name="delivery_fee" class="form-control" step="0.01" min="0" value="10.00" required>
+                </div>
+                <div class="form-group">
+                    <button type="submit" class="btn">Adicionar</button>
+                </div>
+            </form>
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/slots/<int:slot_id>/delete')
+def admin_delete_slot(slot_id):
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    try:
+        slot = DeliverySlot.query.get_or_404(slot_id)
+        if slot.claimed > 0:
+            return error_page(f'Este horário já tem {slot.claimed} pedidos e não pode ser removido.', '/admin/slots')
+        weekly_list_id = slot.weekly_list_id
+        db.session.delete(slot)
+        db.session.commit()
+        slot_cache.invalidate(weekly_list_id)
+        return redirect('/admin/slots')
+    except Exception:
+        return failure_response('remover o horário', '/admin/slots')
+
+@app.route('/admin/routes')
+def admin_routes():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    active_list = WeeklyList.query.filter_by(is_active=True).first()
+    if not active_list:
+        return redirect('/admin/create-list')
+    
+    drivers = max(1, min(request.args.get('drivers', 1, type=int), 20))
+    slot_id = request.args.get('slot', type=int)
+    
+    query = Order.query.outerjoin(DeliverySlot).options(
+        contains_eager(Order.delivery_slot)
+    ).filter(Order.weekly_list_id == active_list.id)
+    if slot_id:
+        query = query.filter(Order.delivery_slot_id == slot_id)
+    orders = {order.id: order for order in query.all()}
+    
+    started = time.perf_counter()
+    stops = build_delivery_stops(orders.values())
+    routes = routing.plan_routes(stops, drivers=drivers, depot=get_depot())
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    slots = DeliverySlot.query.filter_by(weekly_list_id=active_list.id).order_by(DeliverySlot.starts_at).all()
+    slot_options = '<option value="">Todos os horários</option>' + ''.join(
+        f'<option value="{slot.id}" {"selected" if slot.id == slot_id else ""}>{slot.label}</option>' for slot in slots
+    )
+    unlocated = sum(1 for stop in stops if not routing.has_coordinates(stop))
+    
+    sheets_html = ""
+    for number, route in enumerate(routes, 1):
+        rows_html = ""
+        for position, stop in enumerate(route.stops, 1):
+            order = orders[stop.key]
+            slot_label = order.delivery_slot.label if order.delivery_slot else ""
+            located = "" if routing.has_coordinates(stop) else " ⚠️"
+            rows_html += f"""
+            <tr>
+                <td>{position}</td>
+                <td><strong>{escape(order.customer_name)}</strong><br><small>{escape(order.customer_phone or '')}</small></td>
+                <td>{escape(order.delivery_address or 'Endereço não informado')}{located}</td>
+                <td>{slot_label}</td>
+                <td>R$ {order.total_amount:.2f}</td>
+                <td>☐</td>
+            </tr>
+            """
+        sheets_html += f"""
+        <div class="route-sheet">
+            <h2>🚚 Entregador {number} — {len(route.stops)} paradas — ~{route.distance_km:.1f} km</h2>
+            <table>
+                <thead>
+                    <tr><th>#</th><th>Cliente</th><th>Endereço</th><th>Horário</th><th>Cobrar</th><th>Entregue</th></tr>
+                </thead>
+                <tbody>
+                    {rows_html}
+                </tbody>
+            </table>
+        </div>
+        """
+    
+    if not sheets_html:
+        sheets_html = "<p>Nenhum pedido para roteirizar.</p>"
+    
+    return f"""
+    <html>
+    <head>
+        <title>Rotas de Entrega</title>{get_base_style()}
+        <style>
+            .route-sheet {{ margin-top: 30px; }}
+            @media print {{
+                .nav, .no-print {{ display: none; }}
+                .container {{ box-shadow: none; max-width: none; }}
+                .route-sheet {{ page-break-after: always; }}
+            }}
+        </style>
+    </head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>🗺️ Rotas de Entrega</h1>
+            <p><strong>Lista:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}</p>
+            
+            <form method="GET" class="product-grid no-print">
+                <div class="form-group">
+                    <label>Entregadores:</label>
+                    <input type="number" name="drivers" class="form-control" min="1" max="20" value="{drivers}">
+                </div>
+                <div class="form-group">
+                    <label>Horário:</label>
+                    <select name="slot" class="form-control">{slot_options}</select>
+                </div>
+                <div class="form-group">
+                    <button type="submit" class="btn">Calcular Rotas</button>
+                    <button type="button" class="btn btn-warning" onclick="window.print()">🖨️ Imprimir</button>
+                </div>
+            </form>
+            <p class="no-print"><small>{len(stops)} paradas roteirizadas em {elapsed_ms:.0f} ms.
+                {f"⚠️ {unlocated} endereços sem CEP/bairro na tabela de localização vão no fim da rota." if unlocated else ""}
+                <a href="/admin/geolocations">Gerenciar localizações</a></small></p>
+            
+            {sheets_html}
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/geolocations', methods=['GET', 'POST'])
+def admin_geolocations():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    message = ""
+    if request.method == 'POST':
+        # Uma localização por linha: CEP;bairro;cidade;latitude;longitude
+        try:
+            locations = GeoLocation.query.all()
+            by_cep = {loc.cep: loc for loc in locations if loc.cep}
+            by_neighborhood = {(loc.neighborhood or '').lower(): loc for loc in locations if not loc.cep}
+            new_locations = {}
+            imported = 0
+            for line in request.form['locations'].splitlines():
+                fields = [field.strip() for field in line.split(';')]
+                if len(fields) != 5 or not fields[3]:
+                    continue
+                cep = re.sub(r'\D', '', fields[0]) or None
+                neighborhood, city = fields[1] or None, fields[2] or None
+                values = {
+                    'cep': cep, 'neighborhood': neighborhood, 'city': city,
+                    'lat': float(fields[3].replace(',', '.')), 'lng': float(fields[4].replace(',', '.'))
+                }
+                location = by_cep.get(cep) if cep else by_neighborhood.get((neighborhood or '').lower())
+                if location is None:
+                    new_locations[cep or ('bairro', (neighborhood or '').lower())] = values
+                else:
+                    for field, value in values.items():
+                        setattr(location, field, value)
+                imported += 1
+            if new_locations:
+                db.session.execute(insert(GeoLocation), list(new_locations.values()))
+            db.session.commit()
+            message = f'<div class="alert alert-success">✅ {imported} localizações importadas.</div>'
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning('Importação de localizações recusada', exc_info=True)
+            message = f'<div class="alert alert-error">❌ Erro ao importar: {escape(str(e))}</div>'
+    
+    total = GeoLocation.query.count()
+    return f"""
+    <html>
+    <head><title>Localizações</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>📍 Localizações para Rotas</h1>
+            {message}
+            <p><strong>{total}</strong> localizações cadastradas. Os pedidos são localizados pelo CEP do endereço ou, sem CEP, pelo nome do bairro.</p>
+            <form method="POST">
+                <div class="form-group">
+                    <label>Importar (uma por linha: <code>CEP;bairro;cidade;latitude;longitude</code> — CEP pode ficar vazio):</label>
+                    <textarea name="locations" class="form-control" rows="12" placeholder="57035-000;Ponta Verde;Maceió;-9.6658;-35.7110&#10;;Jatiúca;Maceió;-9.6505;-35.7069"></textarea>
+                </div>
+                <button type="submit" class="btn">Importar</button>
+                <a href="/admin/routes" class="btn btn-warning">🗺️ Ver Rotas</a>
+            </form>
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/stock', methods=['GET', 'POST'])
+def admin_stock():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    active_list = WeeklyList.query.filter_by(is_active=True).first()
+    if not active_list:
+        return redirect('/admin/create-list')
+    
+    if request.method == 'POST':
+        try:
+            # Só as linhas alteradas, e só se o estoque ainda for o mostrado na
+            # página: um checkout que baixou o estoque nesse meio-tempo não é
+            # desfeito (a linha fica como está e o admin confere de novo)
+            changes = {}
+            for key, value in request.form.items():
+                if not key.startswith('stock_'):
+                    continue
+                row_id = int(key[len('stock_'):])
+                stock = parse_stock(value)
+                shown = parse_stock(request.form.get(f'shown_{row_id}'))
+                if stock != shown:
+                    changes[row_id] = (shown, stock)
+            conflicts = 0
+            if changes:
+                updated = db.session.execute(
+                    db.update(WeeklyProduct).where(
+                        WeeklyProduct.weekly_list_id == active_list.id,
+                        db.or_(*[
+                            db.and_(WeeklyProduct.id == row_id, WeeklyProduct.stock.is_not_distinct_from(shown))
+                            for row_id, (shown, _) in changes.items()
+                        ])
+                    ).values(stock=db.case(
+                        {row_id: stock for row_id, (_, stock) in changes.items()}, value=WeeklyProduct.id
+                    )).returning(WeeklyProduct.id).execution_options(synchronize_session=False)
+                ).all()
+                conflicts = len(changes) - len(updated)
+            db.session.commit()
+            stock_cache.invalidate(active_list.id)
+            return redirect(f'/admin/stock?conflicts={conflicts}' if conflicts else '/admin/stock')
+        except Exception:
+            return failure_response('atualizar o estoque', '/admin/stock')
+    
+    # Vendido por produto da lista, numa única consulta agregada
+    sold = dict(
+        db.session.query(OrderItem.product_id, db.func.sum(OrderItem.quantity))
+        .join(Order)
+        .filter(Order.weekly_list_id == active_list.id)
+        .group_by(OrderItem.product_id)
+        .all()
+    )
+    weekly_products = WeeklyProduct.query.filter(
+        WeeklyProduct.weekly_list_id == active_list.id
+    ).order_by(WeeklyProduct.name).all()
+    
+    rows_html = ""
+    for wp in weekly_products:
+        stock_value = f"{wp.stock:g}" if wp.stock is not None else ""
+        status = "Sem limite" if wp.stock is None else ("❌ Esgotado" if wp.stock <= 0 else "✅ Disponível")
+        rows_html += f"""
+        <tr>
+            <td>{wp.name}</td>
+            <td>{sold.get(wp.product_id, 0):g} {wp.unit}</td>
+            <td>
+                <input type="number" name="stock_{wp.id}" class="form-control" min="0" step="0.5" value="{stock_value}" placeholder="sem limite">
+                <input type="hidden" name="shown_{wp.id}" value="{'' if wp.stock is None else repr(wp.stock)}">
+            </td>
+            <td>{status}</td>
+        </tr>
+        """
+    
+    if not rows_html:
+        rows_html = "<tr><td colspan='4'>Nenhum produto na lista</td></tr>"
+    
+    conflicts_html = ""
+    conflicts = request.args.get('conflicts', 0, type=int)
+    if conflicts:
+        conflicts_html = f'<div class="alert alert-error">⚠️ {conflicts} produto(s) venderam enquanto você editava e não foram alterados. Confira os valores abaixo e salve de novo.</div>'
+    
+    return f"""
+    <html>
+    <head><title>Estoque</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>📦 Estoque da Semana</h1>
+            <p><strong>Período:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}</p>
+            <p><small>💡 O estoque é a quantidade que ainda pode ser vendida. Deixe vazio para não limitar.</small></p>
+            {conflicts_html}
+            
+            <form method="POST">
+                <table>
+                    <thead>
+                        <tr><th>Produto</th><th>Vendido</th><th>Disponível</th><th>Status</th></tr>
+                    </thead>
+                    <tbody>
+                        {rows_html}
+                    </tbody>
+                </table>
+                <button type="submit" class="btn" style="margin-top: 20px;">💾 Salvar Estoque</button>
+            </form>
+        </div>
+    </body>
+    </html>
+    """
+
+JOB_STATUS_LABELS = {
+    'queued': '⏳ Na fila',
+    'running': '⚙️ Rodando',
+    'succeeded': '✅ Concluída',
+    'failed': '❌ Falhou',
+    'cancelled': '🚫 Cancelada',
+}
+
+def job_status_payload(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_label': JOB_STATUS_LABELS.get(job.status, job.status),
+        'progress': round(job.progress or 0, 4),
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'has_output': bool(job.output_name),
+        'error': job.error.splitlines()[0] if job.error else None,
+        'finished': job.status in ('succeeded', 'failed', 'cancelled'),
+    }
+
+@app.route('/admin/jobs', methods=['GET', 'POST'])
+def admin_jobs():
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        definition = JOB_KINDS.get(kind)
+        try:
+            if definition is None:
+                raise ValueError('Tarefa desconhecida')
+            params = {
+                name: cast(request.form[name])
+                for name, cast in definition['params'].items() if request.form.get(name, '') != ''
+            }
+        except ValueError:
+            return f"""
+            <html>
+            <head><title>Erro</title>{get_base_style()}</head>
+            <body>
+                <div class="container">
+                    <div class="alert alert-error">❌ Tarefa ou parâmetro inválido.</div>
+                    <a href="/admin/jobs" class="btn">← Voltar às Tarefas</a>
+                </div>
+            </body>
+            </html>
+            """, 400
+        return redirect(f'/admin/jobs/{enqueue_job(kind, **params)}')
+    
+    # Sem as colunas de saída (CSVs podem ser grandes)
+    jobs = db.session.query(
+        Job.id, Job.kind, Job.status, Job.progress, Job.message, Job.created_at, Job.finished_at, Job.output_name
+    ).order_by(Job.id.desc()).limit(50).all()
+    
+    jobs_html = ""
+    for job in jobs:
+        title = JOB_KINDS[job.kind]['title'] if job.kind in JOB_KINDS else job.kind
+        finished = job.finished_at.strftime('%d/%m %H:%M') if job.finished_at else '-'
+        download = f' <a href="/admin/jobs/{job.id}/download" class="btn btn-sm">⬇️ {job.output_name}</a>' if job.output_name else ''
+        jobs_html += f"""
+        <tr>
+            <td>#{job.id}</td>
+            <td>{title}</td>
+            <td>{JOB_STATUS_LABELS.get(job.status, job.status)} ({(job.progress or 0) * 100:.0f}%)<br><small>{escape(job.message or '')}</small></td>
+            <td>{job.created_at.strftime('%d/%m %H:%M')}</td>
+            <td>{finished}</td>
+            <td><a href="/admin/jobs/{job.id}" class="btn btn-sm">👁️ Acompanhar</a>{download}</td>
+        </tr>
+        """
+    
+    if not jobs_html:
+        jobs_html = "<tr><td colspan='6'>Nenhuma tarefa ainda</td></tr>"
+    
+    weekly_lists = db.session.query(
+        WeeklyList.id, WeeklyList.week_start, WeeklyList.week_end, WeeklyList.archived_at
+    ).order_by(WeeklyList.week_start.desc()).all()
+    list_options = ''.join(
+        f'<option value="{wl.id}">{wl.week_start.strftime("%d/%m/%Y")} a {wl.week_end.strftime("%d/%m/%Y")}{" (arquivada)" if wl.archived_at else ""}</option>'
+        for wl in weekly_lists
+    )
+    
+    return f"""
+    <html>
+    <head><title>Tarefas</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>⚙️ Tarefas em Segundo Plano</h1>
+            
+            <div class="product-grid">
+                <form method="POST" class="product-card">
+                    <h3>📄 {JOB_KINDS['orders_export']['title']}</h3>
+                    <input type="hidden" name="kind" value="orders_export">
+                    <select name="weekly_list_id" class="form-control" required>{list_options}</select>
+                    <button type="submit" class="btn" style="margin-top: 10px;">Gerar</button>
+                </form>
+                <form method="POST" class="product-card">
+                    <h3>📊 {JOB_KINDS['sales_report']['title']}</h3>
+                    <input type="hidden" name="kind" value="sales_report">
+                    <label>Semanas:</label>
+                    <input type="number" name="weeks" class="form-control" min="1" max="520" value="12">
+                    <button type="submit" class="btn" style="margin-top: 10px;">Gerar</button>
+                </form>
+                <form method="POST" class="product-card">
+                    <h3>🗄️ {JOB_KINDS['archive_lists']['title']}</h3>
+                    <input type="hidden" name="kind" value="archive_lists">
+                    <label>Encerradas há mais de (dias):</label>
+                    <input type="number" name="days" class="form-control" min="7" value="{ARCHIVE_AFTER_DAYS}">
+                    <button type="submit" class="btn btn-warning" style="margin-top: 10px;">Arquivar</button>
+                </form>
+                <form method="POST" class="product-card">
+                    <h3>👥 {JOB_KINDS['backfill_customers']['title']}</h3>
+                    <input type="hidden" name="kind" value="backfill_customers">
+                    <p><small>Cria os cadastros de clientes a partir dos pedidos feitos antes do cadastro existir.</small></p>
+                    <button type="submit" class="btn">Executar</button>
+                </form>
+            </div>
+            
+            <h3>📋 Últimas Tarefas</h3>
+            <table>
+                <thead>
+                    <tr><th>#</th><th>Tarefa</th><th>Status</th><th>Criada</th><th>Terminada</th><th>Ações</th></tr>
+                </thead>
+                <tbody>
+                    {jobs_html}
+                </tbody>
+            </table>
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/jobs/<int:job_id>')
+def admin_job_detail(job_id):
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    
+    job = Job.query.options(db.defer(Job.output)).filter_by(id=job_id).first_or_404()
+    status = job_status_payload(job)
+    title = JOB_KINDS[job.kind]['title'] if job.kind in JOB_KINDS else job.kind
+    
+    return f"""
+    <html>
+    <head><title>Tarefa #{job.id}</title>{get_base_style()}</head>
+    <body>
+        {get_admin_nav()}
+        <div class="container">
+            <h1>⚙️ Tarefa #{job.id}: {title}</h1>
+            <p><strong>Parâmetros:</strong> <code>{escape(job.params)}</code></p>
+            <p><strong>Status:</strong> <span id="status">{status['status_label']}</span> — <span id="message">{escape(job.message or '')}</span></p>
+            <div style="background: #e9ecef; border-radius: 8px; overflow: hidden; height: 24px;">
+                <div id="bar" style="background: #28a745; height: 100%; width: {status['progress'] * 100:.1f}%;"></div>
+            </div>
+            <p id="percent">{status['progress'] * 100:.0f}%</p>
+            <pre id="result" style="white-space: pre-wrap;">{escape(json.dumps(status['result'], ensure_ascii=False, indent=1)) if status['result'] else ''}{escape(job.error or '')}</pre>
+            
+            <div style="margin-top: 20px;">
+                <form id="cancel" method="POST" action="/admin/jobs/{job.id}/cancel" style="display: {'none' if status['finished'] else 'inline'};">
+                    <button type="submit" class="btn btn-danger">🚫 Cancelar</button>
+                </form>
+                <a id="download" href="/admin/jobs/{job.id}/download" class="btn" style="display: {'inline-block' if status['has_output'] else 'none'};">⬇️ Baixar {job.output_name or ''}</a>
+                <a href="/admin/jobs" class="btn btn-warning">← Voltar às Tarefas</a>
+            </div>
+        </div>
+        
+        <script>
+            function poll() {{
+                fetch('/admin/jobs/{job.id}/status')
+                    .then(response => response.json())
+                    .then(job => {{
+                        document.getElementById('status').textContent = job.status_label;
+                        document.getElementById('message').textContent = job.message || '';
+                        document.getElementById('bar').style.width = (job.progress * 100) + '%';
+                        document.getElementById('percent').textContent = Math.round(job.progress * 100) + '%';
+                        if (job.finished) {{
+                            document.getElementById('cancel').style.display = 'none';
+                            document.getElementById('result').textContent = job.result ? JSON.stringify(job.result, null, 1) : (job.error || '');
+                            if (job.has_output) window.location.reload();
+                        }} else {{
+                            setTimeout(poll, 2000);
+                        }}
+                    }})
+                    .catch(() => setTimeout(poll, 5000));
+            }}
+            {'' if status['finished'] else 'setTimeout(poll, 1000);'}
+        </script>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/jobs/<int:job_id>/status')
+def admin_job_status(job_id):
+    if not is_admin_logged_in():
+        return jsonify({'error': 'unauthorized'}), 401
+    job = Job.query.options(db.defer(Job.output)).filter_by(id=job_id).first_or_404()
+    response = jsonify(job_status_payload(job))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/admin/jobs/<int:job_id>/cancel', methods=['POST'])
+def admin_job_cancel(job_id):
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    # Na fila: cancela na hora; rodando: a tarefa para no próximo progresso
+    db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+        status='cancelled', message='Cancelada', finished_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False))
+    db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'running').values(
+        cancel_requested=True
+    ).execution_options(synchronize_session=False))
+    db.session.commit()
+    return redirect(f'/admin/jobs/{job_id}')
+
+@app.route('/admin/jobs/<int:job_id>/download')
+def admin_job_download(job_id):
+    if not is_admin_logged_in():
+        return redirect('/admin/login')
+    job = Job.query.filter_by(id=job_id).first_or_404()
+    if not job.output_name:
+        abort(404)
+    return job.output.encode('utf-8-sig'), 200, {
+        'Content-Type': 'text/csv; charset=utf-8',
+        'Content-Disposition': f'attachment; filename="{job.output_name}"',
+    }
+
+REPORT_HISTORY_WEEKS = 26
+
 @app.route('/admin/reports')
+@read_replica
 def admin_reports():
     if not is_admin_logged_in():
         return redirect('/admin/login')
     
-    # Relatório da semana atual
-    active_list = WeeklyList.query.filter_by(is_active=True).first()
+    # Relatório da semana escolhida (padrão: semana atual)
+    active_list = selected_weekly_list()
     
     if not active_list:
         return f"""
         <html>
         <head><title>Relatórios</title>{get_base_style()}</head>
         <body>
-            <div class="nav">
-                <a href="/admin">Dashboard</a>
-                <a href="/admin/orders">Pedidos</a>
-                <a href="/admin/products">Produtos</a>
-                <a href="/admin/categories">Categorias</a>
-                <a href="/admin/create-list">Nova Lista</a>
-                <a href="/admin/reports">Relatórios</a>
-                <a href="/admin/logout">Sair</a>
-            </div>
+            {get_admin_nav()}
             <div class="container">
                 <h1>📊 Relatórios</h1>
                 <p>Nenhuma lista ativa para gerar relatórios.</p>
@@ -1507,21 +5073,64 @@ def admin_reports():
         </html>
         """
     
-    # Produtos mais vendidos
-    product_sales = db.session.query(
-        Product.name,
-        Product.unit,
-        db.func.sum(OrderItem.quantity).label('total_quantity'),
-        db.func.sum(OrderItem.total_price).label('total_revenue')
-    ).join(OrderItem).join(Order).filter(
-        Order.weekly_list_id == active_list.id
-    ).group_by(Product.id).order_by(db.func.sum(OrderItem.quantity).desc()).all()
-    
-    # Total de pedidos e receita
-    total_orders = Order.query.filter_by(weekly_list_id=active_list.id).count()
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).filter(
-        Order.weekly_list_id == active_list.id
-    ).scalar() or 0
+    if active_list.archived_at or active_list.closed_at:
+        # Semana encerrada ou arquivada: totais gravados no encerramento
+        product_sales = db.session.query(
+            WeeklyProductSales.product_name.label('name'),
+            WeeklyProductSales.unit,
+            WeeklyProductSales.quantity.label('total_quantity'),
+            WeeklyProductSales.revenue.label('total_revenue')
+        ).filter(
+            WeeklyProductSales.weekly_list_id == active_list.id
+        ).order_by(WeeklyProductSales.quantity.desc()).all()
+        
+        summary = db.session.get(WeeklyListSummary, active_list.id)
+        total_orders = summary.order_count if summary else 0
+        total_revenue = summary.revenue if summary else 0
+    else:
+        # Produtos mais vendidos, com nome e unidade gravados no próprio item
+        product_sales = db.session.query(
+            OrderItem.product_name.label('name'),
+            OrderItem.unit,
+            db.func.sum(OrderItem.quantity).label('total_quantity'),
+            db.func.sum(OrderItem.total_price).label('total_revenue')
+        ).join(Order).filter(
+            Order.weekly_list_id == active_list.id
+        ).group_by(
+            OrderItem.product_id, OrderItem.product_name, OrderItem.unit
+        ).order_by(db.func.sum(OrderItem.quantity).desc()).all()
+        
+        # Total de pedidos e receita
+        total_orders, total_revenue = db.session.query(
+            db.func.count(Order.id), db.func.coalesce(db.func.sum(Order.total_amount), 0)
+        ).filter(Order.weekly_list_id == active_list.id).one()
+    
+    # Histórico: semanas abertas somadas na hora, encerradas pelos resumos
+    week_totals = db.union_all(
+        db.select(
+            Order.weekly_list_id.label('weekly_list_id'),
+            db.func.count(Order.id).label('orders'),
+            db.func.sum(Order.total_amount).label('revenue')
+        ).where(Order.weekly_list_id.notin_(frozen_list_ids())).group_by(Order.weekly_list_id),
+        db.select(WeeklyListSummary.weekly_list_id, WeeklyListSummary.order_count, WeeklyListSummary.revenue)
+    ).subquery()
+    history = db.session.query(
+        WeeklyList.id, WeeklyList.week_start, WeeklyList.week_end, WeeklyList.archived_at,
+        week_totals.c.orders, week_totals.c.revenue
+    ).join(week_totals, week_totals.c.weekly_list_id == WeeklyList.id).order_by(
+        WeeklyList.week_start.desc()
+    ).limit(REPORT_HISTORY_WEEKS).all()
+    
+    history_html = ""
+    for week in history:
+        current = " style=\"background: #e9f7ef;\"" if week.id == active_list.id else ""
+        history_html += f"""
+        <tr{current}>
+            <td><a href="/admin/reports?list={week.id}">{week.week_start.strftime('%d/%m')} a {week.week_end.strftime('%d/%m/%Y')}</a>{' 🗄️' if week.archived_at else ''}</td>
+            <td>{week.orders}</td>
+            <td>R$ {week.revenue or 0:.2f}</td>
+        </tr>
+        """
     
     # HTML dos produtos vendidos
     sales_html = ""
@@ -1541,18 +5150,10 @@ def admin_reports():
     <html>
     <head><title>Relatórios</title>{get_base_style()}</head>
     <body>
-        <div class="nav">
-            <a href="/admin">Dashboard</a>
-            <a href="/admin/orders">Pedidos</a>
-            <a href="/admin/products">Produtos</a>
-            <a href="/admin/categories">Categorias</a>
-            <a href="/admin/create-list">Nova Lista</a>
-            <a href="/admin/reports">Relatórios</a>
-            <a href="/admin/logout">Sair</a>
-        </div>
+        {get_admin_nav()}
         <div class="container">
             <h1>📊 Relatórios da Semana</h1>
-            <p><strong>Período:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}</p>
+            <p><strong>Período:</strong> {active_list.week_start.strftime('%d/%m')} a {active_list.week_end.strftime('%d/%m/%Y')}{' (arquivada)' if active_list.archived_at else ''}</p>
             
             <div class="product-grid">
                 <div class="product-card">
@@ -1565,7 +5166,7 @@ def admin_reports():
                 </div>
                 <div class="product-card">
                     <h3>📋 Ações</h3>
-                    <p><a href="/admin/orders" class="btn btn-sm">Ver Pedidos Individuais</a></p>
+                    <p><a href="/admin/orders?list={active_list.id}" class="btn btn-sm">Ver Pedidos Individuais</a></p>
                 </div>
             </div>
             
@@ -1580,8 +5181,18 @@ def admin_reports():
                 </tbody>
             </table>
             
+            <h3>🗓️ Semanas Anteriores</h3>
+            <table>
+                <thead>
+                    <tr><th>Semana</th><th>Pedidos</th><th>Receita</th></tr>
+                </thead>
+                <tbody>
+                    {history_html}
+                </tbody>
+            </table>
+            
             <div style="margin-top: 30px;">
-                <a href="/admin/orders" class="btn">📋 Ver Pedidos por Cliente</a>
+                <a href="/admin/orders?list={active_list.id}" class="btn">📋 Ver Pedidos por Cliente</a>
                 <a href="/admin" class="btn">← Voltar ao Dashboard</a>
             </div>
         </div>
@@ -1590,10 +5201,107 @@ def admin_reports():
     """
 
 # Rota de saúde para Railway
+# Liveness: o processo responde (não consulta o banco)
 @app.route('/health')
+@app.route('/health/live')
 def health_check():
     return {'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}
 
+# Readiness: o worker consegue atender pedidos agora. O resultado fica em
+# cache por alguns segundos para que as sondagens não virem carga no banco.
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', '5'))
+READINESS_DB_SLOW_MS = float(os.environ.get('READINESS_DB_SLOW_MS', '250'))
+READINESS_POOL_SATURATION = float(os.environ.get('READINESS_POOL_SATURATION', '0.9'))
+readiness_cache = TTLCache(READINESS_CACHE_SECONDS)
+readiness_lock = threading.Lock()
+
+def pool_status():
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout') or not hasattr(pool, 'size'):
+        return {'class': type(pool).__name__}
+    capacity = pool.size() + max(0, getattr(pool, '_max_overflow', 0))
+    checked_out = pool.checkedout()
+    return {
+        'class': type(pool).__name__,
+        'size': pool.size(),
+        'checked_out': checked_out,
+        'overflow': pool.overflow(),
+        'capacity': capacity,
+        'saturation': round(checked_out / capacity, 3) if capacity > 0 else None,
+    }
+
+def check_readiness():
+    checks = {}
+    status = 'ok'
+    
+    pool = pool_status()
+    checks['pool'] = pool
+    saturation = pool.get('saturation')
+    if saturation is not None and saturation >= READINESS_POOL_SATURATION:
+        # Sem conexão livre a sondagem ficaria presa no timeout do pool
+        pool['status'] = 'degraded'
+        checks['database'] = {'status': 'skipped'}
+        status = 'degraded'
+    else:
+        try:
+            started = time.perf_counter()
+            with db.engine.connect() as conn:
+                checkout_ms = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                conn.execute(db.text('SELECT 1'))
+                round_trip_ms = (time.perf_counter() - started) * 1000
+                # Pela chave primária: não varre a tabela de pedidos
+                last_order_at = conn.execute(
+                    db.select(Order.created_at).order_by(Order.id.desc()).limit(1)
+                ).scalar()
+            database_status = 'ok'
+            if checkout_ms + round_trip_ms > READINESS_DB_SLOW_MS:
+                database_status = status = 'degraded'
+            checks['database'] = {
+                'status': database_status,
+                'checkout_ms': round(checkout_ms, 2),
+                'round_trip_ms': round(round_trip_ms, 2),
+            }
+            checks['last_order'] = {
+                'at': last_order_at.isoformat() if last_order_at else None,
+                'age_seconds': round((datetime.utcnow() - last_order_at).total_seconds()) if last_order_at else None,
+            }
+        except Exception as e:
+            checks['database'] = {'status': 'fail', 'error': type(e).__name__}
+            status = 'fail'
+    
+    checks['replica'] = replica_status()
+    checks['admission'] = admission_controller.stats(saturation)
+    checks['caches'] = {
+        'stock': stock_cache.stats(),
+        'delivery_slots': slot_cache.stats(),
+        'product_search': PRODUCT_SEARCH_BACKEND,
+    }
+    return {'status': status, 'timestamp': datetime.utcnow().isoformat(), 'checks': checks}
+
+@app.route('/health/ready')
+def readiness_check():
+    def load():
+        with readiness_lock:
+            # Outra thread pode ter acabado de medir enquanto esta esperava
+            return readiness_cache.get('result', check_readiness)
+    result = readiness_cache.get('result', load)
+    http_status = 200 if result['status'] == 'ok' else 503
+    response = jsonify(result)
+    response.status_code = http_status
+    response.headers['Cache-Control'] = 'no-store'
+    if http_status == 503:
+        response.headers['Retry-After'] = str(max(1, int(READINESS_CACHE_SECONDS)))
+    return response
+
+# Métricas no formato do Prometheus (somadas entre todos os workers)
+@app.route('/metrics')
+def metrics_endpoint():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized', 401
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = not os.environ.get('RAILWAY_ENVIRONMENT')
@@ -0,0 +1,245 @@
+"""Benchmark de carga da loja e do checkout.
+
+Sobe a aplicação num servidor local, popula o banco com um catálogo e um
+histórico de pedidos sintéticos e dispara clientes concorrentes contra as
+rotas principais. O resultado (latências p50/p95/p99 e vazão por cenário) é
+impresso em JSON para comparar antes/depois de cada mudança de performance.
+
+    python benchmark.py --products 300 --orders 5000 --concurrency 8
+    python benchmark.py --database-url postgresql://localhost/hortifruti_bench --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+import generate_data
+
+ADMIN_USERNAME = 'mario'
+ADMIN_PASSWORD = '3943'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de carga do Em Casa Hortifruti')
+    parser.add_argument('--database-url', help='Banco usado no teste (padrão: SQLite temporário)')
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--weeks', type=int, default=12, help='Semanas de histórico')
+    parser.add_argument('--orders', type=int, default=12000, help='Pedidos no histórico (a semana atual recebe ~1/semanas)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Clientes simultâneos por cenário')
+    parser.add_argument('--requests', type=int, default=200, help='Requisições por cenário')
+    parser.add_argument('--warmup', type=int, default=10, help='Requisições de aquecimento por cenário')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Arquivo para gravar o JSON (padrão: stdout)')
+    return parser.parse_args(argv)
+
+
+def load_app(database_url):
+    # A aplicação lê a configuração do ambiente na importação
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DETECT_N_PLUS_ONE', '0')
+    os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='hortifruti-bench-metrics-'))
+    # As confirmações do checkout vão para um arquivo, não para o stdout do JSON
+    outbox = os.path.join(tempfile.mkdtemp(prefix='hortifruti-bench-outbox-'), 'notifications.jsonl')
+    os.environ.setdefault('NOTIFICATION_WHATSAPP_SENDER', f'file:{outbox}')
+    os.environ.setdefault('NOTIFICATION_EMAIL_SENDER', f'file:{outbox}')
+    # init_db() escreve no stdout; o stdout fica reservado para o JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as app_module
+    return app_module
+
+
+def seed(app_module, args):
+    # Mesma base do generate_data.py: mesma semente, mesmos dados
+    with app_module.app.app_context():
+        generate_data.generate(
+            app_module,
+            seed=args.seed,
+            categories=args.categories,
+            products=args.products,
+            weeks=args.weeks,
+            orders=args.orders,
+            log=lambda message: print(message, file=sys.stderr),
+        )
+        active_list = app_module.WeeklyList.query.filter_by(is_active=True).first()
+        products = dict(
+            app_module.db.session.query(app_module.WeeklyProduct.product_id, app_module.WeeklyProduct.price)
+            .filter(app_module.WeeklyProduct.weekly_list_id == active_list.id)
+            .all()
+        )
+        return {'weekly_list_id': active_list.id, 'products': products}
+
+
+def start_server(flask_app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class Client:
+    def __init__(self, base_url, admin=False):
+        self.base_url = base_url
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        if admin:
+            self.request('POST', '/admin/login', form={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+
+    def request(self, method, path, form=None, json_body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                body = response.read()
+                return response.status, body
+        except HTTPError as e:
+            return e.code, e.read()
+
+
+def order_payload(rng, products):
+    items = {}
+    for product_id in rng.sample(list(products), min(len(products), rng.randint(1, 8))):
+        items[str(product_id)] = {'quantity': rng.randint(1, 3), 'price': products[product_id]}
+    subtotal = sum(i['quantity'] * i['price'] for i in items.values())
+    return {
+        'customer_name': 'Cliente Benchmark',
+        'customer_phone': f'8298{rng.randint(0, 9999999):07d}',
+        'delivery_address': 'Rua do Benchmark, 1',
+        'delivery_fee': 10.0,
+        'total_amount': subtotal + 10.0,
+        'items': items,
+    }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # Método nearest-rank
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_scenario(base_url, name, make_request, admin, args):
+    clients = [Client(base_url, admin=admin) for _ in range(args.concurrency)]
+    rngs = [random.Random(f'{args.seed}-{name}-{i}') for i in range(args.concurrency)]
+
+    for i in range(args.warmup):
+        make_request(clients[i % len(clients)], rngs[i % len(rngs)])
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker(index):
+        nonlocal errors
+        client, rng = clients[index], rngs[index]
+        local = []
+        local_errors = 0
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            started = time.perf_counter()
+            status, body = make_request(client, rng)
+            local.append(time.perf_counter() - started)
+            if status >= 400 or (name == 'checkout' and not json.loads(body).get('success')):
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'min': round(latencies[0] * 1000, 3) if latencies else None,
+            'p50': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+            'p99': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            'max': round(latencies[-1] * 1000, 3) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        },
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_url = args.database_url
+    if not database_url:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='hortifruti-bench-'), 'bench.db')
+
+    app_module = load_app(database_url)
+    seeded_at = time.perf_counter()
+    seeded = seed(app_module, args)
+    seed_seconds = time.perf_counter() - seeded_at
+    products = seeded['products']
+
+    server, base_url = start_server(app_module.app)
+    scenarios = [
+        ('storefront', lambda c, rng: c.request('GET', '/'), False),
+        ('checkout', lambda c, rng: c.request('POST', '/api/save-order', json_body=order_payload(rng, products)), False),
+        ('admin_orders', lambda c, rng: c.request('GET', '/admin/orders'), True),
+        ('admin_reports', lambda c, rng: c.request('GET', '/admin/reports'), True),
+    ]
+    try:
+        results = {name: run_scenario(base_url, name, fn, admin, args) for name, fn, admin in scenarios}
+    finally:
+        server.shutdown()
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': database_url.split(':', 1)[0],
+        },
+        'dataset': {
+            'seed': args.seed,
+            'categories': args.categories,
+            'products': args.products,
+            'orders': args.orders,
+            'weeks': args.weeks,
+            'seed_seconds': round(seed_seconds, 3),
+        },
+        'scenarios': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+from collections import namedtuple
+from itertools import chain
+
+import numpy as np
+
+# Previsão de demanda por produto para sugerir quanto comprar na semana.
+#
+# A base é uma matriz produtos x semanas com a quantidade vendida em cada
+# lista semanal (NaN nas semanas em que o produto não estava na lista). Tudo
+# é calculado de uma vez sobre a matriz inteira, sem loop por produto:
+#
+# 1. Média móvel das últimas semanas em que o produto foi oferecido.
+# 2. Tendência: reta (mínimos quadrados) desde que o produto entrou nas
+#    listas, projetada até a semana alvo e amortecida.
+# 3. Sazonalidade: vendas nas mesmas semanas do ano em anos anteriores,
+#    comparadas com o nível do produto naquela época (média centrada, com o
+#    mesmo número de semanas antes e depois, para a tendência não virar
+#    sazonalidade); com pouco histórico o fator fica perto de 1.
+#
+# A sugestão de compra é a previsão mais uma margem proporcional à variação
+# recente, arredondada para cima.
+
+History = namedtuple('History', 'weeks product_ids quantities')
+Forecast = namedtuple('Forecast', 'product_id quantity suggested moving_average trend seasonal weeks')
+
+WINDOW = 4  # semanas da média móvel
+TREND_DAMPING = 0.5
+SEASON_WEEKS = 2  # ± semanas do ano consideradas "mesma época"
+SEASON_CONTEXT_WEEKS = 13  # ± semanas da média centrada em volta da mesma época
+SEASON_SHRINK = 4  # quantas semanas sazonais valem tanto quanto "sem sazonalidade"
+SAFETY = 0.5  # desvios-padrão de margem na sugestão de compra
+ROUND_TO = 0.5
+
+
+def _to_array(rows, width, dtype):
+    # Linhas do banco direto para uma matriz, sem passar por listas intermediárias
+    rows = list(rows)
+    return np.fromiter(chain.from_iterable(rows), dtype=dtype, count=len(rows) * width).reshape(-1, width)
+
+
+def build_history(lists, offered, sales):
+    # lists: [(weekly_list_id, week_start)], offered: [(weekly_list_id, product_id)],
+    # sales: [(weekly_list_id, product_id, quantidade)]
+    lists = sorted(lists, key=lambda row: row[1])
+    offered = _to_array(offered, 2, np.int64)
+    sales = _to_array(sales, 3, float)
+    if not lists or not len(offered):
+        return History(np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64), np.empty((0, 0)))
+    weeks = np.array([week_start for _, week_start in lists], dtype='datetime64[D]')
+    list_ids = np.array([list_id for list_id, _ in lists], dtype=np.int64)
+    by_id = np.argsort(list_ids)
+    sorted_ids = list_ids[by_id]
+
+    def columns_of(ids):
+        # Coluna (semana) de cada lista; -1 para listas fora do histórico
+        position = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[position] == ids, by_id[position], -1)
+
+    offered_columns = columns_of(offered[:, 0])
+    offered = offered[offered_columns >= 0]
+    offered_columns = offered_columns[offered_columns >= 0]
+    product_ids = np.unique(offered[:, 1])
+    quantities = np.full((len(product_ids), len(weeks)), np.nan)
+    quantities[np.searchsorted(product_ids, offered[:, 1]), offered_columns] = 0.0
+
+    if len(sales):
+        # Só conta o que estava na lista daquela semana
+        sale_columns = columns_of(sales[:, 0].astype(np.int64))
+        sold_ids = sales[:, 1].astype(np.int64)
+        rows = np.minimum(np.searchsorted(product_ids, sold_ids), len(product_ids) - 1)
+        known = (sale_columns >= 0) & (product_ids[rows] == sold_ids)
+        known[known] &= ~np.isnan(quantities[rows[known], sale_columns[known]])
+        np.add.at(quantities, (rows[known], sale_columns[known]), sales[known, 2])
+    return History(weeks, product_ids, quantities)
+
+
+def _last_offered(offered, count):
+    # Máscara das `count` últimas semanas oferecidas de cada produto
+    from_end = np.cumsum(offered[:, ::-1], axis=1)[:, ::-1]
+    return offered & (from_end <= count)
+
+
+def _masked_mean(values, mask):
+    n = mask.sum(axis=1)
+    total = np.where(mask, values, 0.0).sum(axis=1)
+    return np.divide(total, n, out=np.zeros(len(values)), where=n > 0), n
+
+
+def _week_of_year_distance(weeks, target):
+    day_of_year = (weeks - weeks.astype('datetime64[Y]')).astype(np.int64)
+    target_day = (target - target.astype('datetime64[Y]')).astype(np.int64)
+    distance = np.abs(day_of_year - target_day)
+    return np.minimum(distance, 365 - distance) / 7.0
+
+
+def forecast_demand(history, target_week=None, window=WINDOW, safety=SAFETY, round_to=ROUND_TO):
+    weeks, product_ids, quantities = history
+    if not len(product_ids):
+        return {}
+    target = np.datetime64(target_week, 'D') if target_week is not None else weeks[-1] + np.timedelta64(7, 'D')
+    offered = ~np.isnan(quantities)
+    values = np.nan_to_num(quantities)
+    x = (weeks - weeks[0]).astype(np.int64) / 7.0
+    x_target = (target - weeks[0]).astype(np.int64) / 7.0
+
+    # 1. Média móvel
+    recent = _last_offered(offered, window)
+    moving_average, recent_count = _masked_mean(values, recent)
+    recent_x, _ = _masked_mean(np.broadcast_to(x, values.shape), recent)
+
+    # 2. Tendência desde a entrada do produto
+    count = offered.sum(axis=1)
+    mean_x, _ = _masked_mean(np.broadcast_to(x, values.shape), offered)
+    mean_y, _ = _masked_mean(values, offered)
+    dx = np.where(offered, x - mean_x[:, None], 0.0)
+    dy = np.where(offered, values - mean_y[:, None], 0.0)
+    variance = (dx * dx).sum(axis=1)
+    slope = np.divide((dx * dy).sum(axis=1), variance, out=np.zeros(len(values)), where=(variance > 0) & (count >= 3))
+    # Ajuste limitado a ±50% da média: uma semana atípica não dobra a compra
+    adjustment = np.clip(slope * (x_target - recent_x) * TREND_DAMPING, -0.5 * moving_average, 0.5 * moving_average)
+    level = moving_average + adjustment
+
+    # 3. Sazonalidade: mesma época em anos anteriores vs. o nível naquela época.
+    # O nível de cada semana sazonal é a média das semanas em volta, com o
+    # mesmo alcance dos dois lados (encurtado perto da primeira e da última
+    # semana do produto): numa série com tendência, a média de um lado só
+    # ficaria abaixo ou acima da própria semana e viraria falsa sazonalidade.
+    in_season = ((x_target - x) >= 40) & (_week_of_year_distance(weeks, target) <= SEASON_WEEKS)
+    seasonal = np.ones(len(values))
+    if in_season.any():
+        season_x = x[in_season]
+        first_x = np.where(offered, x, np.inf).min(axis=1)
+        last_x = np.where(offered, x, -np.inf).max(axis=1)
+        # produtos x semanas sazonais
+        reach = np.minimum(SEASON_CONTEXT_WEEKS, np.minimum(season_x - first_x[:, None], last_x[:, None] - season_x))
+        # produtos x semanas sazonais x semanas
+        around = offered[:, None, :] & (np.abs(x[None, :] - season_x[:, None])[None] <= reach[:, :, None])
+        around_count = around.sum(axis=2)
+        level_at_season = np.divide(
+            np.where(around, values[:, None, :], 0.0).sum(axis=2), around_count,
+            out=np.zeros(around_count.shape), where=around_count > 0
+        )
+        season_offered = offered[:, in_season] & (reach >= 1)
+        season_mean, season_count = _masked_mean(values[:, in_season], season_offered)
+        context_mean, _ = _masked_mean(level_at_season, season_offered)
+        ratio = np.divide(season_mean, context_mean, out=np.ones(len(values)), where=context_mean > 0)
+        weight = season_count / (season_count + SEASON_SHRINK)
+        seasonal = np.clip(1 + (ratio - 1) * weight, 0.5, 2.0)
+
+    quantity = np.maximum(level * seasonal, 0.0)
+
+    # Sugestão: previsão + margem pela variação das últimas semanas
+    variation = _last_offered(offered, window * 2)
+    spread_mean, _ = _masked_mean(values, variation)
+    spread = np.sqrt(_masked_mean((values - spread_mean[:, None]) ** 2, variation)[0])
+    suggested = np.ceil((quantity + safety * spread) / round_to) * round_to
+    suggested = np.where(quantity > 0, suggested, 0.0)
+
+    return {
+        int(product_id): Forecast(
+            int(product_id), float(quantity[i]), float(suggested[i]), float(moving_average[i]),
+            float(slope[i]), float(seasonal[i]), int(count[i])
+        )
+        for i, product_id in enumerate(product_ids)
+        if recent_count[i]
+    }
@@ -0,0 +1,314 @@
+"""Gerador de dados sintéticos para testes de performance.
+
+Cria um catálogo, anos de listas semanais e um histórico grande de pedidos
+com distribuições realistas (produtos populares vendem mais, folhas saem por
+unidade, frutas por quilo, clientes voltam toda semana). Tudo é gerado a
+partir de uma semente: a mesma semente e os mesmos parâmetros produzem
+exatamente os mesmos dados, então benchmarks e testes de performance rodam
+sempre sobre a mesma base.
+
+    python generate_data.py --orders 100000 --weeks 156 --products 400
+    python generate_data.py --database-url postgresql://localhost/hortifruti_perf --reset
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+# Data fixa para que a base gerada não dependa do dia em que o script roda
+DEFAULT_END_DATE = date(2025, 1, 6)
+
+CHUNK_SIZE = 5000
+
+CATEGORY_NAMES = [
+    ('FOLHAS', '🥗'), ('RAÍZES & LEGUMES', '🥔'), ('FRUTAS', '🍎'), ('ORIGEM ANIMAL', '🐔'),
+    ('COGUMELOS', '🍄'), ('TEMPEROS', '🌶️'), ('GRÃOS', '🌾'), ('LATICÍNIOS', '🧀'),
+    ('PANIFICAÇÃO', '🍞'), ('BEBIDAS', '🧃'), ('CHÁS', '🍵'), ('CONSERVAS', '🫙'),
+    ('DOCES', '🍯'), ('PLANTAS', '🪴'), ('FLORES', '🌻'), ('CASTANHAS', '🥜'),
+]
+
+PRODUCE = {
+    'FOLHAS': ['Alface', 'Couve', 'Rúcula', 'Agrião', 'Espinafre', 'Acelga', 'Repolho', 'Almeirão', 'Chicória'],
+    'RAÍZES & LEGUMES': ['Batata Doce', 'Macaxeira', 'Inhame', 'Cenoura', 'Beterraba', 'Abóbora', 'Chuchu', 'Quiabo', 'Maxixe'],
+    'FRUTAS': ['Banana', 'Limão', 'Laranja', 'Mamão', 'Manga', 'Acerola', 'Maracujá', 'Goiaba', 'Caju', 'Pitanga'],
+    'ORIGEM ANIMAL': ['Ovos', 'Mel', 'Frango', 'Queijo Coalho', 'Manteiga de Garrafa'],
+    'COGUMELOS': ['Shiitake', 'Shimeji', 'Cogumelo Paris', 'Eryngui'],
+    'TEMPEROS': ['Pimenta', 'Orégano', 'Coentro', 'Cebolinha', 'Manjericão', 'Alecrim', 'Hortelã'],
+}
+GENERIC_PRODUCE = ['Feijão', 'Farinha', 'Tapioca', 'Polpa', 'Geleia', 'Castanha', 'Bolo', 'Suco', 'Muda', 'Chá']
+VARIETIES = ['', 'Crespa', 'Roxa', 'Prata', 'Tahiti', 'Pera', 'Caipira', 'Silvestre', 'Orgânica',
+             'da Terra', 'Baby', 'Miúda', 'Graúda', 'Cravo', 'Formosa', 'Branca', 'Amarela', 'Verde']
+UNIT_BY_CATEGORY = {
+    'FOLHAS': ['un', 'maço'], 'RAÍZES & LEGUMES': ['kg', 'un'], 'FRUTAS': ['kg', 'palma', 'un'],
+    'ORIGEM ANIMAL': ['dúzia', '400g', 'kg'], 'COGUMELOS': ['200g', '500g'], 'TEMPEROS': ['maço', '100g'],
+}
+DEFAULT_UNITS = ['un', '500g', 'kg', 'pacote']
+
+FIRST_NAMES = ['Ana', 'Maria', 'José', 'João', 'Antônio', 'Francisca', 'Carlos', 'Paulo', 'Lucas', 'Juliana',
+               'Marcos', 'Fernanda', 'Rafael', 'Patrícia', 'Aline', 'Bruno', 'Camila', 'Diego', 'Helena', 'Igor',
+               'Larissa', 'Mateus', 'Natália', 'Otávio', 'Renata', 'Sérgio', 'Tatiane', 'Vinícius', 'Yasmin']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Ferreira', 'Costa', 'Rodrigues',
+              'Almeida', 'Nascimento', 'Carvalho', 'Araújo', 'Ribeiro', 'Barbosa', 'Cavalcante', 'Melo']
+STREETS = ['Rua Jangadeiros Alagoanos', 'Av. Álvaro Otacílio', 'Rua Desportista Humberto Guimarães',
+           'Av. Fernandes Lima', 'Rua Zeferino Rodrigues', 'Av. Dr. Antônio Gouveia', 'Rua Epaminondas Gracindo',
+           'Rua Prof. Sandoval Arroxelas', 'Av. Comendador Gustavo Paiva', 'Rua Dep. José Lages']
+# (bairro, cidade, CEP)
+NEIGHBORHOODS = [
+    ('Ponta Verde', 'Maceió', '57035-000'), ('Pajuçara', 'Maceió', '57030-170'),
+    ('Jatiúca', 'Maceió', '57036-000'), ('Mangabeiras', 'Maceió', '57037-000'),
+    ('Cruz das Almas', 'Maceió', '57038-000'), ('Farol', 'Maceió', '57051-000'),
+    ('Gruta de Lourdes', 'Maceió', '57052-000'), ('Serraria', 'Maceió', '57046-000'),
+    ('Stella Maris', 'Maceió', '57039-000'), ('Jacarecica', 'Maceió', '57038-640'),
+    ('Centro', 'Paripueira', '57935-000'), ('Sonho Verde', 'Paripueira', '57935-000'),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos para testes de performance')
+    parser.add_argument('--database-url', help='Banco de destino (padrão: DATABASE_URL ou o SQLite local)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--categories', type=int, default=12)
+    parser.add_argument('--products', type=int, default=400)
+    parser.add_argument('--weeks', type=int, default=156, help='Semanas de histórico (156 = 3 anos)')
+    parser.add_argument('--orders', type=int, default=100000, help='Total de pedidos no histórico')
+    parser.add_argument('--list-coverage', type=float, default=0.6,
+                        help='Fração do catálogo oferecida em cada lista semanal')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=DEFAULT_END_DATE,
+                        help='Início da semana mais recente (AAAA-MM-DD)')
+    parser.add_argument('--reset', action='store_true', help='Apaga todas as tabelas antes de gerar')
+    return parser.parse_args(argv)
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _bulk_insert(db, model, rows):
+    # INSERT em lote (executemany) pelo Core, sem RETURNING linha a linha
+    table = model.__table__
+    for chunk in _chunks(rows):
+        db.session.execute(table.insert(), chunk)
+
+
+def _next_id(db, model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _sync_sequences(db, models):
+    # Os ids foram gerados aqui; no Postgres as sequences precisam acompanhar
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__table__.name
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{table}\"), 1))"
+        ))
+
+
+def _quantity(rng, unit):
+    if unit == 'kg':
+        return rng.choices([0.5, 1.0, 1.5, 2.0, 3.0], weights=[20, 45, 15, 15, 5])[0]
+    # Distribuição geométrica: a maioria leva 1 ou 2, poucos levam muitos
+    quantity = 1
+    while quantity < 6 and rng.random() < 0.35:
+        quantity += 1
+    return float(quantity)
+
+
+def generate(app_module, seed=42, categories=12, products=400, weeks=156, orders=100000,
+             list_coverage=0.6, end_date=DEFAULT_END_DATE, log=print):
+    db = app_module.db
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    # Categorias
+    existing = {c.name: c for c in app_module.Category.query.all()}
+    category_rows = []
+    next_category_id = _next_id(db, app_module.Category)
+    for index, (name, emoji) in enumerate(CATEGORY_NAMES[:categories]):
+        if name not in existing:
+            category_rows.append({'id': next_category_id, 'name': name, 'emoji': emoji, 'order': index + 1})
+            next_category_id += 1
+    for index in range(len(CATEGORY_NAMES), categories):
+        category_rows.append({'id': next_category_id, 'name': f'CATEGORIA {index + 1}', 'emoji': '🧺',
+                              'order': index + 1})
+        next_category_id += 1
+    _bulk_insert(db, app_module.Category, category_rows)
+    category_by_id = {c.id: c.name for c in app_module.Category.query.all()}
+    category_ids = sorted(category_by_id)
+
+    # Produtos
+    product_rows = []
+    next_product_id = _next_id(db, app_module.Product)
+    first_week = end_date - timedelta(weeks=weeks - 1)
+    seen_names = set()
+    for index in range(products):
+        category_id = rng.choice(category_ids)
+        category_name = category_by_id[category_id]
+        base = rng.choice(PRODUCE.get(category_name, GENERIC_PRODUCE))
+        name = f'{base} {rng.choice(VARIETIES)}'.strip()
+        if name in seen_names:
+            name = f'{name} {index + 1}'
+        seen_names.add(name)
+        # Parte do catálogo entra no meio do histórico (útil para tendência)
+        added_week = 0 if rng.random() < 0.7 else rng.randrange(weeks)
+        product_rows.append({
+            'id': next_product_id + index,
+            'name': name,
+            'price': round(rng.lognormvariate(2.0, 0.55), 2),
+            'unit': rng.choice(UNIT_BY_CATEGORY.get(category_name, DEFAULT_UNITS)),
+            'is_organic': rng.random() < 0.75,
+            'is_active': rng.random() < 0.92,
+            'category_id': category_id,
+            'created_at': datetime.combine(first_week + timedelta(weeks=added_week), datetime.min.time()),
+        })
+    _bulk_insert(db, app_module.Product, product_rows)
+    catalog = [
+        (p.id, p.price, p.unit, p.created_at.date() if p.created_at else first_week, p.name, p.is_organic)
+        for p in app_module.Product.query.filter_by(is_active=True).order_by(app_module.Product.id)
+    ]
+    # Popularidade no estilo Zipf: poucos produtos concentram a maior parte das vendas
+    popularity = list(range(len(catalog)))
+    rng.shuffle(popularity)
+    weights = {product_id: 1.0 / (rank + 1) ** 0.8 for rank, (product_id, *_) in zip(popularity, catalog)}
+
+    # Listas semanais (a mais recente fica ativa)
+    app_module.WeeklyList.query.filter_by(is_active=True).update({'is_active': False})
+    list_rows, weekly_product_rows, offered = [], [], []
+    next_list_id = _next_id(db, app_module.WeeklyList)
+    next_weekly_product_id = _next_id(db, app_module.WeeklyProduct)
+    for week in range(weeks):
+        week_start = first_week + timedelta(weeks=week)
+        list_id = next_list_id + week
+        is_current = week == weeks - 1
+        list_rows.append({
+            'id': list_id, 'week_start': week_start, 'week_end': week_start + timedelta(days=6),
+            'is_active': is_current, 'is_closed': not is_current,
+            'created_at': datetime.combine(week_start - timedelta(days=2), datetime.min.time()),
+            'opened_at': datetime.combine(week_start - timedelta(days=2), datetime.min.time()),
+        })
+        available = [p for p in catalog if p[3] <= week_start]
+        chosen = rng.sample(available, max(1, int(len(available) * list_coverage))) if available else []
+        offered.append((list_id, week_start, chosen))
+        for product_id, price, unit, _, name, is_organic in chosen:
+            weekly_product_rows.append({'id': next_weekly_product_id, 'weekly_list_id': list_id,
+                                        'product_id': product_id, 'name': name, 'unit': unit,
+                                        'price': price, 'is_organic': is_organic})
+            next_weekly_product_id += 1
+    _bulk_insert(db, app_module.WeeklyList, list_rows)
+    _bulk_insert(db, app_module.WeeklyProduct, weekly_product_rows)
+
+    # Pedidos: crescimento ao longo do tempo + sazonalidade anual (dezembro mais forte)
+    week_weights = []
+    for week, (_, week_start, chosen) in enumerate(offered):
+        growth = 0.5 + week / max(1, weeks - 1)
+        season = 1.0 + 0.25 * (week_start.month == 12) - 0.15 * (week_start.month in (6, 7))
+        week_weights.append(growth * season if chosen else 0.0)
+    total_weight = sum(week_weights) or 1.0
+    orders_per_week = [int(orders * w / total_weight) for w in week_weights]
+    orders_per_week[-1] += orders - sum(orders_per_week)
+
+    customers = []
+    for index in range(max(1, orders // 8)):
+        street = rng.choice(STREETS)
+        neighborhood, city, cep = rng.choice(NEIGHBORHOODS)
+        customers.append((
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            f'(82) 9{rng.randint(8000, 9999)}-{rng.randint(0, 9999):04d}',
+            f'{street}, {rng.randint(1, 2500)} - {neighborhood}, {city} - CEP {cep}',
+        ))
+    # Clientes fiéis pedem com mais frequência
+    customer_weights = [1.0 / (i + 1) ** 0.5 for i in range(len(customers))]
+
+    order_rows, item_rows = [], []
+    next_order_id = _next_id(db, app_module.Order)
+    next_item_id = _next_id(db, app_module.OrderItem)
+    for (list_id, week_start, chosen), count in zip(offered, orders_per_week):
+        if not chosen or count <= 0:
+            continue
+        chosen_weights = [weights[p[0]] for p in chosen]
+        picked_customers = rng.choices(customers, weights=customer_weights, k=count)
+        for name, phone, address in picked_customers:
+            order_id = next_order_id
+            next_order_id += 1
+            line_count = min(len(chosen), rng.choices(range(1, 13), weights=[6, 9, 12, 13, 12, 10, 8, 6, 5, 4, 3, 2])[0])
+            lines = {}
+            for product_id, price, unit, _, product_name, is_organic in rng.choices(chosen, weights=chosen_weights, k=line_count):
+                if product_id not in lines:
+                    lines[product_id] = (price, _quantity(rng, unit), product_name, unit, is_organic)
+            subtotal = 0.0
+            for product_id, (price, quantity, product_name, unit, is_organic) in lines.items():
+                total = round(price * quantity, 2)
+                subtotal += total
+                item_rows.append({'id': next_item_id, 'order_id': order_id, 'product_id': product_id,
+                                  'product_name': product_name, 'unit': unit, 'is_organic': is_organic,
+                                  'quantity': quantity, 'unit_price': price, 'total_price': total})
+                next_item_id += 1
+            delivery_fee = 10.0
+            order_rows.append({
+                'id': order_id,
+                'customer_name': name,
+                'customer_phone': phone if rng.random() < 0.9 else '',
+                'delivery_address': address if rng.random() < 0.85 else '',
+                'delivery_fee': delivery_fee,
+                'total_amount': round(subtotal + delivery_fee, 2),
+                'weekly_list_id': list_id,
+                'created_at': datetime.combine(week_start, datetime.min.time()) + timedelta(
+                    minutes=rng.randrange(0, 4 * 24 * 60)),
+            })
+    _bulk_insert(db, app_module.Order, order_rows)
+    _bulk_insert(db, app_module.OrderItem, item_rows)
+    _sync_sequences(db, [app_module.Category, app_module.Product, app_module.WeeklyList,
+                         app_module.WeeklyProduct, app_module.Order, app_module.OrderItem])
+    db.session.commit()
+
+    summary = {
+        'seed': seed,
+        'categories': len(category_rows),
+        'products': len(product_rows),
+        'weekly_lists': len(list_rows),
+        'weekly_products': len(weekly_product_rows),
+        'orders': len(order_rows),
+        'order_items': len(item_rows),
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    log(f"✅ Dados gerados: {summary}")
+    return summary
+
+
+def load_app(database_url=None):
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DETECT_N_PLUS_ONE', '0')
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as app_module
+    return app_module
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app_module = load_app(args.database_url)
+    with app_module.app.app_context():
+        if args.reset:
+            app_module.db.drop_all()
+            with contextlib.redirect_stdout(sys.stderr):
+                app_module.init_db()
+        generate(
+            app_module,
+            seed=args.seed,
+            categories=args.categories,
+            products=args.products,
+            weeks=args.weeks,
+            orders=args.orders,
+            list_coverage=args.list_coverage,
+            end_date=args.end_date,
+        )
+
+
+if __name__ == '__main__':
+    main()
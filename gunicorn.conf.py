@@ -0,0 +1,14 @@
+# Configuração do gunicorn (carregada automaticamente pelo `gunicorn app:app` do Procfile)
+import os
+
+import metrics
+
+# Threads por worker: o feed ao vivo do painel (SSE) mantém uma conexão aberta
+# por aba; com workers síncronos cada aba prenderia um processo inteiro
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+
+def on_starting(server):
+    # Snapshots de métricas de uma execução anterior não valem mais
+    metrics.reset_directory()
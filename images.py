@@ -0,0 +1,111 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# Fotos dos produtos: original guardado pelo hash do conteúdo e miniaturas
+# quadradas em algumas larguras, em WebP e JPEG.
+#
+#     <MEDIA_DIR>/originals/<hash>            arquivo enviado, sem alteração
+#     <MEDIA_DIR>/products/<chave>-<largura>.webp|jpg
+#
+# A chave é o começo do hash: o nome muda sempre que a foto muda, então os
+# arquivos podem ser servidos com cache "immutable" de um ano.
+
+WIDTHS = (160, 320, 640)
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'MPO'}
+MAX_PIXELS = 40_000_000  # fotos de celular têm ~12-50 MP; acima disso é recusada
+KEY_LENGTH = 16
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()[:KEY_LENGTH]
+
+
+def check_image(data):
+    # Só lê o cabeçalho: barato o bastante para rodar na própria requisição
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise InvalidImage(f'Formato não suportado: {image.format}')
+            if image.width * image.height > MAX_PIXELS:
+                raise InvalidImage('Imagem grande demais')
+    except InvalidImage:
+        raise
+    except Exception:
+        raise InvalidImage('Arquivo não é uma imagem válida')
+
+
+def save_original(media_dir, data):
+    key = content_key(data)
+    path = original_path(media_dir, key)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return key
+
+
+def original_path(media_dir, key):
+    return os.path.join(media_dir, 'originals', key)
+
+
+def thumbnail_name(key, width, extension):
+    return f'{key}-{width}.{extension}'
+
+
+def make_thumbnails(media_dir, key, widths=WIDTHS):
+    # Gera as miniaturas que ainda não existem; devolve as larguras disponíveis
+    # (nunca amplia: uma foto pequena fica só com as larguras que comporta)
+    output_dir = os.path.join(media_dir, 'products')
+    with Image.open(original_path(media_dir, key)) as source:
+        if source.width * source.height > MAX_PIXELS:
+            raise InvalidImage('Imagem grande demais')
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Transparência vira fundo branco (JPEG não tem canal alfa)
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    side = min(image.size)
+    available = [width for width in sorted(widths) if width <= side] or [side]
+    for width in available:
+        square = ImageOps.fit(image, (width, width), Image.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            path = os.path.join(output_dir, thumbnail_name(key, width, extension))
+            if os.path.exists(path):
+                continue
+            _write_atomic(path, _encode(square, image_format, options))
+    return available
+
+
+def srcset(url_for_name, key, widths, extension):
+    return ', '.join(f'{url_for_name(thumbnail_name(key, width, extension))} {width}w' for width in widths)
+
+
+def _encode(image, image_format, options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _write_atomic(path, data):
+    # Outro processo pode estar servindo o mesmo arquivo: grava ao lado e renomeia
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
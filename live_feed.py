@@ -0,0 +1,65 @@
+import json
+import queue
+import threading
+
+# Distribuição de eventos para as conexões SSE abertas neste processo.
+#
+# Cada visitante do painel tem uma fila própria e limitada; quem não consome
+# a tempo (aba travada, rede lenta) perde eventos em vez de segurar os outros.
+# Entre processos os eventos chegam por LISTEN/NOTIFY (Postgres) ou por uma
+# consulta periódica de pedidos novos (outros bancos), ambas em app.py.
+
+
+class Subscription:
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broadcaster:
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.changed = threading.Event()
+
+    @property
+    def count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscription = Subscription(self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+        self.changed.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        self.changed.set()
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.dropped += 1
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    for line in json.dumps(data, ensure_ascii=False).splitlines():
+        lines.append(f'data: {line}')
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,200 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Métricas de requisições no formato texto do Prometheus.
+#
+# Cada worker do gunicorn acumula suas métricas em memória e grava de tempos
+# em tempos um snapshot em METRICS_DIR (um arquivo por PID). O endpoint
+# /metrics soma os snapshots de todos os workers, então qualquer worker que
+# atender a coleta devolve o total do servidor.
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'hortifruti-metrics'))
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '2'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# nome -> (tipo, descrição, buckets)
+DEFINITIONS = {
+    'http_requests_total': ('counter', 'Total de requisições HTTP atendidas.', None),
+    'http_request_duration_seconds': ('histogram', 'Latência das requisições por rota.', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('histogram', 'Tamanho das respostas por rota.', SIZE_BUCKETS),
+    'http_request_sql_queries': ('histogram', 'Quantidade de comandos SQL por requisição.', QUERY_BUCKETS),
+    'http_request_sql_seconds_total': ('counter', 'Tempo total gasto em SQL por rota.', None),
+    'http_requests_shed_total': ('counter', 'Requisições recusadas pelo controle de admissão (sobrecarga).', None),
+}
+
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = DEFINITIONS[name][2]
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def observe_request(self, route, method, status, duration, size, sql_count, sql_time):
+        labels = (('route', route), ('method', method))
+        self.inc('http_requests_total', labels + (('status', str(status)),))
+        self.observe('http_request_duration_seconds', labels, duration)
+        self.observe('http_response_size_bytes', labels, size)
+        self.observe('http_request_sql_queries', labels, sql_count)
+        self.inc('http_request_sql_seconds_total', labels, sql_time)
+        self.maybe_flush()
+
+    def observe_shed(self, route, priority):
+        self.inc('http_requests_shed_total', (('route', route), ('priority', priority)))
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, list(labels), list(h['buckets']), h['sum'], h['count']]
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def _worker_file(self):
+        return os.path.join(self.directory, f'worker-{os.getpid()}.json')
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._worker_file()
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Métricas nunca devem derrubar uma requisição
+            pass
+
+    def collect(self):
+        # Snapshots de todos os workers (inclusive os que já morreram, pois
+        # contadores são cumulativos) + o estado atual deste worker.
+        snapshots = [self.snapshot()]
+        own_file = self._worker_file()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.startswith('worker-') or not name.endswith('.json') or path == own_file:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return merge_snapshots(snapshots)
+
+    def render(self):
+        return render_prometheus(self.collect())
+
+
+def merge_snapshots(snapshots):
+    counters = {}
+    histograms = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get('counters', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snap.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            hist = histograms.get(key)
+            if hist is None:
+                histograms[key] = {'buckets': list(buckets), 'sum': total, 'count': count}
+            else:
+                hist['buckets'] = [a + b for a, b in zip(hist['buckets'], buckets)]
+                hist['sum'] += total
+                hist['count'] += count
+    return counters, histograms
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(merged):
+    counters, histograms = merged
+    lines = []
+    for name, (kind, help_text, buckets) in DEFINITIONS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        else:
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, hist['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_value(float(bound))),))} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {hist["count"]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(hist["sum"])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {hist["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset_directory(directory=METRICS_DIR):
+    # Chamado pelo master do gunicorn ao iniciar: descarta snapshots de uma
+    # execução anterior para os contadores recomeçarem do zero.
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith('worker-'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import smtplib
+import sys
+import threading
+import time
+from collections import namedtuple
+from email.message import EmailMessage
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+# Envio das notificações da caixa de saída (tabela notification).
+#
+# O checkout só grava a mensagem no banco, na mesma transação do pedido; um
+# worker em segundo plano lê a caixa de saída e entrega pelo sender do canal.
+# Cada canal (whatsapp, email) usa o sender configurado no ambiente:
+#
+#     NOTIFICATION_WHATSAPP_SENDER = stdout | file:/caminho.jsonl | cloud-api
+#     NOTIFICATION_EMAIL_SENDER    = stdout | file:/caminho.jsonl | smtp
+#
+# Canal sem sender configurado não é enviado: as mensagens dele ficam na
+# caixa de saída até alguém configurar o canal (stdout só se pedido, para
+# desenvolvimento — ele marcaria a mensagem como enviada sem entregar nada).
+#
+# Um sender só precisa de `send(message)`: retorna em caso de sucesso, levanta
+# PermanentError quando tentar de novo não adianta (número inválido, 4xx) e
+# qualquer outra exceção para tentar de novo mais tarde.
+
+Message = namedtuple('Message', 'channel recipient subject body')
+
+MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', '6'))
+BACKOFF_BASE_SECONDS = float(os.environ.get('NOTIFICATION_BACKOFF_SECONDS', '30'))
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+
+
+class PermanentError(Exception):
+    pass
+
+
+class StdoutSender:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            print(f"📨 [{message.channel}] para {message.recipient}: {message.subject}\n{message.body}\n",
+                  file=self.stream, flush=True)
+
+
+class FileSender:
+    # Uma linha JSON por mensagem; útil em testes e em desenvolvimento
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps({**message._asdict(), 'sent_at': time.time()}, ensure_ascii=False)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class WhatsAppCloudSender:
+    # API oficial do WhatsApp Business (Cloud API), mensagem de texto simples
+    API_URL = 'https://graph.facebook.com/v17.0/{phone_number_id}/messages'
+
+    def __init__(self, token, phone_number_id, timeout=10):
+        self.token = token
+        self.url = self.API_URL.format(phone_number_id=phone_number_id)
+        self.timeout = timeout
+
+    def send(self, message):
+        body = json.dumps({
+            'messaging_product': 'whatsapp',
+            'to': message.recipient,
+            'type': 'text',
+            'text': {'body': message.body},
+        }).encode()
+        request = Request(self.url, data=body, method='POST', headers={
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': 'application/json',
+        })
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except HTTPError as e:
+            if 400 <= e.code < 500 and e.code != 429:
+                raise PermanentError(f'WhatsApp API respondeu {e.code}: {e.read()[:200]!r}')
+            raise
+
+
+class SmtpSender:
+    def __init__(self, host, port, username=None, password=None, sender=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.timeout = timeout
+
+    def send(self, message):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message.recipient
+        email['Subject'] = message.subject
+        email.set_content(message.body)
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+                smtp.send_message(email)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentError(str(e))
+
+
+CHANNELS = {
+    'whatsapp': 'NOTIFICATION_WHATSAPP_SENDER',
+    'email': 'NOTIFICATION_EMAIL_SENDER',
+}
+
+
+def build_sender(spec, environ=os.environ):
+    # None quando o canal não está configurado
+    spec = (spec or '').strip()
+    if not spec:
+        return None
+    if spec == 'stdout':
+        return StdoutSender()
+    if spec.startswith('file:'):
+        return FileSender(spec[len('file:'):])
+    if spec == 'cloud-api':
+        return WhatsAppCloudSender(environ['WHATSAPP_TOKEN'], environ['WHATSAPP_PHONE_NUMBER_ID'])
+    if spec == 'smtp':
+        return SmtpSender(
+            environ['SMTP_HOST'],
+            int(environ.get('SMTP_PORT', '587')),
+            environ.get('SMTP_USERNAME'),
+            environ.get('SMTP_PASSWORD'),
+            environ.get('SMTP_FROM'),
+        )
+    raise ValueError(f'Sender de notificação desconhecido: {spec!r}')
+
+
+def build_senders(environ=os.environ):
+    # Só os canais configurados; sender mal configurado (variável faltando,
+    # tipo desconhecido) levanta a exceção para quem chamou registrar
+    senders = {}
+    for channel, variable in CHANNELS.items():
+        sender = build_sender(environ.get(variable), environ)
+        if sender is not None:
+            senders[channel] = sender
+    return senders
+
+
+def backoff_delay(attempts, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    # Exponencial com jitter: 30 s, 1 min, 2 min, 4 min... (±50%)
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.5)
+
+
+class RateLimiter:
+    # Token bucket: no máximo `rate` envios por `per` segundos, com rajadas
+    # de até `burst` mensagens
+    def __init__(self, rate, per=60.0, burst=None):
+        self.rate = rate
+        self.per = per
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate / self.per)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) * self.per / self.rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
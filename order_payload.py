@@ -0,0 +1,144 @@
+import json
+import math
+
+# Validação do corpo do checkout (POST /api/save-order), antes de qualquer
+# acesso ao banco.
+#
+# O corpo chega como bytes já limitados em tamanho (MAX_ORDER_BYTES em
+# app.py); aqui ele é decodificado e conferido campo a campo. Qualquer
+# problema vira InvalidPayload com a lista de erros por campo, no formato
+# devolvido ao navegador:
+#
+#     {"field": "items.12.quantity", "message": "deve ser maior que zero"}
+#
+# O resultado é um dict normalizado: textos sem espaços nas pontas, números
+# como float e itens como {product_id (int): {'quantity', 'price'}}.
+#
+# Os limites numéricos só barram lixo; preço, taxa e total valem o que a
+# lista da semana diz, e check_prices confere os valores do navegador com ela.
+
+MAX_ITEMS = 200
+MAX_QUANTITY = 1000
+MAX_PRICE = 10000
+MAX_DELIVERY_FEE = 1000
+MAX_TOTAL = 1000000
+MAX_ERRORS = 20  # não adianta listar mil erros de um corpo montado à mão
+MAX_PRODUCT_ID_DIGITS = 10
+CENT_TOLERANCE = 1  # arredondamento do navegador
+
+TEXT_FIELDS = {
+    # campo: (obrigatório, tamanho máximo) — tamanhos das colunas de Order
+    'customer_name': (True, 200),
+    'customer_phone': (False, 20),
+    'delivery_address': (False, 500),
+}
+
+
+class InvalidPayload(ValueError):
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.message = message
+        self.errors = list(errors)
+
+
+def _reject_constant(name):
+    # json aceita NaN e Infinity por padrão; no pedido eles só quebrariam as contas
+    raise ValueError(f'valor inválido: {name}')
+
+
+def _number(errors, field, value, minimum, maximum, positive=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        errors.append({'field': field, 'message': 'deve ser um número'})
+    elif positive and value <= 0:
+        errors.append({'field': field, 'message': 'deve ser maior que zero'})
+    elif value < minimum or value > maximum:
+        errors.append({'field': field, 'message': f'deve estar entre {minimum} e {maximum}'})
+    else:
+        return float(value)
+    return None
+
+
+def parse_order(body, max_items=MAX_ITEMS):
+    try:
+        data = json.loads(body, parse_constant=_reject_constant)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidPayload('O pedido não está em JSON válido.')
+    if not isinstance(data, dict):
+        raise InvalidPayload('O pedido deve ser um objeto JSON.')
+
+    errors = []
+    order = {}
+    for field, (required, max_length) in TEXT_FIELDS.items():
+        value = data.get(field)
+        if value is None:
+            value = ''
+        if not isinstance(value, str):
+            errors.append({'field': field, 'message': 'deve ser um texto'})
+            continue
+        value = value.strip()
+        if required and not value:
+            errors.append({'field': field, 'message': 'é obrigatório'})
+        elif len(value) > max_length:
+            errors.append({'field': field, 'message': f'deve ter no máximo {max_length} caracteres'})
+        order[field] = value
+
+    order['delivery_fee'] = _number(errors, 'delivery_fee', data.get('delivery_fee', 0), 0, MAX_DELIVERY_FEE)
+    order['total_amount'] = _number(errors, 'total_amount', data.get('total_amount'), 0, MAX_TOTAL)
+
+    slot_id = data.get('delivery_slot_id')
+    if slot_id is not None and (isinstance(slot_id, bool) or not isinstance(slot_id, int) or slot_id <= 0):
+        errors.append({'field': 'delivery_slot_id', 'message': 'deve ser um número inteiro'})
+    order['delivery_slot_id'] = slot_id
+
+    items = data.get('items')
+    order['items'] = {}
+    if not isinstance(items, dict) or not items:
+        errors.append({'field': 'items', 'message': 'o carrinho está vazio'})
+    elif len(items) > max_items:
+        errors.append({'field': 'items', 'message': f'no máximo {max_items} produtos por pedido'})
+    else:
+        for key, item in items.items():
+            if len(errors) >= MAX_ERRORS:
+                break
+            field = f'items.{key[:MAX_PRODUCT_ID_DIGITS + 1]}'
+            if not (key.isascii() and key.isdigit() and len(key) <= MAX_PRODUCT_ID_DIGITS):
+                errors.append({'field': field, 'message': 'produto inválido'})
+                continue
+            if not isinstance(item, dict):
+                errors.append({'field': field, 'message': 'deve ter quantidade e preço'})
+                continue
+            if int(key) in order['items']:
+                errors.append({'field': field, 'message': 'produto repetido'})
+                continue
+            quantity = _number(errors, f'{field}.quantity', item.get('quantity'), 0, MAX_QUANTITY, positive=True)
+            price = _number(errors, f'{field}.price', item.get('price'), 0, MAX_PRICE)
+            order['items'][int(key)] = {'quantity': quantity, 'price': price}
+
+    if errors:
+        raise InvalidPayload('Pedido inválido. Atualize a página e tente novamente.', errors[:MAX_ERRORS])
+    return order
+
+
+def _cents(value):
+    return round(value * 100)
+
+
+def check_prices(order, list_prices, delivery_fee):
+    # Confere preço de cada item, taxa de entrega e total com a lista da semana
+    # (list_prices: {product_id: preço}). Devolve (total, {product_id: preço
+    # da lista} dos itens que divergem, erros por campo).
+    changed = {}
+    errors = []
+    subtotal = 0.0
+    for product_id, item in order['items'].items():
+        price = list_prices[product_id]
+        subtotal += item['quantity'] * price
+        if abs(_cents(item['price']) - _cents(price)) > CENT_TOLERANCE:
+            changed[product_id] = price
+            errors.append({'field': f'items.{product_id}.price', 'message': f'o preço da lista é {price:.2f}'})
+    if abs(_cents(order['delivery_fee']) - _cents(delivery_fee)) > CENT_TOLERANCE:
+        errors.append({'field': 'delivery_fee', 'message': f'a taxa de entrega é {delivery_fee:.2f}'})
+    total = round(subtotal + delivery_fee, 2)
+    if abs(_cents(order['total_amount']) - _cents(total)) > CENT_TOLERANCE:
+        errors.append({'field': 'total_amount', 'message': f'o total do pedido é {total:.2f}'})
+    return total, changed, errors[:MAX_ERRORS]
@@ -0,0 +1,118 @@
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Orçamento máximo de comandos SQL por view (endpoint do Flask).
+#
+# O número não pode crescer com a quantidade de produtos, pedidos ou itens:
+# se uma view estourar o orçamento é quase sempre um relacionamento sendo
+# carregado dentro de um loop (N+1). Toda view nova precisa entrar aqui;
+# `missing_budgets(app)` lista as que ficaram de fora.
+#
+# Uso em testes (pytest):
+#
+#     from query_budget import assert_route_budget
+#
+#     def test_index_query_budget(client):
+#         assert_route_budget(client, '/')
+QUERY_BUDGETS = {
+    'index': 5,
+    'category_fragment': 2,
+    'save_order': 8,
+    'api_stock': 2,
+    'api_delivery_slots': 2,
+    'api_customer_lookup': 1,
+    'admin_login': 1,
+    'admin_logout': 0,
+    'admin_dashboard': 1,
+    'admin_categories': 2,
+    'admin_add_category': 1,
+    'admin_edit_category': 2,
+    'admin_delete_category': 4,
+    'admin_orders': 3,
+    'admin_order_detail': 3,
+    'admin_orders_print': 5,
+    'admin_customers': 2,
+    'admin_customer_detail': 2,
+    'admin_products': 3,
+    'admin_add_product': 2,
+    'admin_edit_product': 3,
+    'admin_delete_product': 4,
+    'admin_create_weekly_list': 8,
+    'admin_list_schedule': 8,
+    'admin_slots': 2,
+    'admin_delete_slot': 2,
+    'admin_routes': 4,
+    'admin_geolocations': 2,
+    'admin_stock': 3,
+    'admin_reports': 4,
+    'admin_events': 1,
+    'admin_jobs': 2,
+    'admin_job_detail': 1,
+    'admin_job_status': 1,
+    'admin_job_cancel': 2,
+    'admin_job_download': 1,
+    'health_check': 0,
+    'readiness_check': 2,
+    'metrics_endpoint': 0,
+    'product_image': 0,
+    'static': 0,
+}
+
+
+class QueryCounter:
+    # Conta só a thread que abriu o contador: workers em segundo plano (caixa
+    # de saída de notificações) não entram no orçamento da requisição
+    def __init__(self):
+        self.statements = []
+        self.thread_id = threading.get_ident()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_max_queries(max_queries, label='bloco'):
+    with count_queries() as counter:
+        yield counter
+    if counter.count > max_queries:
+        executed = '\n'.join(f'  {i}. {statement}' for i, statement in enumerate(counter.statements, 1))
+        raise AssertionError(
+            f'{label}: {counter.count} comandos SQL executados, orçamento é {max_queries}\n{executed}'
+        )
+
+
+def budget_for(app, path, method='GET'):
+    endpoint, _ = app.url_map.bind('localhost').match(path.split('?', 1)[0], method=method)
+    if endpoint not in QUERY_BUDGETS:
+        raise AssertionError(f'A view {endpoint!r} não tem orçamento de consultas em QUERY_BUDGETS')
+    return QUERY_BUDGETS[endpoint]
+
+
+def assert_route_budget(client, path, method='GET', budget=None, **kwargs):
+    if budget is None:
+        budget = budget_for(client.application, path, method)
+    with assert_max_queries(budget, f'{method} {path}'):
+        response = client.open(path, method=method, **kwargs)
+    return response
+
+
+def missing_budgets(app):
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint not in QUERY_BUDGETS)
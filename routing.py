@@ -0,0 +1,163 @@
+import math
+import time
+from collections import namedtuple
+
+# Roteirização das entregas da semana, sem serviço externo.
+#
+# 1. Divide as paradas entre os entregadores: com coordenadas, por varredura
+#    angular em volta do ponto de partida (setores vizinhos ficam com o mesmo
+#    entregador); sem coordenadas, por grupo (CEP/bairro) inteiro.
+# 2. Ordena cada rota com vizinho mais próximo e refina com 2-opt, com
+#    limite de tempo para nunca passar de ~1 s mesmo com centenas de paradas.
+
+# key: identificador da parada (ex: id do pedido); group: CEP ou bairro
+Stop = namedtuple('Stop', 'key lat lng group')
+Route = namedtuple('Route', 'stops distance_km')
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def has_coordinates(stop):
+    return stop.lat is not None and stop.lng is not None
+
+
+def distance_matrix(points):
+    n = len(points)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        lat1, lng1 = points[i]
+        row = matrix[i]
+        for j in range(i + 1, n):
+            d = haversine(lat1, lng1, points[j][0], points[j][1])
+            row[j] = d
+            matrix[j][i] = d
+    return matrix
+
+
+def nearest_neighbor(matrix, start=0):
+    n = len(matrix)
+    visited = [False] * n
+    visited[start] = True
+    tour = [start]
+    current = start
+    for _ in range(n - 1):
+        row = matrix[current]
+        best, best_distance = None, float('inf')
+        for j in range(n):
+            if not visited[j] and row[j] < best_distance:
+                best, best_distance = j, row[j]
+        visited[best] = True
+        tour.append(best)
+        current = best
+    return tour
+
+
+def two_opt(tour, matrix, time_limit=0.5):
+    # Caminho aberto: começa em tour[0] (partida) e termina na última parada.
+    # Inverter tour[i..j] troca as arestas (i-1, i) e (j, j+1) por
+    # (i-1, j) e (i, j+1); sem j+1 (fim do caminho) a aresta não existe.
+    tour = list(tour)
+    n = len(tour)
+    if n < 4:
+        return tour
+    deadline = time.perf_counter() + time_limit
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = tour[i - 1], tour[i]
+            row_a, row_b = matrix[a], matrix[b]
+            d_ab = row_a[b]
+            for j in range(i + 1, n):
+                c = tour[j]
+                if j + 1 < n:
+                    d = tour[j + 1]
+                    delta = row_a[c] + row_b[d] - d_ab - matrix[c][d]
+                else:
+                    delta = row_a[c] - d_ab
+                if delta < -1e-9:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+                    b = tour[i]
+                    row_b = matrix[b]
+                    d_ab = row_a[b]
+            if time.perf_counter() > deadline:
+                break
+    return tour
+
+
+def path_length(tour, matrix):
+    return sum(matrix[tour[k]][tour[k + 1]] for k in range(len(tour) - 1))
+
+
+def centroid(stops):
+    return (sum(s.lat for s in stops) / len(stops), sum(s.lng for s in stops) / len(stops))
+
+
+def split_among_drivers(stops, drivers, depot=None):
+    drivers = max(1, drivers)
+    located = [s for s in stops if has_coordinates(s)]
+    unlocated = [s for s in stops if not has_coordinates(s)]
+    buckets = [[] for _ in range(drivers)]
+
+    if located:
+        origin = depot or centroid(located)
+
+        # Varredura angular: ordena pelo ângulo em volta da origem e corta em
+        # setores com a mesma quantidade de paradas, sem separar paradas do
+        # mesmo grupo (mesmo CEP/bairro) quando possível
+        def angle(stop):
+            return math.atan2(stop.lat - origin[0], stop.lng - origin[1])
+        located.sort(key=lambda s: (angle(s), s.key))
+        # Começa o corte no maior vão angular, para não partir um aglomerado ao meio
+        angles = [angle(s) for s in located]
+        gaps = [(angles[(k + 1) % len(angles)] - angles[k]) % (2 * math.pi) for k in range(len(angles))]
+        start = (max(range(len(gaps)), key=gaps.__getitem__) + 1) % len(located)
+        located = located[start:] + located[:start]
+
+        per_driver = math.ceil(len(located) / drivers)
+        index = 0
+        for bucket in buckets:
+            end = min(len(located), index + per_driver)
+            while 0 < end < len(located) and located[end].group and located[end].group == located[end - 1].group \
+                    and end - index < per_driver * 1.25:
+                end += 1
+            bucket.extend(located[index:end])
+            index = end
+
+    # Sem coordenadas: grupos inteiros para o entregador com menos paradas
+    groups = {}
+    for stop in unlocated:
+        groups.setdefault(stop.group or '', []).append(stop)
+    for group in sorted(groups, key=lambda g: (-len(groups[g]), g)):
+        target = min(buckets, key=len)
+        target.extend(sorted(groups[group], key=lambda s: s.key))
+    return buckets
+
+
+def order_route(stops, depot=None, time_limit=0.5):
+    located = [s for s in stops if has_coordinates(s)]
+    unlocated = [s for s in stops if not has_coordinates(s)]
+    ordered, distance = [], 0.0
+    if located:
+        points = ([depot] if depot else []) + [(s.lat, s.lng) for s in located]
+        matrix = distance_matrix(points)
+        tour = two_opt(nearest_neighbor(matrix, 0), matrix, time_limit)
+        distance = path_length(tour, matrix)
+        offset = 1 if depot else 0
+        ordered = [located[k - offset] for k in tour if k >= offset]
+    # Paradas sem coordenadas vão no fim, em ordem de CEP/bairro
+    ordered.extend(sorted(unlocated, key=lambda s: (s.group or '~', s.key)))
+    return Route(ordered, distance)
+
+
+def plan_routes(stops, drivers=1, depot=None, time_limit=0.8):
+    buckets = [bucket for bucket in split_among_drivers(list(stops), drivers, depot) if bucket]
+    per_route_limit = time_limit / max(1, len(buckets))
+    return [order_route(bucket, depot, per_route_limit) for bucket in buckets]
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Log em JSON, uma linha por evento, escrito fora da thread da requisição.
+#
+# A thread que loga só monta o registro (mensagem, traceback e contexto da
+# requisição: id, rota...) e o coloca numa fila limitada; uma thread por
+# processo formata e escreve no stderr. Com a fila cheia (stderr travado, pico
+# de erros) o registro é descartado e contado, nunca espera.
+#
+#     {"ts": "...", "level": "ERROR", "logger": "app", "message": "...",
+#      "request_id": "3f2a...", "route": "/api/save-order", "traceback": "..."}
+
+QUEUE_SIZE = 10000
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', None) or {})
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['traceback'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    # Desenvolvimento: mesma informação, legível no terminal
+    def format(self, record):
+        extra = {**(getattr(record, 'context', None) or {}), **(getattr(record, 'fields', None) or {})}
+        line = f'{record.levelname[0]} {record.getMessage()}'
+        if extra:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in extra.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class AsyncHandler(QueueHandler):
+    def __init__(self, target, context=None, queue_size=QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = target
+        self.context = context
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Na thread de quem loga: tudo que depende dela (mensagem formatada,
+        # traceback, contexto da requisição) vira texto antes de ir para a fila
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        if self.context is not None:
+            try:
+                record.context = self.context()
+            except Exception:
+                record.context = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_listener(self):
+        # Worker do gunicorn criado por fork não herda a thread do processo pai
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def flush(self):
+        # Espera a fila esvaziar (testes, encerramento do processo)
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+def configure(logger, level='INFO', fmt='json', context=None, stream=None):
+    target = logging.StreamHandler(stream or sys.stderr)
+    target.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    handler = AsyncHandler(target, context=context)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return handler
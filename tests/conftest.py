@@ -0,0 +1,98 @@
+import contextlib
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# A aplicação lê a configuração do ambiente na importação: banco SQLite
+# temporário e nenhuma thread em segundo plano (os testes chamam as funções
+# dos workers diretamente)
+_data_dir = tempfile.mkdtemp(prefix='hortifruti-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_data_dir, 'test.db')
+os.environ['METRICS_DIR'] = _data_dir
+os.environ['MEDIA_DIR'] = os.path.join(_data_dir, 'media')
+os.environ['NOTIFICATION_WORKER'] = '0'
+os.environ['JOB_RUNNER'] = '0'
+os.environ['LIST_SCHEDULER'] = '0'
+os.environ['DETECT_N_PLUS_ONE'] = '1'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.pop('RAILWAY_ENVIRONMENT', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_USERNAME = 'mario'
+ADMIN_PASSWORD = '3943'
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import generate_data
+    # init_db() escreve no stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as app_module
+    with app_module.app.app_context():
+        generate_data.generate(app_module, seed=1, categories=6, products=80, weeks=4, orders=2000, log=lambda message: None)
+        app_module.backfill_customers()
+    return app_module
+
+
+@pytest.fixture
+def db(app_module):
+    with app_module.app.app_context():
+        yield app_module.db
+        app_module.db.session.remove()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def admin_client(app_module):
+    client = app_module.app.test_client()
+    response = client.post('/admin/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def active_list(app_module, db):
+    return app_module.WeeklyList.query.filter_by(is_active=True).one()
+
+
+def add_delivery_slot(app_module, weekly_list_id, capacity, delivery_fee=7.5):
+    # Horário novo na lista; devolve o id (commit feito)
+    starts_at = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+    slot = app_module.DeliverySlot(
+        weekly_list_id=weekly_list_id, starts_at=starts_at, ends_at=starts_at + timedelta(hours=2),
+        capacity=capacity, delivery_fee=delivery_fee
+    )
+    app_module.db.session.add(slot)
+    app_module.db.session.commit()
+    app_module.slot_cache.invalidate(weekly_list_id)
+    return slot.id
+
+
+def checkout_payload(app_module, weekly_list_id, slot_id, quantities):
+    # Corpo do POST /api/save-order com os preços e a taxa da lista
+    prices = dict(
+        app_module.db.session.query(app_module.WeeklyProduct.product_id, app_module.WeeklyProduct.price)
+        .filter(app_module.WeeklyProduct.weekly_list_id == weekly_list_id)
+    )
+    delivery_fee = app_module.db.session.get(app_module.DeliverySlot, slot_id).delivery_fee
+    subtotal = sum(quantity * prices[product_id] for product_id, quantity in quantities.items())
+    return {
+        'customer_name': 'Cliente Teste',
+        'customer_phone': '',
+        'delivery_address': 'Rua do Teste, 10 - Ponta Verde, Maceió',
+        'delivery_fee': delivery_fee,
+        'total_amount': round(subtotal + delivery_fee, 2),
+        'delivery_slot_id': slot_id,
+        'items': {
+            str(product_id): {'quantity': quantity, 'price': prices[product_id]}
+            for product_id, quantity in quantities.items()
+        },
+    }
@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import add_delivery_slot, checkout_payload
+
+SCRIPT = '<script>alert(1)</script>'
+
+
+@pytest.fixture
+def hostile_order(app_module, db, client, active_list):
+    # Pedido com HTML nos campos que o cliente digita
+    m = app_module
+    product_id = m.WeeklyProduct.query.filter_by(weekly_list_id=active_list.id, stock=None).first().product_id
+    slot_id = add_delivery_slot(m, active_list.id, capacity=10)
+    payload = checkout_payload(m, active_list.id, slot_id, {product_id: 1})
+    payload.update(customer_name=f'Ana {SCRIPT}', customer_phone='82999990000',
+                   delivery_address=f'Rua {SCRIPT}, 10 - Ponta Verde, Maceió')
+    response = client.post('/api/save-order', json=payload)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return m.Order.query.order_by(m.Order.id.desc()).first().id
+
+
+@pytest.mark.parametrize('path', ['/admin/orders/{id}', '/admin/orders/print?ids={id}'])
+def test_order_pages_escape_customer_fields(admin_client, hostile_order, path):
+    html = admin_client.get(path.format(id=hostile_order)).get_data(as_text=True)
+    assert 'Ana &lt;script&gt;' in html
+    assert 'Rua &lt;script&gt;' in html
+    assert SCRIPT not in html
+
+
+def test_order_list_escapes_customer_name(admin_client, hostile_order):
+    html = admin_client.get('/admin/orders').get_data(as_text=True)
+    assert f'href="/admin/orders/{hostile_order}"' in html
+    assert SCRIPT not in html
@@ -0,0 +1,34 @@
+import admission
+
+
+def served(controller, priority, seconds, measure_latency):
+    started_at = controller.admit(priority)
+    assert started_at is not None
+    controller.release(started_at - seconds, measure_latency)
+
+
+def test_fast_probes_do_not_hide_a_slow_checkout():
+    controller = admission.AdmissionController(capacity=10, latency_target=1.0, smoothing=0.5)
+    for _ in range(5):
+        served(controller, admission.CRITICAL, 2.0, measure_latency=True)
+    slow = controller.latency
+    for _ in range(100):
+        served(controller, admission.CRITICAL, 0.0001, measure_latency=False)
+    assert controller.latency > 1.5
+    assert controller.latency <= slow
+    assert controller.admit(admission.NORMAL) is None
+
+
+def test_checkout_latency_fades_without_checkouts():
+    controller = admission.AdmissionController(capacity=10, latency_target=1.0, smoothing=1.0, half_life=1.0)
+    served(controller, admission.CRITICAL, 2.0, measure_latency=True)
+    controller._latency_at -= 3.0  # três meias-vidas sem checkout
+    assert controller.latency < 0.3
+    assert controller.admit(admission.NORMAL) is not None
+
+
+def test_only_checkout_feeds_the_latency_signal():
+    assert admission.LATENCY_SIGNAL == {'save_order'}
+    for endpoint in ('health_check', 'readiness_check', 'metrics_endpoint', 'category_fragment'):
+        assert admission.priority_for(endpoint) == admission.CRITICAL
+        assert endpoint not in admission.LATENCY_SIGNAL
@@ -0,0 +1,214 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_delivery_slot, checkout_payload
+
+# Os caminhos que dependem de UPDATE condicional para não vender duas vezes a
+# mesma coisa: várias threads disputam o mesmo recurso ao mesmo tempo, cada
+# uma com a própria sessão, e só a quantidade certa pode ganhar.
+
+THREADS = 8
+
+
+def race(app_module, target, count=THREADS):
+    # Roda `target(i)` em `count` threads liberadas juntas; devolve os resultados
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        with app_module.app.app_context():
+            barrier.wait()
+            try:
+                return target(index)
+            finally:
+                app_module.db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(run, range(count)))
+
+
+@pytest.fixture
+def limited_product(app_module, db, active_list):
+    # Produto da lista com estoque limitado; volta a ser ilimitado no fim
+    m = app_module
+    weekly_product = m.WeeklyProduct.query.filter_by(weekly_list_id=active_list.id, stock=None).first()
+    product_id = weekly_product.product_id
+    yield product_id
+    db.session.execute(db.update(m.WeeklyProduct).where(
+        m.WeeklyProduct.weekly_list_id == active_list.id, m.WeeklyProduct.product_id == product_id
+    ).values(stock=None))
+    db.session.commit()
+    m.stock_cache.invalidate(active_list.id)
+
+
+def set_stock(m, weekly_list_id, product_id, stock):
+    m.db.session.execute(m.db.update(m.WeeklyProduct).where(
+        m.WeeklyProduct.weekly_list_id == weekly_list_id, m.WeeklyProduct.product_id == product_id
+    ).values(stock=stock))
+    m.db.session.commit()
+    m.stock_cache.invalidate(weekly_list_id)
+
+
+def stock_of(m, weekly_list_id, product_id):
+    return m.db.session.query(m.WeeklyProduct.stock).filter_by(
+        weekly_list_id=weekly_list_id, product_id=product_id
+    ).scalar()
+
+
+def test_reserve_stock_never_sells_more_than_the_stock(app_module, db, active_list, limited_product):
+    m = app_module
+    list_id = active_list.id
+    set_stock(m, list_id, limited_product, 3)
+
+    def reserve(index):
+        sold_out = m.reserve_stock(list_id, {limited_product: 1})
+        if sold_out:
+            m.db.session.rollback()
+        else:
+            m.db.session.commit()
+        return not sold_out
+
+    results = race(m, reserve)
+    db.session.expire_all()
+    assert results.count(True) == 3
+    assert stock_of(m, list_id, limited_product) == 0
+
+
+def test_concurrent_checkouts_share_the_stock(app_module, db, active_list, limited_product):
+    m = app_module
+    list_id = active_list.id
+    slot_id = add_delivery_slot(m, list_id, capacity=100)
+    set_stock(m, list_id, limited_product, 2)
+    payload = checkout_payload(m, list_id, slot_id, {limited_product: 1})
+    orders_before = m.Order.query.filter_by(weekly_list_id=list_id).count()
+
+    def checkout(index):
+        return m.app.test_client().post('/api/save-order', json=payload).status_code
+
+    statuses = Counter(race(m, checkout))
+    db.session.expire_all()
+    assert statuses == {200: 2, 409: THREADS - 2}
+    assert stock_of(m, list_id, limited_product) == 0
+    assert m.Order.query.filter_by(weekly_list_id=list_id).count() == orders_before + 2
+    # Quem não levou o produto também não ficou com a vaga do horário
+    assert db.session.get(m.DeliverySlot, slot_id).claimed == 2
+
+
+def test_claim_delivery_slot_respects_capacity(app_module, db, active_list):
+    m = app_module
+    list_id = active_list.id
+    slot_id = add_delivery_slot(m, list_id, capacity=3)
+
+    def claim(index):
+        fee = m.claim_delivery_slot(list_id, slot_id)
+        m.db.session.commit()
+        return fee
+
+    fees = race(m, claim)
+    db.session.expire_all()
+    assert fees.count(None) == THREADS - 3
+    assert db.session.get(m.DeliverySlot, slot_id).claimed == 3
+
+
+def test_outbox_claims_each_message_once(app_module, db):
+    m = app_module
+    now = datetime.utcnow()
+    db.session.execute(db.update(m.Notification).where(m.Notification.status.in_(('pending', 'sending'))).values(
+        status='failed', last_error='teste'
+    ))
+    db.session.execute(db.insert(m.Notification), [
+        {'channel': 'whatsapp' if i % 2 else 'email', 'recipient': f'dest-{i}', 'subject': 'Teste',
+         'body': 'Teste', 'created_at': now, 'next_attempt_at': now}
+        for i in range(40)
+    ])
+    db.session.commit()
+
+    def claim(index):
+        claimed = []
+        while True:
+            rows = m.claim_notifications(3, ['whatsapp', 'email'])
+            if not rows:
+                return claimed
+            claimed.extend(row.id for row in rows)
+
+    claimed = [notification_id for ids in race(m, claim) for notification_id in ids]
+    assert len(claimed) == 40
+    assert len(set(claimed)) == 40
+
+
+@pytest.fixture
+def restore_active_list(app_module, db, active_list):
+    # Os testes do agendador trocam a lista ativa; a base volta como estava
+    m = app_module
+    list_id = active_list.id
+    yield list_id
+    db.session.execute(db.update(m.WeeklyList).where(m.WeeklyList.id != list_id).values(is_active=False))
+    db.session.execute(db.update(m.WeeklyList).where(m.WeeklyList.id == list_id).values(
+        is_active=True, is_closed=False, closed_at=None
+    ))
+    m.drop_list_totals(list_id)
+    db.session.commit()
+
+
+def test_list_schedule_flips_each_list_once(app_module, db, restore_active_list):
+    m = app_module
+    old_list_id = restore_active_list
+    now = m.shop_now()
+    scheduled = m.WeeklyList(
+        week_start=now.date(), week_end=now.date() + timedelta(days=6), is_active=False,
+        opens_at=now - timedelta(minutes=1), closes_at=now + timedelta(hours=1)
+    )
+    db.session.add(scheduled)
+    db.session.commit()
+    new_list_id = scheduled.id
+
+    results = race(m, lambda index: m.run_list_schedule(now))
+    assert [list_id for result in results for list_id in result['opened']] == [new_list_id]
+    assert [list_id for result in results for list_id in result['closed']] == [old_list_id]
+    db.session.expire_all()
+    old_list = db.session.get(m.WeeklyList, old_list_id)
+    assert not old_list.is_active and old_list.is_closed
+    assert db.session.get(m.WeeklyListSummary, old_list_id).order_count == m.Order.query.filter_by(weekly_list_id=old_list_id).count()
+    assert m.WeeklyList.query.filter_by(is_active=True).one().id == new_list_id
+
+    # Encerramento no horário: também uma vez só
+    later = now + timedelta(hours=2)
+    results = race(m, lambda index: m.run_list_schedule(later))
+    assert [list_id for result in results for list_id in result['closed']] == [new_list_id]
+    assert [list_id for result in results for list_id in result['opened']] == []
+
+
+def test_stock_form_keeps_checkouts_made_after_it_was_loaded(app_module, db, admin_client, active_list, limited_product):
+    m = app_module
+    list_id = active_list.id
+    set_stock(m, list_id, limited_product, 5)
+    row = m.WeeklyProduct.query.filter_by(weekly_list_id=list_id, product_id=limited_product).one()
+    other = m.WeeklyProduct.query.filter(
+        m.WeeklyProduct.weekly_list_id == list_id, m.WeeklyProduct.id != row.id
+    ).first()
+    other_list_row = m.WeeklyProduct.query.filter(m.WeeklyProduct.weekly_list_id != list_id).first()
+    other_list_stock = other_list_row.stock
+    # Página aberta com 5; um checkout leva 2 antes de o admin salvar
+    assert not m.reserve_stock(list_id, {limited_product: 2})
+    db.session.commit()
+
+    response = admin_client.post('/admin/stock', data={
+        f'stock_{row.id}': '5', f'shown_{row.id}': '5.0',  # sem alteração
+        f'stock_{other.id}': '7', f'shown_{other.id}': '',
+        f'stock_{other_list_row.id}': '1', f'shown_{other_list_row.id}': '',  # de outra lista
+    })
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert stock_of(m, list_id, limited_product) == 3
+    assert db.session.get(m.WeeklyProduct, other.id).stock == 7
+    assert db.session.get(m.WeeklyProduct, other_list_row.id).stock == other_list_stock
+
+    # Alterado sobre um valor que já mudou: não sobrescreve
+    response = admin_client.post('/admin/stock', data={f'stock_{row.id}': '10', f'shown_{row.id}': '5.0'})
+    assert 'conflicts=1' in response.headers['Location']
+    db.session.expire_all()
+    assert stock_of(m, list_id, limited_product) == 3
+    set_stock(m, list_id, other.product_id, None)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import forecasting
+
+WEEK = np.timedelta64(7, 'D')
+
+
+def weekly_history(quantities, first_week='2022-01-03'):
+    quantities = np.asarray(quantities, dtype=float)
+    weeks = np.datetime64(first_week) + np.arange(len(quantities)) * WEEK
+    return forecasting.History(weeks, np.array([1]), quantities[None, :])
+
+
+def test_constant_series_forecasts_the_same_quantity():
+    forecast = forecasting.forecast_demand(weekly_history([10.0] * 60))[1]
+    assert forecast.seasonal == pytest.approx(1.0)
+    assert forecast.trend == pytest.approx(0.0)
+    assert forecast.quantity == pytest.approx(10.0)
+    assert forecast.suggested == 10.0
+
+
+def test_linear_series_has_no_seasonality():
+    # 1, 2, ..., 60: um ano de histórico com tendência, sem nenhuma sazonalidade
+    forecast = forecasting.forecast_demand(weekly_history(np.arange(1, 61)))[1]
+    assert forecast.seasonal == pytest.approx(1.0)
+    assert forecast.trend == pytest.approx(1.0)
+    # média das últimas 4 semanas (58,5) + tendência amortecida até a semana alvo
+    assert forecast.quantity == pytest.approx(59.75)
+    assert forecast.suggested == 61.0
+
+
+def test_same_weeks_in_previous_years_raise_the_forecast():
+    quantities = np.full(3 * 52, 10.0)
+    week_of_year = np.arange(len(quantities)) % 52
+    quantities[(week_of_year >= 20) & (week_of_year <= 22)] = 20.0
+    history = weekly_history(quantities)
+    target = history.weeks[0] + (3 * 52 + 21) * WEEK
+    forecast = forecasting.forecast_demand(history, target)[1]
+    assert forecast.seasonal > 1.3
+    assert forecast.quantity > forecast.moving_average
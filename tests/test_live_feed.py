@@ -0,0 +1,21 @@
+import re
+
+
+def test_reconnect_replays_missed_orders_once(app_module, db, admin_client, active_list):
+    m = app_module
+    ids = [order_id for (order_id,) in db.session.query(m.Order.id).order_by(m.Order.id.desc()).limit(3)][::-1]
+    subscribers = m.live_orders.count
+    response = admin_client.get('/admin/events', headers={'Last-Event-ID': str(ids[0])}, buffered=False)
+    try:
+        # Já inscrito antes de o stream começar: nada publicado agora se perde
+        assert m.live_orders.count == subscribers + 1
+        m.live_orders.publish({'id': ids[-1]})  # já vai no reenvio
+        m.live_orders.publish({'id': ids[-1] + 1000})
+        chunks = iter(response.response)
+        sent = []
+        while len(sent) < 3:
+            sent += [int(event_id) for event_id in re.findall(rb'^id: (\d+)', next(chunks), re.M)]
+        assert sent == ids[1:] + [ids[-1] + 1000]
+    finally:
+        response.close()
+    assert m.live_orders.count == subscribers
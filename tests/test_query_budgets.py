@@ -0,0 +1,139 @@
+import io
+
+import pytest
+
+from conftest import add_delivery_slot, checkout_payload
+from query_budget import QUERY_BUDGETS, assert_route_budget, missing_budgets
+
+# Uma requisição típica por view, sobre a base gerada pelo generate_data.py:
+# endpoint -> função (app, ids) que devolve (caminho, método, kwargs do client).
+# O que a requisição precisa (produto para excluir, tarefa com arquivo...) é
+# criado antes, fora da contagem.
+
+
+def new_category(m):
+    category = m.Category(name='TESTE', emoji='🧪', order=99)
+    m.db.session.add(category)
+    m.db.session.commit()
+    return category.id
+
+
+def new_product(m):
+    product = m.Product(name='Produto de teste', price=4.5, unit='kg', category_id=m.Category.query.first().id)
+    m.db.session.add(product)
+    m.db.session.commit()
+    return product.id
+
+
+def finished_job(m, weekly_list_id):
+    job_id = m.enqueue_job('orders_export', weekly_list_id=weekly_list_id)
+    m.run_pending_jobs()
+    return job_id
+
+
+def order_ids(m, ids, count=20):
+    rows = m.db.session.query(m.Order.id).filter_by(weekly_list_id=ids['list_id']).limit(count)
+    return [order_id for (order_id,) in rows]
+
+
+ROUTES = {
+    'index': lambda m, ids: ('/', 'GET', {}),
+    'category_fragment': lambda m, ids: (f"/fragments/category/{ids['category_id']}?list={ids['list_id']}", 'GET', {}),
+    'save_order': lambda m, ids: ('/api/save-order', 'POST', {
+        'json': checkout_payload(m, ids['list_id'], ids['slot_id'], {ids['product_id']: 2}),
+    }),
+    'api_stock': lambda m, ids: ('/api/stock', 'GET', {}),
+    'api_delivery_slots': lambda m, ids: ('/api/delivery-slots', 'GET', {}),
+    'api_customer_lookup': lambda m, ids: (f"/api/customers/lookup?phone={ids['customer_phone']}", 'GET', {}),
+    'admin_login': lambda m, ids: ('/admin/login', 'POST', {'data': {'username': 'mario', 'password': '3943'}}),
+    'admin_logout': lambda m, ids: ('/admin/logout', 'GET', {}),
+    'admin_dashboard': lambda m, ids: ('/admin', 'GET', {}),
+    'admin_categories': lambda m, ids: ('/admin/categories', 'GET', {}),
+    'admin_add_category': lambda m, ids: ('/admin/categories/add', 'POST', {
+        'data': {'name': 'nova', 'emoji': '🥬', 'order': '50'},
+    }),
+    'admin_edit_category': lambda m, ids: (f"/admin/categories/{ids['category_id']}/edit", 'POST', {
+        'data': {'name': 'frutas', 'emoji': '🍎', 'order': '1'},
+    }),
+    'admin_delete_category': lambda m, ids: (f'/admin/categories/{new_category(m)}/delete', 'GET', {}),
+    'admin_orders': lambda m, ids: ('/admin/orders', 'GET', {}),
+    'admin_order_detail': lambda m, ids: (f"/admin/orders/{ids['order_id']}", 'GET', {}),
+    'admin_orders_print': lambda m, ids: ('/admin/orders/print', 'GET', {'query_string': {'ids': order_ids(m, ids)}}),
+    'admin_customers': lambda m, ids: ('/admin/customers?q=a', 'GET', {}),
+    'admin_customer_detail': lambda m, ids: (f"/admin/customers/{ids['customer_id']}", 'GET', {}),
+    'admin_products': lambda m, ids: ('/admin/products', 'GET', {}),
+    'admin_add_product': lambda m, ids: ('/admin/products/add', 'POST', {
+        'data': {'name': 'Couve', 'price': '3.5', 'unit': 'maço', 'category_id': str(ids['category_id']),
+                 'image': (io.BytesIO(b''), '')},
+    }),
+    'admin_edit_product': lambda m, ids: (f"/admin/products/{ids['product_id']}/edit", 'GET', {}),
+    'admin_delete_product': lambda m, ids: (f'/admin/products/{new_product(m)}/delete', 'GET', {}),
+    'admin_create_weekly_list': lambda m, ids: ('/admin/create-list', 'GET', {}),
+    'admin_list_schedule': lambda m, ids: ('/admin/schedule', 'GET', {}),
+    'admin_slots': lambda m, ids: ('/admin/slots', 'GET', {}),
+    'admin_delete_slot': lambda m, ids: (f"/admin/slots/{add_delivery_slot(m, ids['list_id'], 5)}/delete", 'GET', {}),
+    'admin_routes': lambda m, ids: ('/admin/routes', 'GET', {}),
+    'admin_geolocations': lambda m, ids: ('/admin/geolocations', 'GET', {}),
+    'admin_stock': lambda m, ids: ('/admin/stock', 'GET', {}),
+    'admin_reports': lambda m, ids: ('/admin/reports', 'GET', {}),
+    'admin_events': lambda m, ids: ('/admin/events', 'GET', {}),
+    'admin_jobs': lambda m, ids: ('/admin/jobs', 'POST', {
+        'data': {'kind': 'orders_export', 'weekly_list_id': str(ids['list_id'])},
+    }),
+    'admin_job_detail': lambda m, ids: (f"/admin/jobs/{finished_job(m, ids['list_id'])}", 'GET', {}),
+    'admin_job_status': lambda m, ids: (f"/admin/jobs/{finished_job(m, ids['list_id'])}/status", 'GET', {}),
+    'admin_job_cancel': lambda m, ids: (f"/admin/jobs/{m.enqueue_job('backfill_customers')}/cancel", 'POST', {}),
+    'admin_job_download': lambda m, ids: (f"/admin/jobs/{finished_job(m, ids['list_id'])}/download", 'GET', {}),
+    'health_check': lambda m, ids: ('/health', 'GET', {}),
+    'readiness_check': lambda m, ids: ('/health/ready', 'GET', {}),
+    'metrics_endpoint': lambda m, ids: ('/metrics', 'GET', {}),
+    'product_image': lambda m, ids: ('/media/products/nao-existe.webp', 'GET', {}),
+    'static': lambda m, ids: ('/static/nao-existe.css', 'GET', {}),
+}
+
+# Arquivos que não existem na base de teste: só a contagem importa
+NOT_FOUND = {'product_image', 'static'}
+
+
+@pytest.fixture
+def ids(app_module, db, active_list):
+    m = app_module
+    slot = m.DeliverySlot.query.filter(
+        m.DeliverySlot.weekly_list_id == active_list.id, m.DeliverySlot.claimed < m.DeliverySlot.capacity - 10
+    ).first()
+    customer = m.Customer.query.order_by(m.Customer.id).first()
+    product = m.db.session.get(
+        m.Product, m.WeeklyProduct.query.filter_by(weekly_list_id=active_list.id, stock=None).first().product_id
+    )
+    return {
+        'list_id': active_list.id,
+        'slot_id': slot.id if slot else add_delivery_slot(m, active_list.id, 1000),
+        'product_id': product.id,
+        'category_id': product.category_id,
+        'order_id': m.Order.query.filter_by(weekly_list_id=active_list.id).first().id,
+        'customer_id': customer.id,
+        'customer_phone': customer.phone,
+    }
+
+
+def test_every_view_has_a_budget(app_module):
+    assert missing_budgets(app_module.app) == []
+
+
+def test_every_budget_has_a_request():
+    assert sorted(ROUTES) == sorted(QUERY_BUDGETS)
+
+
+@pytest.mark.parametrize('endpoint', sorted(QUERY_BUDGETS))
+def test_view_stays_within_query_budget(app_module, admin_client, ids, endpoint):
+    path, method, kwargs = ROUTES[endpoint](app_module, ids)
+    assert app_module.app.url_map.bind('localhost').match(path.split('?', 1)[0], method=method)[0] == endpoint
+    response = assert_route_budget(admin_client, path, method, **kwargs)
+    try:
+        if endpoint in NOT_FOUND:
+            assert response.status_code == 404
+        else:
+            assert response.status_code < 400, response.get_data(as_text=True)[:500]
+    finally:
+        # /admin/events é um stream: fecha sem esperar os eventos
+        response.close()